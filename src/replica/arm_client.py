@@ -0,0 +1,244 @@
+"""
+Minimal in-process Azure Resource Manager REST client.
+
+Keeps a pool of keep-alive HTTP connections and a cached bearer token so
+each read costs one HTTP round trip instead of an `az` process start,
+token acquisition and TLS handshake.
+"""
+import os
+import json
+import time
+import queue
+import threading
+import http.client
+from urllib.parse import urlparse, urlencode
+
+from replica.metrics import get_recorder
+from replica.runner import get_runner
+
+# ARM statuses worth retrying: throttling and transient server errors
+RETRYABLE_STATUSES = {429, 500, 502, 503, 504}
+
+ARM_RESOURCE = "https://management.azure.com/"
+
+
+class ArmError(Exception):
+    """
+    Raised when ARM answers with an error status.
+    """
+
+    def __init__(self, status: int, message: str, retry_after: str = None):
+        super().__init__(f"ARM request failed with status {status}: {message}")
+        self.status = status
+        self.retry_after = retry_after
+
+
+def get_arm_endpoint() -> str:
+    """
+    Returns the ARM endpoint, overridable with REPLICA_ARM_ENDPOINT (e.g. a local fake server).
+    """
+    return os.getenv("REPLICA_ARM_ENDPOINT", "https://management.azure.com").rstrip("/")
+
+
+def get_subscription_id() -> str:
+    """
+    Returns the subscription to query, taken from AZURE_SUBSCRIPTION_ID or the active Azure CLI account.
+    """
+    subscription_id = os.getenv("AZURE_SUBSCRIPTION_ID")
+    if subscription_id:
+        return subscription_id
+
+    result = get_runner().run("az account show --query id --output tsv")
+    if result.returncode != 0:
+        raise RuntimeError(f"Could not determine subscription: {result.stderr.strip()}")
+    return result.stdout.strip()
+
+
+class TokenCache:
+    """
+    Caches the ARM bearer token and refreshes it shortly before it expires.
+    REPLICA_ARM_TOKEN, when set, is used as-is.
+    """
+
+    def __init__(self, refresh_margin: float = 300):
+        self.refresh_margin = refresh_margin
+        self._lock = threading.Lock()
+        self._token = None
+        self._expires = 0.0
+
+    def get(self) -> str:
+        token = os.getenv("REPLICA_ARM_TOKEN")
+        if token:
+            return token
+
+        with self._lock:
+            if self._token is None or time.time() > self._expires - self.refresh_margin:
+                self._token, self._expires = self._acquire()
+            return self._token
+
+    @staticmethod
+    def _acquire():
+        cmd = f"az account get-access-token --resource {ARM_RESOURCE} --output json"
+        result = get_runner().run(cmd)
+        if result.returncode != 0:
+            raise RuntimeError(f"Could not acquire ARM access token: {result.stderr.strip()}")
+
+        token = json.loads(result.stdout)
+        # Older CLI versions only return the local-time expiresOn string
+        expires = float(token.get("expires_on") or time.time() + 3000)
+        return token["accessToken"], expires
+
+
+class ArmClient:
+    """
+    Thread-safe ARM client backed by a pool of persistent HTTP connections.
+    """
+
+    def __init__(self, endpoint: str = None, tokens: TokenCache = None, pool_size: int = 16, timeout: float = 60):
+        parsed = urlparse(endpoint or get_arm_endpoint())
+        self.scheme = parsed.scheme
+        self.host = parsed.hostname
+        self.port = parsed.port
+        self.base_path = parsed.path.rstrip("/")
+        self.tokens = tokens or TokenCache()
+        self.timeout = timeout
+        self.connections_opened = 0
+        self._pool = queue.LifoQueue(maxsize=pool_size)
+        self._latency = get_recorder("rest")
+
+    def _acquire(self):
+        try:
+            return self._pool.get_nowait()
+        except queue.Empty:
+            self.connections_opened += 1
+            if self.scheme == "https":
+                return http.client.HTTPSConnection(self.host, self.port, timeout=self.timeout)
+            return http.client.HTTPConnection(self.host, self.port, timeout=self.timeout)
+
+    def _release(self, conn):
+        try:
+            self._pool.put_nowait(conn)
+        except queue.Full:
+            conn.close()
+
+    def request(self, method: str, path: str, body: dict = None, api_version: str = None, params: dict = None):
+        """
+        Sends one request and returns the decoded JSON body.
+        `path` may be an ARM path or an absolute nextLink URL.
+        Throttled (429) and transient 5xx answers, and connections dropped on the fresh
+        connection too, are retried with the shared runner's backoff.
+        """
+        parsed = urlparse(path)
+        extra = dict(params or {})
+        if api_version:
+            extra["api-version"] = api_version
+        # nextLink query strings are already encoded and are kept verbatim
+        query = "&".join(part for part in (parsed.query, urlencode(extra, safe="$,/")) if part)
+        url = f"{self.base_path}{parsed.path}" + (f"?{query}" if query else "")
+
+        payload = json.dumps(body).encode() if body is not None else None
+        runner = get_runner()
+        runner.count(calls=1)
+
+        attempt = 0
+        while True:
+            runner.count(attempts=1)
+            try:
+                return self._send(method, url, payload)
+            except ArmError as e:
+                if e.status not in RETRYABLE_STATUSES or attempt >= runner.max_retries:
+                    runner.count(failures=1)
+                    raise
+                if e.status == 429:
+                    runner.count(throttled=1)
+                hint = f"Retry-After: {e.retry_after}" if e.retry_after else ""
+            except (http.client.HTTPException, OSError):
+                if attempt >= runner.max_retries:
+                    runner.count(failures=1)
+                    raise
+                hint = ""
+            runner.count(retries=1)
+            time.sleep(runner.backoff_delay(attempt, hint))
+            attempt += 1
+
+    def _send(self, method: str, url: str, payload: bytes):
+        # Token first: acquiring it may run `az`, which needs its own slot of the budget
+        headers = {
+            "Authorization": f"Bearer {self.tokens.get()}",
+            "Content-Type": "application/json",
+            "Connection": "keep-alive",
+        }
+
+        start = time.perf_counter()
+        runner = get_runner()
+        with runner.budget(), runner.shared_slot("az"):
+            # A pooled connection may have been closed by the server; retry once on a fresh one
+            for attempt in range(2):
+                conn = self._acquire()
+                try:
+                    conn.request(method, url, body=payload, headers=headers)
+                    response = conn.getresponse()
+                    data = response.read()
+                except (http.client.HTTPException, OSError):
+                    conn.close()
+                    if attempt:
+                        raise
+                    continue
+
+                if response.will_close:
+                    conn.close()
+                else:
+                    self._release(conn)
+                break
+
+        self._latency.record(time.perf_counter() - start)
+        runner.count(bytes=len(data))
+
+        decoded = json.loads(data) if data else {}
+        if response.status >= 400:
+            error = decoded.get("error", {}) if isinstance(decoded, dict) else {}
+            raise ArmError(
+                response.status,
+                error.get("message") or data.decode(errors="replace")[:500],
+                retry_after=response.getheader("Retry-After")
+            )
+        return decoded
+
+    def get(self, path: str, api_version: str = None, params: dict = None):
+        return self.request("GET", path, api_version=api_version, params=params)
+
+    def post(self, path: str, body: dict = None, api_version: str = None):
+        return self.request("POST", path, body=body, api_version=api_version)
+
+    def list(self, path: str, api_version: str, params: dict = None) -> list:
+        """
+        Reads a collection, following nextLink until the last page.
+        """
+        page = self.get(path, api_version=api_version, params=params)
+        items = list(page.get("value", []))
+        while page.get("nextLink"):
+            page = self.get(page["nextLink"])
+            items.extend(page.get("value", []))
+        return items
+
+    def close(self):
+        while True:
+            try:
+                self._pool.get_nowait().close()
+            except queue.Empty:
+                return
+
+
+_client = None
+_client_lock = threading.Lock()
+
+
+def get_arm_client() -> ArmClient:
+    """
+    Returns the process-wide ARM client so every caller shares one connection pool and token.
+    """
+    global _client
+    with _client_lock:
+        if _client is None:
+            _client = ArmClient()
+        return _client
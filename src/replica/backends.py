@@ -0,0 +1,185 @@
+"""
+Discovery backends: how resource and network reads reach Azure.
+
+- "cli" shells out to the `az` CLI (one process per call)
+- "rest" calls ARM directly through the pooled in-process ArmClient
+
+Both return data in the shape the `az` CLI prints, so the discovery tools do
+not depend on which backend is selected with REPLICA_DISCOVERY_BACKEND.
+"""
+import os
+import json
+import threading
+
+from replica.arm_client import get_arm_client, get_subscription_id
+from replica.runner import get_runner
+
+RESOURCES_API_VERSION = "2021-04-01"
+NETWORK_API_VERSION = "2023-09-01"
+
+# Network listing kind -> (az CLI group, ARM resource type)
+NETWORK_KINDS = {
+    "vnets": ("network vnet", "Microsoft.Network/virtualNetworks"),
+    "nsgs": ("network nsg", "Microsoft.Network/networkSecurityGroups"),
+    "public_ips": ("network public-ip", "Microsoft.Network/publicIPAddresses"),
+    "network_interfaces": ("network nic", "Microsoft.Network/networkInterfaces"),
+    "load_balancers": ("network lb", "Microsoft.Network/loadBalancers"),
+    "application_gateways": ("network application-gateway", "Microsoft.Network/applicationGateways"),
+}
+
+# Child listing kind -> (az CLI command template, ARM child collection)
+NETWORK_CHILD_KINDS = {
+    "subnets": ("az network vnet subnet list --resource-group {resource_group} --vnet-name {name} --output json", "subnets"),
+    "rules": ("az network nsg rule list --resource-group {resource_group} --nsg-name {name} --output json", "securityRules"),
+}
+
+
+class AzCommandError(Exception):
+    """
+    Raised when an `az` command exits with a non-zero code or returns invalid JSON.
+    """
+
+
+def run_az_json(cmd: str):
+    """
+    Runs an `az` command through the shared runner and returns its parsed JSON output.
+    """
+    result = get_runner().run(cmd)
+
+    if result.returncode != 0:
+        raise AzCommandError(result.stderr.strip() or f"az exited with code {result.returncode}")
+    try:
+        return json.loads(result.stdout) if result.stdout.strip() else None
+    except ValueError as e:
+        raise AzCommandError(f"Invalid JSON from az: {e}")
+
+
+def _flatten(value):
+    """
+    Merges nested `properties` objects into their parent, as the `az network` commands print them.
+    """
+    if isinstance(value, list):
+        return [_flatten(item) for item in value]
+    if not isinstance(value, dict):
+        return value
+
+    flat = {key: _flatten(item) for key, item in value.items() if key != "properties"}
+    if isinstance(value.get("properties"), dict):
+        for key, item in value["properties"].items():
+            flat.setdefault(key, _flatten(item))
+    elif "properties" in value:
+        flat["properties"] = value["properties"]
+    return flat
+
+
+class CliBackend:
+    """
+    Reads Azure through the `az` CLI.
+    """
+
+    name = "cli"
+
+    def list_resources(self, resource_group: str) -> list:
+        return run_az_json(f"az resource list --resource-group {resource_group} --output json")
+
+    def show_resource(self, resource_id: str) -> dict:
+        return run_az_json(f"az resource show --ids {resource_id} --output json")
+
+    def show_resources(self, resource_ids: list) -> list:
+        details = run_az_json(f"az resource show --ids {' '.join(resource_ids)} --output json")
+        # A single ID yields an object, several IDs yield a list
+        return [details] if isinstance(details, dict) else details or []
+
+    def list_network(self, resource_group: str, kind: str) -> list:
+        group, _ = NETWORK_KINDS[kind]
+        return run_az_json(f"az {group} list --resource-group {resource_group} --output json")
+
+    def list_network_children(self, resource_group: str, kind: str, parent: dict) -> list:
+        template, _ = NETWORK_CHILD_KINDS[kind]
+        return run_az_json(template.format(resource_group=resource_group, name=parent['name']))
+
+
+class RestBackend:
+    """
+    Reads Azure through the ARM REST API with a pooled keep-alive session.
+    """
+
+    name = "rest"
+
+    def __init__(self, client=None):
+        self.client = client or get_arm_client()
+        self._subscription = None
+        self._api_versions = {}
+        self._lock = threading.Lock()
+
+    @property
+    def subscription(self) -> str:
+        if self._subscription is None:
+            self._subscription = get_subscription_id()
+        return self._subscription
+
+    def api_version_for(self, resource_id: str) -> str:
+        """
+        Returns the newest stable API version of the resource's type, read once per provider namespace.
+        """
+        parts = resource_id.strip("/").split("/")
+        index = [p.lower() for p in parts].index("providers")
+        namespace = parts[index + 1]
+        # Type segments alternate with names: providers/<ns>/<type>/<name>/<child type>/<child name>
+        resource_type = "/".join(parts[index + 2::2]).lower()
+
+        with self._lock:
+            versions = self._api_versions.get(namespace.lower())
+        if versions is None:
+            provider = self.client.get(f"/subscriptions/{self.subscription}/providers/{namespace}", api_version=RESOURCES_API_VERSION)
+            versions = {
+                t["resourceType"].lower(): t.get("apiVersions", [])
+                for t in provider.get("resourceTypes", [])
+            }
+            with self._lock:
+                self._api_versions[namespace.lower()] = versions
+
+        candidates = versions.get(resource_type, [])
+        stable = [v for v in candidates if "preview" not in v.lower()]
+        if not (stable or candidates):
+            raise ValueError(f"No API version known for {namespace}/{resource_type}")
+        return (stable or candidates)[0]
+
+    def list_resources(self, resource_group: str) -> list:
+        return self.client.list(
+            f"/subscriptions/{self.subscription}/resourceGroups/{resource_group}/resources",
+            RESOURCES_API_VERSION,
+            params={"$expand": "createdTime,changedTime,provisioningState"}
+        )
+
+    def show_resource(self, resource_id: str) -> dict:
+        return self.client.get(resource_id, api_version=self.api_version_for(resource_id))
+
+    def show_resources(self, resource_ids: list) -> list:
+        # Requests share pooled connections, so sequential GETs are cheap
+        return [self.show_resource(resource_id) for resource_id in resource_ids]
+
+    def list_network(self, resource_group: str, kind: str) -> list:
+        _, resource_type = NETWORK_KINDS[kind]
+        items = self.client.list(
+            f"/subscriptions/{self.subscription}/resourceGroups/{resource_group}/providers/{resource_type}",
+            NETWORK_API_VERSION
+        )
+        return [dict(_flatten(item), resourceGroup=resource_group) for item in items]
+
+    def list_network_children(self, resource_group: str, kind: str, parent: dict) -> list:
+        _, collection = NETWORK_CHILD_KINDS[kind]
+        items = self.client.list(f"{parent['id']}/{collection}", NETWORK_API_VERSION)
+        return [dict(_flatten(item), resourceGroup=resource_group) for item in items]
+
+
+def make_backend(name: str = None):
+    """
+    Returns the backend selected by name or REPLICA_DISCOVERY_BACKEND ("cli" or "rest").
+    """
+    name = (name or os.getenv("REPLICA_DISCOVERY_BACKEND", "cli")).lower()
+    if name == "rest":
+        return RestBackend()
+    if name == "cli":
+        return CliBackend()
+    raise ValueError(f"Unknown discovery backend '{name}', expected 'cli' or 'rest'")
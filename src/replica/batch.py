@@ -0,0 +1,214 @@
+"""
+Batch replication of several resource groups.
+
+Jobs run on a pool of worker processes. Each job gets its own working
+directory under REPLICA_BATCH_DIR (terraform/, reports, discovery artifacts
+and run.log), while the discovery cache and the Terraform plugin cache on
+disk are shared by all jobs, and workers keep their ARM token, connections
+and subscription lookup warm between jobs. `az`, LLM and `terraform`
+concurrency is capped across all workers with semaphores shared by the
+processes.
+"""
+import os
+import re
+import sys
+import json
+import time
+import traceback
+import multiprocessing
+from dataclasses import dataclass, asdict
+from datetime import datetime
+from contextlib import redirect_stdout, redirect_stderr
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from replica.cache import configure_cache, DEFAULT_CACHE_DIR, MODE_ENABLED
+from replica.compaction import reset_compaction_stats
+from replica.fetcher import reset_fetcher
+from replica.llm_cache import configure_completion_cache
+from replica.metrics import reset_metrics
+from replica.usage import reset_usage
+from replica.runner import get_runner
+from replica.terraform import configure_terraform_environment
+
+
+@dataclass
+class BatchJob:
+    """
+    One resource group to replicate, with the inputs `replica` otherwise takes from argv.
+    """
+    resource_group: str
+    name_prefix: str = "replica"
+    target_environment: str = "dev"
+
+
+def parse_job(spec: str) -> BatchJob:
+    """
+    Parses "rg", "rg:prefix:env" or a line of a groups file ("rg prefix env", comma or space separated).
+    """
+    parts = [p for p in re.split(r"[\s,:]+", spec.strip()) if p]
+    if not parts:
+        raise ValueError("empty job specification")
+    return BatchJob(*parts[:3])
+
+
+def load_jobs(args: list) -> list:
+    """
+    Builds the job list from arguments that are either job specifications or files.
+    Files hold one job per line (blank lines and # comments are skipped) or, with a
+    .json extension, a list of {"resource_group", "name_prefix", "target_environment"} objects.
+    """
+    jobs = []
+    for arg in args:
+        if not os.path.isfile(arg):
+            jobs.append(parse_job(arg))
+            continue
+
+        with open(arg) as f:
+            if arg.endswith(".json"):
+                for item in json.load(f):
+                    jobs.append(BatchJob(**item) if isinstance(item, dict) else parse_job(item))
+            else:
+                for line in f:
+                    line = line.split("#", 1)[0]
+                    if line.strip():
+                        jobs.append(parse_job(line))
+    return jobs
+
+
+def job_directory(root: str, job: BatchJob) -> str:
+    # The environment is part of the key, so the same group and prefix for dev and prod keep separate state
+    safe_name = re.sub(r"[^A-Za-z0-9._-]", "_", f"{job.resource_group}-{job.name_prefix}-{job.target_environment}")
+    return os.path.join(root, safe_name)
+
+
+def _init_worker(limits: dict):
+    """
+    Installs the cross-process limits in the worker's runner.
+    """
+    runner = get_runner()
+    for program, semaphore in limits.items():
+        runner.set_shared_limit(program, semaphore)
+
+
+def run_job(job: BatchJob, root: str, cache_mode: str) -> dict:
+    """
+    Runs the crew for one job inside its own directory and returns its outcome.
+    Console output of the crew goes to run.log in that directory.
+    """
+    from replica.crew import Replica
+    from replica.main import report_run_statistics
+
+    workdir = os.path.abspath(job_directory(root, job))
+    os.makedirs(workdir, exist_ok=True)
+    os.chdir(workdir)
+
+    # Per-job counters; caches, connections and tokens stay warm
+    reset_fetcher()
+    reset_metrics()
+    reset_compaction_stats()
+    reset_usage()
+    get_runner().reset_stats()
+    configure_cache(cache_mode)
+    configure_completion_cache()
+
+    inputs = {
+        'resource_group': job.resource_group,
+        'name_prefix': job.name_prefix,
+        'target_environment': job.target_environment,
+        'current_year': str(datetime.now().year)
+    }
+
+    start = time.perf_counter()
+    status, error = "succeeded", None
+    with open("run.log", "w") as log, redirect_stdout(log), redirect_stderr(log):
+        try:
+            replica_crew = Replica().crew()
+            replica_crew.kickoff(inputs=inputs)
+            report_run_statistics(crew=replica_crew)
+        except Exception as e:
+            status, error = "failed", str(e)
+            traceback.print_exc()
+
+    return dict(
+        asdict(job),
+        status=status,
+        error=error,
+        seconds=round(time.perf_counter() - start, 1),
+        workdir=workdir,
+        runner=get_runner().summary()
+    )
+
+
+def run_batch(jobs: list, workers: int = None, root: str = None, cache_mode: str = MODE_ENABLED) -> list:
+    """
+    Runs every job on a process pool and returns the outcomes in job order.
+    """
+    workers = workers or int(os.getenv("REPLICA_BATCH_WORKERS", "4"))
+    root = os.path.abspath(root or os.getenv("REPLICA_BATCH_DIR", "batch_runs"))
+    os.makedirs(root, exist_ok=True)
+
+    # Workers change directory, so shared caches must be given as absolute paths
+    cache_dir = os.path.abspath(os.getenv("REPLICA_CACHE_DIR", DEFAULT_CACHE_DIR))
+    os.environ["REPLICA_CACHE_DIR"] = cache_dir
+    configure_terraform_environment()
+
+    # spawn avoids forking a process that already runs threads
+    context = multiprocessing.get_context("spawn")
+    limits = {
+        "az": context.BoundedSemaphore(int(os.getenv("REPLICA_BATCH_MAX_AZ", "16"))),
+        "llm": context.BoundedSemaphore(int(os.getenv("REPLICA_BATCH_MAX_LLM", "4"))),
+        "terraform": context.BoundedSemaphore(int(os.getenv("REPLICA_BATCH_MAX_TERRAFORM", "2"))),
+    }
+
+    for job in jobs:
+        # Directories of earlier batches were keyed without the environment; their state is not guessed at
+        legacy = os.path.join(root, re.sub(r"[^A-Za-z0-9._-]", "_", f"{job.resource_group}-{job.name_prefix}"))
+        if os.path.isdir(legacy) and not os.path.isdir(job_directory(root, job)):
+            print(f"Warning: {legacy} was written before job directories included the environment; move it to "
+                  f"{job_directory(root, job)} if it holds the {job.target_environment} state", file=sys.stderr)
+
+    results = {}
+    with ProcessPoolExecutor(
+        max_workers=max(1, min(workers, len(jobs) or 1)),
+        mp_context=context,
+        initializer=_init_worker,
+        initargs=(limits,)
+    ) as executor:
+        futures = {executor.submit(run_job, job, root, cache_mode): index for index, job in enumerate(jobs)}
+        for done, future in enumerate(as_completed(futures), 1):
+            index = futures[future]
+            job = jobs[index]
+            try:
+                result = future.result()
+            except Exception as e:
+                # The worker itself died; the job never reported back
+                result = dict(asdict(job), status="failed", error=str(e), seconds=None,
+                              workdir=job_directory(root, job), runner={})
+            results[index] = result
+            print(f"[{done}/{len(jobs)}] {job.resource_group} ({job.name_prefix}, {job.target_environment}): "
+                  f"{result['status']} in {result['seconds']}s", file=sys.stderr)
+
+    return [results[index] for index in range(len(jobs))]
+
+
+def summary_table(results: list) -> list:
+    """
+    Formats the outcomes as a Markdown table, one row per resource group.
+    """
+    lines = [
+        "| Resource Group | Prefix | Environment | Status | Duration (s) | Commands | Retries | Directory |",
+        "|---|---|---|---|---|---|---|---|",
+    ]
+    for result in results:
+        runner = result.get("runner") or {}
+        status = result["status"] if not result.get("error") else f"{result['status']}: {result['error'][:80]}"
+        lines.append(
+            f"| {result['resource_group']} | {result['name_prefix']} | {result['target_environment']} "
+            f"| {status.replace('|', '/')} | {result['seconds']} | {runner.get('calls', '-')} "
+            f"| {runner.get('retries', '-')} | {result['workdir']} |"
+        )
+    succeeded = sum(1 for result in results if result["status"] == "succeeded")
+    total = sum(result["seconds"] or 0 for result in results)
+    lines.append("")
+    lines.append(f"{succeeded} of {len(results)} groups succeeded; {round(total, 1)}s of job time in total.")
+    return lines
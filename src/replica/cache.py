@@ -0,0 +1,164 @@
+"""
+Persistent on-disk cache for discovery results.
+
+Entries live in a SQLite database under REPLICA_CACHE_DIR and are keyed on
+subscription, resource group, command and arguments. Each entry has its own
+TTL, and the database is trimmed back under REPLICA_CACHE_MAX_BYTES by
+evicting the least recently used entries.
+"""
+import os
+import json
+import time
+import zlib
+import sqlite3
+import hashlib
+import threading
+
+DEFAULT_CACHE_DIR = os.path.join(os.path.expanduser("~"), ".cache", "replica")
+
+# Cache modes selected from the command line
+MODE_ENABLED = "enabled"    # read and write
+MODE_REFRESH = "refresh"    # ignore existing entries, write fresh results
+MODE_DISABLED = "disabled"  # neither read nor write
+
+
+class DiscoveryCache:
+    """
+    SQLite-backed key/value cache with per-entry TTL and size-based LRU eviction.
+    """
+
+    def __init__(self, path: str, default_ttl: float = 3600, max_bytes: int = 256 * 1024 * 1024, mode: str = MODE_ENABLED):
+        self.path = path
+        self.default_ttl = default_ttl
+        self.max_bytes = max_bytes
+        self.mode = mode
+        self.stats = {"hits": 0, "misses": 0, "expired": 0, "writes": 0, "evictions": 0}
+        self._lock = threading.Lock()
+
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        with self._connect() as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS entries ("
+                " key TEXT PRIMARY KEY,"
+                " subscription TEXT, resource_group TEXT, command TEXT,"
+                " value BLOB NOT NULL, size INTEGER NOT NULL,"
+                " created REAL NOT NULL, expires REAL NOT NULL, accessed REAL NOT NULL)"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS entries_accessed ON entries (accessed)")
+
+    def _connect(self):
+        return sqlite3.connect(self.path, timeout=30)
+
+    @staticmethod
+    def make_key(subscription: str, resource_group: str, command: str, args=None) -> str:
+        """
+        Builds a stable key from the request identity; argument order does not matter.
+        """
+        identity = json.dumps(
+            [subscription or "", (resource_group or "").lower(), command, args or {}],
+            sort_keys=True
+        )
+        return hashlib.sha256(identity.encode()).hexdigest()
+
+    def get(self, subscription: str, resource_group: str, command: str, args=None):
+        """
+        Returns the cached value, or None on a miss, an expired entry or when reads are disabled.
+        """
+        if self.mode != MODE_ENABLED:
+            return None
+
+        key = self.make_key(subscription, resource_group, command, args)
+        now = time.time()
+        with self._lock, self._connect() as conn:
+            row = conn.execute("SELECT value, expires FROM entries WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                self.stats["misses"] += 1
+                return None
+            if row[1] < now:
+                conn.execute("DELETE FROM entries WHERE key = ?", (key,))
+                self.stats["expired"] += 1
+                self.stats["misses"] += 1
+                return None
+            conn.execute("UPDATE entries SET accessed = ? WHERE key = ?", (now, key))
+            self.stats["hits"] += 1
+
+        return json.loads(zlib.decompress(row[0]))
+
+    def set(self, subscription: str, resource_group: str, command: str, args, value, ttl: float = None):
+        """
+        Stores a JSON-serialisable value and evicts old entries if the cache grew past max_bytes.
+        """
+        if self.mode == MODE_DISABLED:
+            return
+
+        key = self.make_key(subscription, resource_group, command, args)
+        blob = zlib.compress(json.dumps(value).encode())
+        now = time.time()
+        expires = now + (self.default_ttl if ttl is None else ttl)
+
+        with self._lock, self._connect() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO entries"
+                " (key, subscription, resource_group, command, value, size, created, expires, accessed)"
+                " VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (key, subscription, (resource_group or "").lower(), command, blob, len(blob), now, expires, now)
+            )
+            self.stats["writes"] += 1
+            self._evict(conn)
+
+    def _evict(self, conn):
+        """
+        Drops expired entries, then least recently used ones until the total size fits max_bytes.
+        """
+        conn.execute("DELETE FROM entries WHERE expires < ?", (time.time(),))
+        total = conn.execute("SELECT COALESCE(SUM(size), 0) FROM entries").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+
+        for key, size in conn.execute("SELECT key, size FROM entries ORDER BY accessed ASC").fetchall():
+            if total <= self.max_bytes:
+                break
+            conn.execute("DELETE FROM entries WHERE key = ?", (key,))
+            total -= size
+            self.stats["evictions"] += 1
+
+    def clear(self):
+        with self._lock, self._connect() as conn:
+            conn.execute("DELETE FROM entries")
+
+    def summary(self) -> dict:
+        """
+        Returns hit/miss counters together with the hit rate.
+        """
+        lookups = self.stats["hits"] + self.stats["misses"]
+        summary = dict(self.stats)
+        summary["mode"] = self.mode
+        summary["hit_rate"] = round(self.stats["hits"] / lookups * 100, 1) if lookups else 0.0
+        return summary
+
+
+_cache = None
+
+
+def configure_cache(mode: str = MODE_ENABLED) -> DiscoveryCache:
+    """
+    Creates the process-wide discovery cache using the REPLICA_CACHE_* environment settings.
+    """
+    global _cache
+    cache_dir = os.getenv("REPLICA_CACHE_DIR", DEFAULT_CACHE_DIR)
+    _cache = DiscoveryCache(
+        os.path.join(cache_dir, "discovery.sqlite3"),
+        default_ttl=float(os.getenv("REPLICA_CACHE_TTL", "3600")),
+        max_bytes=int(os.getenv("REPLICA_CACHE_MAX_BYTES", str(256 * 1024 * 1024))),
+        mode=mode
+    )
+    return _cache
+
+
+def get_cache() -> DiscoveryCache:
+    """
+    Returns the process-wide discovery cache, creating it with defaults on first use.
+    """
+    if _cache is None:
+        return configure_cache()
+    return _cache
@@ -0,0 +1,318 @@
+"""
+Compaction of discovery tool output before it is handed to the LLM.
+
+Raw ARM payloads carry etags, provisioning states, timestamps, long resource
+IDs and the same sub-objects several times (a VNet's subnets are also listed
+on their own). Compaction:
+
+- drops noise fields, globally and per resource type (denylist or allowlist)
+- drops null and empty values and shortens IDs of the target resource group
+- replaces repeated objects with the same ID by a {"$ref": id} reference
+- minifies the JSON
+- keeps the result within a token budget; the full compacted output is then
+  written to a side file and deeper parts are replaced by {"$detail": pointer}
+  entries the agents can read back with the Discovery Detail Reader tool
+"""
+import os
+import re
+import json
+import threading
+
+from replica.streaming import read_record
+
+# Tools whose spilled output the Discovery Detail Reader may read back
+DISCOVERY_TOOLS = ("azure_resource_scanner", "azure_network_analyzer", "azure_dependencies_mapper")
+
+# Fields dropped from every object
+DEFAULT_DENY_FIELDS = {
+    "etag", "provisioningState", "resourceGuid", "createdTime", "changedTime", "systemData",
+    "lastModifiedTime", "lastModifiedTimeUtc", "creationTime", "timeCreated", "createdAt",
+    "inProgressOperationId",
+}
+
+# Resource type (lower-case) -> extra fields dropped anywhere inside resources of that type
+TYPE_DENY_FIELDS = {
+    "microsoft.web/sites": {
+        "hostNameSslStates", "outboundIpAddresses", "possibleOutboundIpAddresses", "usageState",
+        "availabilityState", "enabledHostNames", "trafficManagerHostNames", "slotSwapStatus",
+    },
+    "microsoft.storage/storageaccounts": {
+        "primaryEndpoints", "secondaryEndpoints", "statusOfPrimary", "statusOfSecondary", "keyCreationTime",
+    },
+    "microsoft.compute/virtualmachines": {"instanceView", "vmId"},
+    "microsoft.network/networkinterfaces": {"macAddress"},
+    "microsoft.documentdb/databaseaccounts": {"instanceId", "documentEndpoint", "readLocations", "writeLocations"},
+}
+
+# Resource type (lower-case) -> only these top-level fields are kept (empty by default)
+TYPE_ALLOW_FIELDS = {}
+
+# Rough characters-per-token ratio of JSON for the gpt-4o tokenizer
+CHARS_PER_TOKEN = 4
+
+_stats_lock = threading.Lock()
+_stats = {}
+
+
+def compaction_enabled() -> bool:
+    return os.getenv("REPLICA_DISCOVERY_COMPACTION", "1") != "0"
+
+
+def get_token_budget() -> int:
+    """
+    Returns the per-tool token budget from REPLICA_DISCOVERY_TOKEN_BUDGET (0 disables the budget).
+    """
+    return int(os.getenv("REPLICA_DISCOVERY_TOKEN_BUDGET", "12000"))
+
+
+def get_detail_dir() -> str:
+    return os.getenv("REPLICA_DISCOVERY_DETAIL_DIR", "discovery")
+
+
+def estimate_tokens(text: str) -> int:
+    return -(-len(text) // CHARS_PER_TOKEN)
+
+
+def minify(value) -> str:
+    return json.dumps(value, separators=(",", ":"), default=str)
+
+
+def load_rules():
+    """
+    Returns (deny fields, per-type deny fields, per-type allow fields), extended by
+    REPLICA_COMPACT_DENY (comma-separated field names) and REPLICA_COMPACT_RULES,
+    a JSON file of {"<resource type>": {"deny": [...]} or {"allow": [...]}}.
+    """
+    deny = set(DEFAULT_DENY_FIELDS)
+    deny.update(f.strip() for f in os.getenv("REPLICA_COMPACT_DENY", "").split(",") if f.strip())
+    type_deny = {t: set(fields) for t, fields in TYPE_DENY_FIELDS.items()}
+    type_allow = {t: set(fields) for t, fields in TYPE_ALLOW_FIELDS.items()}
+
+    rules_path = os.getenv("REPLICA_COMPACT_RULES")
+    if rules_path:
+        with open(rules_path) as f:
+            for resource_type, rule in json.load(f).items():
+                if "allow" in rule:
+                    type_allow[resource_type.lower()] = set(rule["allow"])
+                if "deny" in rule:
+                    type_deny.setdefault(resource_type.lower(), set()).update(rule["deny"])
+    return deny, type_deny, type_allow
+
+
+def _resource_type(value: dict):
+    resource_type = value.get("type")
+    if isinstance(resource_type, str) and "/" in resource_type:
+        return resource_type.lower()
+    return None
+
+
+class Compactor:
+    """
+    Filters, shortens and deduplicates one discovery payload.
+    """
+
+    def __init__(self, resource_group: str = None):
+        self.deny, self.type_deny, self.type_allow = load_rules()
+        self.id_prefix = None
+        self._prefix_pattern = None
+        if resource_group:
+            self._prefix_pattern = re.compile(
+                r"^/subscriptions/[^/]+/resourceGroups/" + re.escape(resource_group) + r"/providers/",
+                re.IGNORECASE
+            )
+        self._seen = {}
+
+    def _shorten(self, text: str) -> str:
+        if self._prefix_pattern is None or not text.startswith("/subscriptions/"):
+            return text
+        match = self._prefix_pattern.match(text)
+        if not match:
+            return text
+        if self.id_prefix is None:
+            self.id_prefix = match.group(0)
+        return "~/" + text[match.end():]
+
+    def filter(self, value, deny: frozenset = frozenset(), depth: int = 0):
+        """
+        Drops denied, null and empty fields and shortens resource group IDs.
+        Empty values in the first two levels (e.g. an empty "delta"/"added" list) are kept.
+        """
+        if isinstance(value, str):
+            return self._shorten(value)
+        if isinstance(value, list):
+            items = [self.filter(item, deny, depth + 1) for item in value]
+            return [item for item in items if item not in (None, {}, [], "")]
+        if not isinstance(value, dict):
+            return value
+
+        resource_type = _resource_type(value)
+        allow = None
+        if resource_type:
+            deny = deny | self.type_deny.get(resource_type, set())
+            allow = self.type_allow.get(resource_type)
+
+        result = {}
+        for key, item in value.items():
+            if key in self.deny or key in deny:
+                continue
+            if allow is not None and key not in allow and key not in ("id", "name", "type"):
+                continue
+            item = self.filter(item, deny, depth + 1)
+            if item in (None, {}, [], "") and (depth >= 2 or item is None):
+                continue
+            result[key] = item
+        return result
+
+    def dedupe(self, value):
+        """
+        Replaces objects whose ID was already emitted by {"$ref": id} plus the fields that differ.
+        """
+        if isinstance(value, list):
+            return [self.dedupe(item) for item in value]
+        if not isinstance(value, dict):
+            return value
+
+        value = {key: self.dedupe(item) for key, item in value.items()}
+        object_id = value.get("id")
+        if not isinstance(object_id, str) or len(value) < 2:
+            return value
+
+        seen = self._seen.get(object_id.lower())
+        if seen is None:
+            self._seen[object_id.lower()] = value
+            return value
+
+        reference = {"$ref": object_id}
+        reference.update({key: item for key, item in value.items() if key != "id" and seen.get(key) != item})
+        return reference if len(minify(reference)) < len(minify(value)) else value
+
+    def compact(self, value):
+        return self.dedupe(self.filter(value))
+
+
+def resolve_pointer(document, pointer: str):
+    """
+    Returns the part of a JSON document addressed by an RFC 6901 pointer such as "/resources/3/properties".
+    """
+    current = document
+    for token in [t for t in pointer.split("/") if t != ""]:
+        token = token.replace("~1", "/").replace("~0", "~")
+        current = current[int(token)] if isinstance(current, list) else current[token]
+    return current
+
+
+def _escape(token) -> str:
+    return str(token).replace("~", "~0").replace("/", "~1")
+
+
+def prune(value, depth: int, pointer: str = ""):
+    """
+    Keeps `depth` levels of containers; deeper ones become {"$detail": pointer}.
+    """
+    if not isinstance(value, (dict, list)):
+        return value
+    if depth <= 0:
+        return {"$detail": pointer or "/"}
+    if isinstance(value, list):
+        return [prune(item, depth - 1, f"{pointer}/{i}") for i, item in enumerate(value)]
+    return {key: prune(item, depth - 1, f"{pointer}/{_escape(key)}") for key, item in value.items()}
+
+
+def fit_to_budget(value, budget: int, pointer: str = ""):
+    """
+    Returns the deepest pruning of `value` whose minified JSON fits in `budget` tokens.
+    """
+    best = prune(value, 1, pointer)
+    for level in range(2, 32):
+        candidate = prune(value, level, pointer)
+        if estimate_tokens(minify(candidate)) > budget:
+            break
+        best = candidate
+        if candidate == value:
+            break
+    return best
+
+
+def compact_output(tool_name: str, payload, resource_group: str = None) -> str:
+    """
+    Returns the LLM-facing string for a discovery tool result and records the size reduction.
+    """
+    original = json.dumps(payload, indent=2, default=str)
+    if not compaction_enabled():
+        return original
+
+    compactor = Compactor(resource_group)
+    compacted = compactor.compact(payload)
+    text = minify(compacted)
+    budget = get_token_budget()
+
+    meta = {"original_bytes": len(original), "compact_bytes": len(text)}
+    if compactor.id_prefix:
+        meta["id_prefix"] = {"~/": compactor.id_prefix}
+
+    detail_file = None
+    if budget and estimate_tokens(text) > budget:
+        detail_file = os.path.join(get_detail_dir(), f"{tool_name}.json")
+        os.makedirs(get_detail_dir(), exist_ok=True)
+        with open(detail_file, "w") as f:
+            f.write(text)
+        compacted = fit_to_budget(compacted, budget)
+        meta["detail_file"] = detail_file
+        meta["detail_note"] = "entries marked $detail were left out; read them with the Discovery Detail Reader tool"
+
+    output = {"_compaction": meta}
+    output.update(compacted if isinstance(compacted, dict) else {"data": compacted})
+    # Sizes of the final string, measured before they are added to it
+    meta["returned_bytes"] = len(minify(output))
+    meta["estimated_tokens"] = estimate_tokens(minify(output))
+    text = minify(output)
+
+    with _stats_lock:
+        stats = _stats.setdefault(tool_name, {"calls": 0, "original_bytes": 0, "returned_bytes": 0, "spilled": 0})
+        stats["calls"] += 1
+        stats["original_bytes"] += len(original)
+        stats["returned_bytes"] += meta["returned_bytes"]
+        stats["spilled"] += 1 if detail_file else 0
+    return text
+
+
+def read_detail(tool_name: str, pointer: str = "/") -> str:
+    """
+    Returns part of a spilled discovery output, pruned again to the token budget if needed.
+    `tool_name` may also be the path of a streaming NDJSON artifact, where "/resources/<n>" is line n.
+    It comes from the LLM, so only discovery tool names and artifacts inside the detail
+    directory are read; anything else raises ValueError.
+    """
+    if tool_name.endswith(".ndjson"):
+        detail_dir = os.path.realpath(get_detail_dir())
+        path = os.path.realpath(tool_name)
+        if os.path.dirname(path) != detail_dir or not os.path.basename(path).startswith("azure_resource_scanner."):
+            raise ValueError(f"{tool_name} is not a discovery artifact")
+        tokens = [t for t in pointer.split("/") if t != ""]
+        if len(tokens) < 2 or tokens[0] != "resources":
+            raise ValueError("pointer must address one resource, e.g. /resources/0")
+        value = resolve_pointer(read_record(tool_name, int(tokens[1])), "/" + "/".join(tokens[2:]))
+    else:
+        if tool_name not in DISCOVERY_TOOLS:
+            raise ValueError(f"unknown discovery tool {tool_name!r}, use one of {', '.join(DISCOVERY_TOOLS)}")
+        with open(os.path.join(get_detail_dir(), f"{tool_name}.json")) as f:
+            value = resolve_pointer(json.load(f), pointer)
+
+    text = minify(value)
+    budget = get_token_budget()
+    if budget and estimate_tokens(text) > budget:
+        text = minify(fit_to_budget(value, budget, pointer.rstrip("/")))
+    return text
+
+
+def compaction_summary() -> dict:
+    """
+    Returns per-tool before/after sizes of the discovery output.
+    """
+    with _stats_lock:
+        return {tool: dict(stats) for tool, stats in _stats.items()}
+
+
+def reset_compaction_stats():
+    with _stats_lock:
+        _stats.clear()
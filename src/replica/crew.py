@@ -1,11 +1,252 @@
 import os
-from crewai import Agent, Crew, Process, Task, LLM
-from crewai.project import CrewBase, agent, crew, task
+from crewai import Agent, Crew, Process, Task
+from crewai.project import CrewBase, agent, crew, task, before_kickoff
 from crewai.agents.agent_builder.base_agent import BaseAgent
 from typing import List
 from crewai.tools import tool
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+from collections import Counter
+from functools import lru_cache
 import subprocess
+import hashlib
 import json
+from replica import arm_client, resource_graph
+from replica.cache import get_cache
+from replica.compaction import compact_output, read_detail
+from replica.fetcher import get_fetcher
+from replica.llm import ReplicaLLM
+from replica.prompts import stable_agent_config, stable_task_config
+from replica.renderer import discard_render, load_render_report, render_configuration
+from replica.shards import run_shards, sharded_layout
+from replica.tiers import TIERS, TIER_DIR, TierGenerationTask, TierMergeTask, tier_brief
+from replica.validation import ValidationTask, validate_terraform
+from replica.runner import get_runner
+from replica.terraform import (
+    APPLY_PLAN_OPTIONS, PLAN_FILE, STREAMED_COMMANDS, apply_plan, configure_terraform_environment, destroy_guard,
+    ensure_initialized, init as terraform_init, plan as terraform_plan, stream_command, streaming_enabled
+)
+from replica.streaming import NdjsonWriter, artifact_path, iter_ndjson
+
+# Maximum number of `az` processes run at the same time during discovery
+DISCOVERY_CONCURRENCY = int(os.getenv("REPLICA_DISCOVERY_CONCURRENCY", "8"))
+
+# Number of resource IDs passed to a single `az resource show --ids` call (1 disables batching)
+DISCOVERY_BATCH_SIZE = int(os.getenv("REPLICA_DISCOVERY_BATCH_SIZE", "20"))
+
+# Re-hydrate only resources whose changedTime/etag differ from the last snapshot of the group
+INCREMENTAL_DISCOVERY = os.getenv("REPLICA_INCREMENTAL_DISCOVERY", "1") != "0"
+
+# Seconds the per-group snapshot used for incremental discovery is kept
+SNAPSHOT_TTL = float(os.getenv("REPLICA_SNAPSHOT_TTL", str(7 * 24 * 3600)))
+SNAPSHOT_COMMAND = "azure_resource_scanner:snapshot"
+
+# Write scanned resources one per line to an NDJSON artifact instead of returning them inline
+STREAM_DISCOVERY = os.getenv("REPLICA_DISCOVERY_STREAM", "0") == "1"
+
+# Backend used by the dependencies mapper: "cli" (one `az` call per service) or "graph" (Azure Resource Graph)
+DEPENDENCIES_BACKEND = os.getenv("REPLICA_DEPENDENCIES_BACKEND", "cli").lower()
+
+
+@lru_cache(maxsize=1)
+def _current_subscription() -> str:
+    """
+    Returns the active subscription ID used to key cached discovery results.
+    """
+    try:
+        return arm_client.get_subscription_id()
+    except Exception:
+        return ""
+
+
+def _change_fingerprint(resource: dict):
+    """
+    Returns the change marker of a listed resource, or None when the listing carries neither changedTime nor etag.
+    """
+    changed_time = resource.get('changedTime')
+    etag = resource.get('etag')
+    if not changed_time and not etag:
+        return None
+    return f"{changed_time or ''}|{etag or ''}"
+
+
+def _record_digest(record: dict) -> str:
+    """
+    Content hash of a scanner record, to tell a re-read resource without a change marker from a changed one.
+    """
+    return hashlib.sha256(json.dumps(record, sort_keys=True, default=str).encode()).hexdigest()
+
+
+def _resource_record(resource: dict, detail: dict) -> dict:
+    """
+    Builds the scanner output record from a listed resource and its full definition.
+    """
+    return {
+        'name': resource['name'],
+        'type': resource['type'],
+        'id': resource['id'],
+        'location': resource.get('location', ''),
+        'properties': detail.get('properties', {}),
+        'sku': detail.get('sku', {}),
+        'kind': detail.get('kind'),
+        'managedBy': detail.get('managedBy'),
+        'zones': detail.get('zones', []),
+        'identity': detail.get('identity'),
+        'tags': detail.get('tags', {}),
+        'dependencies': detail.get('dependsOn', [])
+    }
+
+
+def _write_artifact(resource_group: str, records: list):
+    """
+    Writes the scanned records to the group's NDJSON artifact, which the template renderer reads.
+    """
+    with NdjsonWriter(artifact_path(resource_group)) as writer:
+        for record in records:
+            writer.write(record)
+
+
+def _hydrate_resource(resource: dict) -> dict:
+    """
+    Fetches the full definition of one resource returned by `az resource list`.
+    Failures are recorded on the returned record instead of being dropped.
+    """
+    try:
+        return _resource_record(resource, get_fetcher().get_resource(resource['id']))
+    except Exception as e:
+        return {
+            'name': resource['name'],
+            'type': resource['type'],
+            'id': resource['id'],
+            'location': resource.get('location', ''),
+            'error': str(e)
+        }
+
+
+def _hydrate_batch(batch: list) -> list:
+    """
+    Fetches a chunk of resources with a single `az resource show --ids` call and
+    splits the combined result back into per-resource records. Resources the
+    batched call did not return fall back to one call per resource.
+    """
+    if len(batch) == 1:
+        return [_hydrate_resource(batch[0])]
+
+    details = get_fetcher().get_resources([resource['id'] for resource in batch])
+
+    records = []
+    for resource in batch:
+        detail = details.get(resource['id'].lower())
+        if detail is None or isinstance(detail, Exception):
+            records.append(_hydrate_resource(resource))
+        else:
+            records.append(_resource_record(resource, detail))
+    return records
+
+
+def _stream_resources(resource_group: str, resources: list, previous: dict, to_hydrate: list) -> tuple:
+    """
+    Streaming variant of the scanner: every record is written to the group's NDJSON
+    artifact as soon as it is available and only a one-line summary per resource is
+    kept in memory. Unchanged records are copied from the previous snapshot or
+    artifact; at most twice DISCOVERY_CONCURRENCY batches are in flight at a time.
+    Returns (summary, snapshot entries).
+    """
+    path = artifact_path(resource_group)
+    listed = {resource['id'].lower(): resource for resource in resources}
+    index = []
+    errors = []
+    current = {}
+
+    hydrate_keys = {resource['id'].lower() for resource in to_hydrate}
+    # Re-read resources that did not change, or could not be read; neither counts as a change
+    not_changed = set()
+
+    def emit(writer, record):
+        key = record['id'].lower()
+        resource = listed[key]
+        line = writer.write(record)
+        index.append({'name': record['name'], 'type': record['type'], 'location': record.get('location', ''), '$detail': f"/resources/{line}"})
+        if 'error' in record:
+            errors.append({'name': record['name'], 'error': record['error']})
+            # The resource still exists; keep its last good entry so it is not reported as added next run
+            if key in previous:
+                current[key] = previous[key]
+                not_changed.add(key)
+            return
+        digest = _record_digest(record)
+        if key in previous and previous[key].get('digest') == digest:
+            not_changed.add(key)
+        current[key] = {
+            'fingerprint': _change_fingerprint(resource),
+            'digest': digest,
+            'name': record['name'],
+            'type': record['type'],
+            'id': record['id']
+        }
+
+    unchanged = {key for key in listed if key in previous and key not in hydrate_keys}
+
+    with NdjsonWriter(path) as writer:
+        copied = set()
+        for key in unchanged:
+            if 'record' in previous[key]:
+                emit(writer, previous[key]['record'])
+                copied.add(key)
+        if unchanged - copied and os.path.exists(path):
+            for record in iter_ndjson(path):
+                key = record['id'].lower()
+                if key in unchanged and key not in copied:
+                    emit(writer, record)
+                    copied.add(key)
+        # Unchanged resources missing from the previous artifact are fetched again
+        pending_resources = to_hydrate + [listed[key] for key in unchanged - copied]
+
+        batch_size = max(1, DISCOVERY_BATCH_SIZE)
+        workers = max(1, DISCOVERY_CONCURRENCY)
+        fetcher = get_fetcher()
+
+        def drain(futures):
+            for future in futures:
+                records = future.result()
+                for record in records:
+                    emit(writer, record)
+                fetcher.release_resources([record['id'] for record in records])
+
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            in_flight = set()
+            for start in range(0, len(pending_resources), batch_size):
+                in_flight.add(executor.submit(_hydrate_batch, pending_resources[start:start + batch_size]))
+                if len(in_flight) >= 2 * workers:
+                    done, in_flight = wait(in_flight, return_when=FIRST_COMPLETED)
+                    drain(done)
+            drain(in_flight)
+
+    delta = {'baseline': not previous, 'added': [], 'changed': [], 'deleted': [], 'unchanged': len(unchanged)}
+    if previous:
+        for resource in to_hydrate:
+            key = resource['id'].lower()
+            summary = {'name': resource['name'], 'type': resource['type'], 'id': resource['id']}
+            if key not in previous:
+                delta['added'].append(summary)
+            elif key in not_changed:
+                delta['unchanged'] += 1
+            else:
+                delta['changed'].append(summary)
+        for key, entry in previous.items():
+            if key not in listed:
+                entry = entry.get('record', entry)
+                delta['deleted'].append({'name': entry.get('name'), 'type': entry.get('type'), 'id': entry.get('id', key)})
+
+    summary = {
+        'artifact': path,
+        'count': len(index),
+        'types': dict(Counter(entry['type'] for entry in index)),
+        'resources': index,
+        'errors': errors,
+        'delta': delta
+    }
+    return summary, current
+
 
 # Custom tool for Azure resource discovery
 @tool("Azure Resource Scanner")
@@ -17,39 +258,107 @@ def azure_resource_scanner(resource_group: str) -> str:
 
     
     try:
+        cache = get_cache()
+        subscription = _current_subscription()
+        cache_args = {'stream': True} if STREAM_DISCOVERY else None
+        cached = cache.get(subscription, resource_group, "azure_resource_scanner", cache_args)
+        # A cached streaming summary is only usable while its artifact is still on disk
+        if cached is not None and (not STREAM_DISCOVERY or os.path.exists(cached['artifact'])):
+            if not STREAM_DISCOVERY:
+                _write_artifact(resource_group, cached['resources'])
+            return compact_output("azure_resource_scanner", cached, resource_group)
+        
         # Get all resources in the resource group
-        cmd = f"az resource list --resource-group {resource_group} --output json"
-        result = subprocess.run(cmd, shell=True, capture_output=True, text=True)
+        listing = get_fetcher().list_resources(resource_group)
         
-        if result.returncode != 0:
-            return f"Error: {result.stderr}"
+        if listing['error'] is not None:
+            return f"Error: {listing['error']}"
         
-        resources = json.loads(result.stdout)
+        resources = listing['data']
         
+        # Compare the cheap listing with the last snapshot of this group and
+        # only hydrate resources that were added or whose changedTime/etag moved
+        previous = {}
+        if INCREMENTAL_DISCOVERY:
+            snapshot = cache.get(subscription, resource_group, SNAPSHOT_COMMAND)
+            previous = snapshot['resources'] if snapshot else {}
+        
+        to_hydrate = []
+        for resource in resources:
+            entry = previous.get(resource['id'].lower())
+            fingerprint = _change_fingerprint(resource)
+            if entry is None or fingerprint is None or entry['fingerprint'] != fingerprint:
+                to_hydrate.append(resource)
+            elif 'record' not in entry and not STREAM_DISCOVERY:
+                # Snapshots written in streaming mode keep records in the artifact only
+                to_hydrate.append(resource)
+        
+        if STREAM_DISCOVERY:
+            summary, current = _stream_resources(resource_group, resources, previous, to_hydrate)
+            if INCREMENTAL_DISCOVERY:
+                cache.set(subscription, resource_group, SNAPSHOT_COMMAND, None, {'resources': current}, ttl=SNAPSHOT_TTL)
+            if not summary['errors']:
+                cache.set(subscription, resource_group, "azure_resource_scanner", cache_args, summary)
+            return compact_output("azure_resource_scanner", summary, resource_group)
+        
+        # Hydrate resources in chunks of DISCOVERY_BATCH_SIZE IDs, several chunks
+        # at a time; map() keeps the listing order and resources that could
+        # not be fetched carry an 'error' entry
+        batch_size = max(1, DISCOVERY_BATCH_SIZE)
+        batches = [to_hydrate[i:i + batch_size] for i in range(0, len(to_hydrate), batch_size)]
+        
+        hydrated = {}
+        with ThreadPoolExecutor(max_workers=max(1, DISCOVERY_CONCURRENCY)) as executor:
+            for records in executor.map(_hydrate_batch, batches):
+                for record in records:
+                    hydrated[record['id'].lower()] = record
+        
+        delta = {'baseline': not previous, 'added': [], 'changed': [], 'deleted': [], 'unchanged': 0}
         resource_details = []
+        current = {}
         for resource in resources:
-            resource_id = resource['id']
-            resource_type = resource['type']
-            resource_name = resource['name']
+            resource_key = resource['id'].lower()
+            summary = {'name': resource['name'], 'type': resource['type'], 'id': resource['id']}
             
-            # Get detailed information for each resource
-            detail_cmd = f"az resource show --ids {resource_id} --output json"
-            detail_result = subprocess.run(detail_cmd, shell=True, capture_output=True, text=True)
+            entry = previous.get(resource_key)
+            if resource_key in hydrated:
+                record = hydrated[resource_key]
+                if entry is None:
+                    if previous:
+                        delta['added'].append(summary)
+                elif 'error' in record or entry.get('record') == record:
+                    # Failed re-reads and re-reads without a change marker that found the same record
+                    delta['unchanged'] += 1
+                else:
+                    delta['changed'].append(summary)
+            else:
+                record = entry['record']
+                delta['unchanged'] += 1
             
-            if detail_result.returncode == 0:
-                detail = json.loads(detail_result.stdout)
-                resource_details.append({
-                    'name': resource_name,
-                    'type': resource_type,
-                    'id': resource_id,
-                    'location': resource.get('location', ''),
-                    'properties': detail.get('properties', {}),
-                    'sku': detail.get('sku', {}),
-                    'tags': detail.get('tags', {}),
-                    'dependencies': detail.get('dependsOn', [])
-                })
-        
-        return json.dumps(resource_details, indent=2)
+            resource_details.append(record)
+            if 'error' not in record:
+                current[resource_key] = {'fingerprint': _change_fingerprint(resource), 'record': record}
+            elif entry is not None:
+                # Keep the last good entry so the resource is not reported as added next run
+                current[resource_key] = entry
+        
+        listed = {resource['id'].lower() for resource in resources}
+        for resource_key, entry in previous.items():
+            if resource_key not in listed:
+                record = entry['record']
+                delta['deleted'].append({'name': record['name'], 'type': record['type'], 'id': record['id']})
+        
+        if INCREMENTAL_DISCOVERY:
+            cache.set(subscription, resource_group, SNAPSHOT_COMMAND, None, {'resources': current}, ttl=SNAPSHOT_TTL)
+        
+        _write_artifact(resource_group, resource_details)
+        resource_details = {'resources': resource_details, 'delta': delta}
+        
+        # Only complete scans are cached so failed resources are retried next run
+        if not any('error' in record for record in resource_details['resources']):
+            cache.set(subscription, resource_group, "azure_resource_scanner", None, resource_details)
+        
+        return compact_output("azure_resource_scanner", resource_details, resource_group)
     
     except Exception as e:
         return f"Error scanning resources: {str(e)}"
@@ -65,69 +374,74 @@ def azure_network_analyzer(resource_group: str) -> str:
     import json
     
     try:
+        cache = get_cache()
+        subscription = _current_subscription()
+        cached = cache.get(subscription, resource_group, "azure_network_analyzer")
+        if cached is not None:
+            return compact_output("azure_network_analyzer", cached, resource_group)
+        
         connections = {}
         
-        # Get VNets with subnets
-        vnet_cmd = f"az network vnet list --resource-group {resource_group} --output json"
-        vnet_result = subprocess.run(vnet_cmd, shell=True, capture_output=True, text=True)
-        
-        if vnet_result.returncode == 0:
-            vnets = json.loads(vnet_result.stdout)
-            for vnet in vnets:
-                # Get subnet details for each vnet
-                subnet_cmd = f"az network vnet subnet list --resource-group {resource_group} --vnet-name {vnet['name']} --output json"
-                subnet_result = subprocess.run(subnet_cmd, shell=True, capture_output=True, text=True)
-                if subnet_result.returncode == 0:
-                    vnet['subnets_detailed'] = json.loads(subnet_result.stdout)
-            connections['vnets'] = vnets
-        
-        # Get NSGs with rules
-        nsg_cmd = f"az network nsg list --resource-group {resource_group} --output json"
-        nsg_result = subprocess.run(nsg_cmd, shell=True, capture_output=True, text=True)
-        
-        if nsg_result.returncode == 0:
-            nsgs = json.loads(nsg_result.stdout)
-            for nsg in nsgs:
-                # Get NSG rules
-                rule_cmd = f"az network nsg rule list --resource-group {resource_group} --nsg-name {nsg['name']} --output json"
-                rule_result = subprocess.run(rule_cmd, shell=True, capture_output=True, text=True)
-                if rule_result.returncode == 0:
-                    nsg['rules_detailed'] = json.loads(rule_result.stdout)
-            connections['nsgs'] = nsgs
-        
-        # Get Public IPs
-        pip_cmd = f"az network public-ip list --resource-group {resource_group} --output json"
-        pip_result = subprocess.run(pip_cmd, shell=True, capture_output=True, text=True)
-        
-        if pip_result.returncode == 0:
-            pips = json.loads(pip_result.stdout)
-            connections['public_ips'] = pips
-        
-        # Get NICs (Network Interface Cards)
-        nic_cmd = f"az network nic list --resource-group {resource_group} --output json"
-        nic_result = subprocess.run(nic_cmd, shell=True, capture_output=True, text=True)
-        
-        if nic_result.returncode == 0:
-            nics = json.loads(nic_result.stdout)
-            connections['network_interfaces'] = nics
-        
-        # Get Load Balancers
-        lb_cmd = f"az network lb list --resource-group {resource_group} --output json"
-        lb_result = subprocess.run(lb_cmd, shell=True, capture_output=True, text=True)
-        
-        if lb_result.returncode == 0:
-            lbs = json.loads(lb_result.stdout)
-            connections['load_balancers'] = lbs
-        
-        # Get Application Gateways
-        appgw_cmd = f"az network application-gateway list --resource-group {resource_group} --output json"
-        appgw_result = subprocess.run(appgw_cmd, shell=True, capture_output=True, text=True)
-        
-        if appgw_result.returncode == 0:
-            appgws = json.loads(appgw_result.stdout)
-            connections['application_gateways'] = appgws
-        
-        return json.dumps(connections, indent=2)
+        # Top-level listings (see backends.NETWORK_KINDS) are independent of each other
+        listings = ['vnets', 'nsgs', 'public_ips', 'network_interfaces', 'load_balancers', 'application_gateways']
+        
+        # Per-VNet subnet and per-NSG rule listings, scheduled as soon as their parent list returns
+        nested_listings = {
+            'vnets': ('subnets_detailed', 'subnets'),
+            'nsgs': ('rules_detailed', 'rules')
+        }
+        
+        fetcher = get_fetcher()
+        calls = []
+        results = {}
+        
+        # All calls share one pool, so DISCOVERY_CONCURRENCY caps the whole fan-out
+        with ThreadPoolExecutor(max_workers=max(1, DISCOVERY_CONCURRENCY)) as executor:
+            pending = {}
+            
+            def schedule(description, read, target):
+                call = {'call': description, 'backend': fetcher.backend.name}
+                calls.append(call)
+                pending[executor.submit(read)] = (call, target)
+            
+            for kind in listings:
+                schedule(f"list {kind}", lambda kind=kind: fetcher.list_network(resource_group, kind), kind)
+            
+            while pending:
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    call, target = pending.pop(future)
+                    outcome = future.result()
+                    call['seconds'] = outcome['seconds']
+                    call['status'] = 'ok' if outcome['error'] is None else outcome['error']
+                    
+                    if outcome['error'] is not None:
+                        continue
+                    
+                    if isinstance(target, str):
+                        results[target] = outcome['data']
+                        if target in nested_listings:
+                            field, child = nested_listings[target]
+                            for item in outcome['data']:
+                                schedule(
+                                    f"list {child} of {item['name']}",
+                                    lambda item=item, child=child: fetcher.list_network_children(resource_group, child, item),
+                                    (item, field)
+                                )
+                    else:
+                        item, field = target
+                        item[field] = outcome['data']
+        
+        for key in listings:
+            if key in results:
+                connections[key] = results[key]
+        
+        connections['call_timings'] = calls
+        
+        if all(call.get('status') == 'ok' for call in calls):
+            cache.set(subscription, resource_group, "azure_network_analyzer", None, connections)
+        
+        return compact_output("azure_network_analyzer", connections, resource_group)
     
     except Exception as e:
         return f"Error analyzing network: {str(e)}"
@@ -143,126 +457,179 @@ def azure_dependencies_mapper(resource_group: str) -> str:
     import json
     
     try:
+        cache = get_cache()
+        subscription = _current_subscription()
+        cache_args = {'backend': DEPENDENCIES_BACKEND}
+        cached = cache.get(subscription, resource_group, "azure_dependencies_mapper", cache_args)
+        if cached is not None:
+            return compact_output("azure_dependencies_mapper", cached, resource_group)
+        
+        if DEPENDENCIES_BACKEND == "graph":
+            dependencies = resource_graph.map_dependencies(resource_group, max_workers=DISCOVERY_CONCURRENCY)
+            # Follow-up reads that failed are recorded under 'errors'; only clean maps are cached
+            if not any('errors' in item for items in dependencies.values() for item in items):
+                cache.set(subscription, resource_group, "azure_dependencies_mapper", cache_args, dependencies)
+            return compact_output("azure_dependencies_mapper", dependencies, resource_group)
+        
         dependencies = {}
         
+        # All reads go through the run's fetcher, so commands repeated by a
+        # second tool call, and resource documents the scanner already read,
+        # are not fetched again
+        fetcher = get_fetcher()
+        failures = []
+        
+        def az_list(cmd):
+            outcome = fetcher.az_json(cmd)
+            if outcome['error'] is not None:
+                failures.append(cmd)
+                return None
+            return outcome['data']
+        
+        def resource_document(item):
+            try:
+                return fetcher.get_resource(item['id'])
+            except Exception:
+                failures.append(item['id'])
+                return None
+        
         # Get Storage Accounts
-        storage_cmd = f"az storage account list --resource-group {resource_group} --output json"
-        storage_result = subprocess.run(storage_cmd, shell=True, capture_output=True, text=True)
+        storage_accounts = az_list(f"az storage account list --resource-group {resource_group} --output json")
         
-        if storage_result.returncode == 0:
-            storage_accounts = json.loads(storage_result.stdout)
+        if storage_accounts is not None:
             for sa in storage_accounts:
-                # Get network rules
-                network_cmd = f"az storage account show --name {sa['name']} --resource-group {resource_group} --query networkRuleSet --output json"
-                network_result = subprocess.run(network_cmd, shell=True, capture_output=True, text=True)
-                if network_result.returncode == 0:
-                    sa['network_rules'] = json.loads(network_result.stdout)
+                # Network rules are part of the listing; fall back to the shared resource document
+                if 'networkRuleSet' in sa:
+                    sa['network_rules'] = sa['networkRuleSet']
+                else:
+                    document = resource_document(sa)
+                    if document is not None:
+                        sa['network_rules'] = document.get('properties', {}).get('networkAcls')
             dependencies['storage_accounts'] = storage_accounts
         
         # Get SQL Servers and Databases
-        sql_cmd = f"az sql server list --resource-group {resource_group} --output json"
-        sql_result = subprocess.run(sql_cmd, shell=True, capture_output=True, text=True)
+        sql_servers = az_list(f"az sql server list --resource-group {resource_group} --output json")
         
-        if sql_result.returncode == 0:
-            sql_servers = json.loads(sql_result.stdout)
+        if sql_servers is not None:
             for server in sql_servers:
                 # Get databases
-                db_cmd = f"az sql db list --resource-group {resource_group} --server {server['name']} --output json"
-                db_result = subprocess.run(db_cmd, shell=True, capture_output=True, text=True)
-                if db_result.returncode == 0:
-                    server['databases'] = json.loads(db_result.stdout)
+                databases = az_list(f"az sql db list --resource-group {resource_group} --server {server['name']} --output json")
+                if databases is not None:
+                    server['databases'] = databases
                 
                 # Get firewall rules
-                fw_cmd = f"az sql server firewall-rule list --resource-group {resource_group} --server {server['name']} --output json"
-                fw_result = subprocess.run(fw_cmd, shell=True, capture_output=True, text=True)
-                if fw_result.returncode == 0:
-                    server['firewall_rules'] = json.loads(fw_result.stdout)
+                firewall_rules = az_list(f"az sql server firewall-rule list --resource-group {resource_group} --server {server['name']} --output json")
+                if firewall_rules is not None:
+                    server['firewall_rules'] = firewall_rules
             dependencies['sql_servers'] = sql_servers
         
         # Get App Services
-        webapp_cmd = f"az webapp list --resource-group {resource_group} --output json"
-        webapp_result = subprocess.run(webapp_cmd, shell=True, capture_output=True, text=True)
+        webapps = az_list(f"az webapp list --resource-group {resource_group} --output json")
         
-        if webapp_result.returncode == 0:
-            webapps = json.loads(webapp_result.stdout)
+        if webapps is not None:
             for webapp in webapps:
                 # Get app settings
-                settings_cmd = f"az webapp config appsettings list --resource-group {resource_group} --name {webapp['name']} --output json"
-                settings_result = subprocess.run(settings_cmd, shell=True, capture_output=True, text=True)
-                if settings_result.returncode == 0:
-                    webapp['app_settings'] = json.loads(settings_result.stdout)
+                app_settings = az_list(f"az webapp config appsettings list --resource-group {resource_group} --name {webapp['name']} --output json")
+                if app_settings is not None:
+                    webapp['app_settings'] = app_settings
                 
                 # Get connection strings
-                conn_cmd = f"az webapp config connection-string list --resource-group {resource_group} --name {webapp['name']} --output json"
-                conn_result = subprocess.run(conn_cmd, shell=True, capture_output=True, text=True)
-                if conn_result.returncode == 0:
-                    webapp['connection_strings'] = json.loads(conn_result.stdout)
+                connection_strings = az_list(f"az webapp config connection-string list --resource-group {resource_group} --name {webapp['name']} --output json")
+                if connection_strings is not None:
+                    webapp['connection_strings'] = connection_strings
             dependencies['webapps'] = webapps
         
         # Get App Service Plans
-        plan_cmd = f"az appservice plan list --resource-group {resource_group} --output json"
-        plan_result = subprocess.run(plan_cmd, shell=True, capture_output=True, text=True)
+        plans = az_list(f"az appservice plan list --resource-group {resource_group} --output json")
         
-        if plan_result.returncode == 0:
-            plans = json.loads(plan_result.stdout)
+        if plans is not None:
             dependencies['app_service_plans'] = plans
         
         # Get CosmosDB
-        cosmos_cmd = f"az cosmosdb list --resource-group {resource_group} --output json"
-        cosmos_result = subprocess.run(cosmos_cmd, shell=True, capture_output=True, text=True)
+        cosmos_accounts = az_list(f"az cosmosdb list --resource-group {resource_group} --output json")
         
-        if cosmos_result.returncode == 0:
-            cosmos_accounts = json.loads(cosmos_result.stdout)
+        if cosmos_accounts is not None:
             dependencies['cosmos_accounts'] = cosmos_accounts
         
         # Get Key Vaults
-        kv_cmd = f"az keyvault list --resource-group {resource_group} --output json"
-        kv_result = subprocess.run(kv_cmd, shell=True, capture_output=True, text=True)
+        keyvaults = az_list(f"az keyvault list --resource-group {resource_group} --output json")
         
-        if kv_result.returncode == 0:
-            keyvaults = json.loads(kv_result.stdout)
+        if keyvaults is not None:
             for kv in keyvaults:
-                # Get access policies
-                policy_cmd = f"az keyvault show --name {kv['name']} --resource-group {resource_group} --query properties.accessPolicies --output json"
-                policy_result = subprocess.run(policy_cmd, shell=True, capture_output=True, text=True)
-                if policy_result.returncode == 0:
-                    kv['access_policies'] = json.loads(policy_result.stdout)
+                # Access policies come from the shared resource document
+                document = resource_document(kv)
+                if document is not None:
+                    kv['access_policies'] = document.get('properties', {}).get('accessPolicies', [])
             dependencies['keyvaults'] = keyvaults
         
         # Get Virtual Machines
-        vm_cmd = f"az vm list --resource-group {resource_group} --output json"
-        vm_result = subprocess.run(vm_cmd, shell=True, capture_output=True, text=True)
+        vms = az_list(f"az vm list --resource-group {resource_group} --output json")
         
-        if vm_result.returncode == 0:
-            vms = json.loads(vm_result.stdout)
+        if vms is not None:
             for vm in vms:
-                # Get VM details including NICs
-                vm_detail_cmd = f"az vm show --resource-group {resource_group} --name {vm['name']} --output json"
-                vm_detail_result = subprocess.run(vm_detail_cmd, shell=True, capture_output=True, text=True)
-                if vm_detail_result.returncode == 0:
-                    vm['details'] = json.loads(vm_detail_result.stdout)
+                # VM details including NICs, shared with the resource scanner
+                document = resource_document(vm)
+                if document is not None:
+                    vm['details'] = document
             dependencies['virtual_machines'] = vms
         
         # Get Function Apps
-        func_cmd = f"az functionapp list --resource-group {resource_group} --output json"
-        func_result = subprocess.run(func_cmd, shell=True, capture_output=True, text=True)
+        functions = az_list(f"az functionapp list --resource-group {resource_group} --output json")
         
-        if func_result.returncode == 0:
-            functions = json.loads(func_result.stdout)
+        if functions is not None:
             for func in functions:
                 # Get app settings
-                settings_cmd = f"az functionapp config appsettings list --resource-group {resource_group} --name {func['name']} --output json"
-                settings_result = subprocess.run(settings_cmd, shell=True, capture_output=True, text=True)
-                if settings_result.returncode == 0:
-                    func['app_settings'] = json.loads(settings_result.stdout)
+                app_settings = az_list(f"az functionapp config appsettings list --resource-group {resource_group} --name {func['name']} --output json")
+                if app_settings is not None:
+                    func['app_settings'] = app_settings
             dependencies['function_apps'] = functions
         
-        return json.dumps(dependencies, indent=2)
+        # Only complete maps are cached so failed reads are retried next run
+        if not failures:
+            cache.set(subscription, resource_group, "azure_dependencies_mapper", cache_args, dependencies)
+        
+        return compact_output("azure_dependencies_mapper", dependencies, resource_group)
     
     except Exception as e:
         return f"Error mapping dependencies: {str(e)}"
 
 
+@tool("Discovery Detail Reader")
+def discovery_detail_reader(tool_name: str, pointer: str = "/") -> str:
+    """
+    Reads discovery details that were left out of a discovery tool's output to stay within the token budget.
+    tool_name is the discovery tool (azure_resource_scanner, azure_network_analyzer or azure_dependencies_mapper),
+    or the "artifact" path returned by the scanner in streaming mode, and pointer is the "$detail" value
+    from its output, e.g. "/resources/3/properties".
+    """
+    try:
+        return read_detail(tool_name, pointer)
+    except FileNotFoundError:
+        return f"Error: no spilled details for {tool_name}; its full output was already returned"
+    except (KeyError, IndexError, ValueError) as e:
+        return f"Error: pointer {pointer} not found in {tool_name} details: {str(e)}"
+    except Exception as e:
+        return f"Error reading discovery details: {str(e)}"
+
+
+@tool("Terraform Render Report")
+def terraform_render_report(tier: str) -> str:
+    """
+    Returns the work of one generation tier (network, data, compute or app): the file to write,
+    the resources to generate with their local names, the Terraform address of every resource
+    rendered from templates, and the ref.<local_name> placeholder for resources of other tiers.
+    """
+    try:
+        report = load_render_report()
+        if report is None:
+            return "No template render report found; there is nothing to generate"
+        if tier not in TIERS:
+            return f"Error: unknown tier {tier}; use one of {', '.join(TIERS)}"
+        return json.dumps(tier_brief(report, tier), separators=(",", ":"))
+    except Exception as e:
+        return f"Error reading render report: {str(e)}"
+
+
 @tool("Terraform File Writer")
 def terraform_file_writer(filename: str, content: str) -> str:
     """
@@ -277,8 +644,21 @@ def terraform_file_writer(filename: str, content: str) -> str:
         if not os.path.exists(terraform_dir):
             os.makedirs(terraform_dir)
         
+        # Paths are resolved first, so "tiers/../main.tf" cannot get past the checks below
+        filepath = os.path.join(terraform_dir, os.path.normpath(filename))
+        real_path = os.path.realpath(filepath)
+        if os.path.commonpath([real_path, os.path.realpath(terraform_dir)]) != os.path.realpath(terraform_dir):
+            return f"Error: {filename} is outside the {terraform_dir}/ directory"
+        
+        # Rendered and merged files are produced in code; agents write their tier file only
+        report = load_render_report(terraform_dir)
+        tier_dir = os.path.realpath(os.path.join(terraform_dir, TIER_DIR))
+        if report and os.path.commonpath([real_path, tier_dir]) != tier_dir:
+            return (f"Error: {filename} is produced from templates or by the tier merge and must not be written; "
+                    f"write your tier's resources to {TIER_DIR}/<tier>.tf instead")
+        
         # Write the file
-        filepath = os.path.join(terraform_dir, filename)
+        os.makedirs(os.path.dirname(filepath), exist_ok=True)
         with open(filepath, 'w') as f:
             f.write(content)
         
@@ -295,220 +675,8 @@ def terraform_validator(terraform_dir: str = "terraform") -> str:
     version compatibility, and Azure-specific requirements.
     Returns a detailed validation report with executability score.
     """
-    import subprocess
-    import json
-    import os
-    import re
-    
     try:
-        validation_report = {
-            "file_checks": {},
-            "syntax_errors": [],
-            "deprecated_resources": [],
-            "config_issues": [],
-            "version_check": {},
-            "azure_validation": {},
-            "scores": {},
-            "executability_percentage": 0
-        }
-        
-        # Check if terraform directory exists
-        if not os.path.exists(terraform_dir):
-            return json.dumps({
-                "status": "error",
-                "message": f"Terraform directory '{terraform_dir}' does not exist"
-            }, indent=2)
-        
-        # 1. FILE EXISTENCE CHECK
-        required_files = [
-            "provider.tf", "variables.tf", "main.tf", 
-            "outputs.tf", "terraform.tfvars", "README.md"
-        ]
-        
-        for file in required_files:
-            filepath = os.path.join(terraform_dir, file)
-            validation_report["file_checks"][file] = os.path.exists(filepath)
-        
-        files_score = sum(validation_report["file_checks"].values()) / len(required_files) * 100
-        
-        # 2. SYNTAX VALIDATION (terraform fmt check)
-        try:
-            fmt_result = subprocess.run(
-                "terraform fmt -check -recursive",
-                shell=True,
-                cwd=terraform_dir,
-                capture_output=True,
-                text=True,
-                timeout=30
-            )
-            
-            if fmt_result.returncode != 0:
-                validation_report["syntax_errors"].append({
-                    "type": "formatting",
-                    "message": "Formatting issues detected",
-                    "files": fmt_result.stdout.split('\n') if fmt_result.stdout else []
-                })
-        except Exception as e:
-            validation_report["syntax_errors"].append({
-                "type": "fmt_error",
-                "message": str(e)
-            })
-        
-        # 3. TERRAFORM VALIDATE (requires init first)
-        try:
-            # Try to run validate (might fail if not initialized)
-            validate_result = subprocess.run(
-                "terraform validate",
-                shell=True,
-                cwd=terraform_dir,
-                capture_output=True,
-                text=True,
-                timeout=30
-            )
-            
-            validation_report["syntax_validation"] = {
-                "status": "pass" if validate_result.returncode == 0 else "fail",
-                "output": validate_result.stdout,
-                "errors": validate_result.stderr
-            }
-        except Exception as e:
-            validation_report["syntax_validation"] = {
-                "status": "error",
-                "message": "Validation requires 'terraform init' first",
-                "note": str(e)
-            }
-        
-        # 4. CHECK FOR DEPRECATED RESOURCES
-        deprecated_mappings = {
-            "azurerm_app_service_plan": {
-                "replacement": "azurerm_service_plan",
-                "reason": "Deprecated since provider v3.0",
-                "doc": "https://registry.terraform.io/providers/hashicorp/azurerm/latest/docs/resources/service_plan"
-            },
-            "azurerm_app_service": {
-                "replacement": "azurerm_linux_web_app or azurerm_windows_web_app",
-                "reason": "Deprecated since provider v3.0",
-                "doc": "https://registry.terraform.io/providers/hashicorp/azurerm/latest/docs/resources/linux_web_app"
-            },
-            "azurerm_function_app": {
-                "replacement": "azurerm_linux_function_app or azurerm_windows_function_app",
-                "reason": "Deprecated since provider v3.0",
-                "doc": "https://registry.terraform.io/providers/hashicorp/azurerm/latest/docs/resources/linux_function_app"
-            }
-        }
-        
-        # Scan main.tf for deprecated resources
-        main_tf_path = os.path.join(terraform_dir, "main.tf")
-        if os.path.exists(main_tf_path):
-            with open(main_tf_path, 'r') as f:
-                lines = f.readlines()
-                for line_num, line in enumerate(lines, 1):
-                    for deprecated, info in deprecated_mappings.items():
-                        if f'resource "{deprecated}"' in line:
-                            validation_report["deprecated_resources"].append({
-                                "file": "main.tf",
-                                "line": line_num,
-                                "deprecated_resource": deprecated,
-                                "replacement": info["replacement"],
-                                "reason": info["reason"],
-                                "documentation": info["doc"],
-                                "code_snippet": line.strip()
-                            })
-        
-        # 5. CHECK PROVIDER VERSIONS
-        provider_tf_path = os.path.join(terraform_dir, "provider.tf")
-        if os.path.exists(provider_tf_path):
-            with open(provider_tf_path, 'r') as f:
-                content = f.read()
-                
-                # Check for azurerm provider version
-                azurerm_version_match = re.search(r'azurerm.*?version\s*=\s*["\']([^"\']+)["\']', content, re.DOTALL)
-                if azurerm_version_match:
-                    version = azurerm_version_match.group(1)
-                    validation_report["version_check"]["azurerm_provider"] = {
-                        "found": version,
-                        "recommended": "~> 4.1",
-                        "status": "ok" if "4." in version or "~> 4" in version else "outdated"
-                    }
-                
-                # Check terraform required version
-                tf_version_match = re.search(r'required_version\s*=\s*["\']([^"\']+)["\']', content)
-                if tf_version_match:
-                    version = tf_version_match.group(1)
-                    validation_report["version_check"]["terraform_version"] = {
-                        "found": version,
-                        "recommended": ">= 1.0",
-                        "status": "ok"
-                    }
-        
-        # 6. AZURE-SPECIFIC CHECKS
-        if os.path.exists(main_tf_path):
-            with open(main_tf_path, 'r') as f:
-                content = f.read()
-                
-                # Check for proper resource naming patterns
-                resource_names = re.findall(r'name\s*=\s*["\']([^"\']+)["\']', content)
-                validation_report["azure_validation"]["resource_names_found"] = len(resource_names)
-                
-                # Check for location references
-                locations = re.findall(r'location\s*=\s*([^\n]+)', content)
-                validation_report["azure_validation"]["location_references"] = len(locations)
-        
-        # 7. CALCULATE EXECUTABILITY SCORE
-        scores = {}
-        
-        # Syntax score (25 points)
-        syntax_score = 25
-        if validation_report["syntax_errors"]:
-            syntax_score -= len(validation_report["syntax_errors"]) * 5
-        syntax_score = max(0, syntax_score)
-        scores["syntax"] = syntax_score
-        
-        # Deprecated resources score (20 points)
-        deprecated_score = 20
-        if validation_report["deprecated_resources"]:
-            deprecated_score = max(0, 20 - len(validation_report["deprecated_resources"]) * 5)
-        scores["deprecated"] = deprecated_score
-        
-        # File completeness score (15 points)
-        file_score = (sum(validation_report["file_checks"].values()) / len(required_files)) * 15
-        scores["files"] = round(file_score, 2)
-        
-        # Provider version score (15 points)
-        version_score = 15
-        if validation_report["version_check"]:
-            azurerm_check = validation_report["version_check"].get("azurerm_provider", {})
-            if azurerm_check.get("status") == "outdated":
-                version_score = 10
-        scores["version"] = version_score
-        
-        # Azure compliance score (15 points) - basic check
-        azure_score = 15
-        if not validation_report["azure_validation"].get("resource_names_found"):
-            azure_score = 10
-        scores["azure_compliance"] = azure_score
-        
-        # Documentation score (10 points)
-        doc_score = 10 if validation_report["file_checks"].get("README.md") else 5
-        scores["documentation"] = doc_score
-        
-        # Calculate total
-        total_score = sum(scores.values())
-        validation_report["scores"] = scores
-        validation_report["executability_percentage"] = round(total_score, 2)
-        
-        # Determine status
-        if total_score >= 90:
-            validation_report["status"] = "EXCELLENT - Ready for deployment"
-        elif total_score >= 70:
-            validation_report["status"] = "GOOD - Minor fixes recommended"
-        elif total_score >= 50:
-            validation_report["status"] = "FAIR - Moderate issues to address"
-        else:
-            validation_report["status"] = "POOR - Major rework required"
-        
-        return json.dumps(validation_report, indent=2)
-    
+        return json.dumps(validate_terraform(terraform_dir), indent=2)
     except Exception as e:
         return json.dumps({
             "status": "error",
@@ -520,6 +688,8 @@ def terraform_executor(command: str, working_dir: str = "terraform") -> str:
     """
     Executes Terraform commands (init, plan, apply, destroy).
     Runs commands in the specified working directory.
+    plan saves the plan and returns a JSON summary of it; apply applies exactly that saved plan.
+    With REPLICA_TF_LAYOUT=sharded, plan, apply and destroy run on the per-tier shards instead.
     """
     import subprocess
     import os
@@ -535,25 +705,77 @@ def terraform_executor(command: str, working_dir: str = "terraform") -> str:
         if not os.path.exists(working_dir):
             return f"Error: Working directory {working_dir} does not exist"
         
+        # Every command uses the shared plugin cache (and provider mirror, if configured)
+        configure_terraform_environment()
+        
+        arguments = " ".join(cmd_parts[1:])
+        if cmd_parts[0] in ('plan', 'apply', 'destroy') and sharded_layout():
+            # Runs on the per-tier root modules, following the shard dependency order
+            sharded = run_shards(working_dir, cmd_parts[0])
+            status = "SUCCESS" if sharded["status"] == "success" else "FAILED"
+            return f"{status}: {json.dumps(sharded, indent=2, default=str)}"
+        if cmd_parts[0] == 'plan':
+            # Saves the plan and summarizes it, so apply can use it without planning (and refreshing) again
+            result, plan_summary = terraform_plan(working_dir, arguments)
+            if plan_summary is not None:
+                refusal = destroy_guard(plan_summary)
+                if refusal:
+                    # Same verdict the apply path gives, so the agent stops here instead of applying
+                    plan_summary["refused"] = refusal
+                    return f"REFUSED: this plan will not be applied: {refusal}\n\n{json.dumps(plan_summary, indent=2)}"
+                return f"SUCCESS: {json.dumps(plan_summary, indent=2)}"
+        elif cmd_parts[0] == 'apply':
+            # Applies exactly the saved plan, planning first if there is none for the current configuration
+            positional = [part for part in cmd_parts[1:] if not part.startswith('-')]
+            options = [part for part in cmd_parts[1:] if part.startswith('-') and part not in ('-auto-approve', '-json')]
+            plan_file = positional[0] if positional else PLAN_FILE
+            applied = apply_plan(
+                working_dir,
+                options=[part for part in options if part.startswith(APPLY_PLAN_OPTIONS)],
+                plan_options=[part for part in options if not part.startswith(APPLY_PLAN_OPTIONS)],
+                plan_file=plan_file
+            )
+            if applied["status"] == "refused":
+                return f"Error: refusing to apply {plan_file}: {applied['message']}"
+            if applied.get("stage") == "plan":
+                return f"FAILED: planning before apply failed\n\nSTDOUT:\n{applied['stdout']}\n\nSTDERR:\n{applied['stderr']}"
+            status = "SUCCESS" if applied["status"] == "success" else "FAILED"
+            if streaming_enabled():
+                summary = dict(applied["apply"], plan=applied["plan"], schedule=applied["schedule"])
+                return f"{status}: {json.dumps(summary, indent=2, default=str)}"
+            raw = applied["apply"]
+            output = f"STDOUT:\n{raw['stdout']}\n\nSTDERR:\n{raw['stderr']}\n\nReturn Code: {raw['returncode']}"
+            output += f"\n\nPLAN:\n{json.dumps(applied['plan'], indent=2)}"
+            if applied["schedule"] is not None:
+                output += f"\n\nSCHEDULE:\n{json.dumps(applied['schedule'], indent=2)}"
+            return f"{status}: {output}"
+        
         # Build full terraform command
-        if cmd_parts[0] == 'apply':
-            # Auto-approve for apply
-            full_command = f"terraform {command} -auto-approve"
-        elif cmd_parts[0] == 'destroy':
+        if cmd_parts[0] == 'destroy':
             # Auto-approve for destroy
-            full_command = f"terraform {command} -auto-approve"
+            full_command = f"terraform {cmd_parts[0]} -auto-approve {arguments}".strip()
         else:
             full_command = f"terraform {command}"
         
-        # Execute command
-        result = subprocess.run(
-            full_command,
-            shell=True,
-            cwd=working_dir,
-            capture_output=True,
-            text=True,
-            timeout=1800  # 30 minute timeout
-        )
+        if cmd_parts[0] in STREAMED_COMMANDS and streaming_enabled():
+            # Streams progress to the console and a log file; returns a compact summary instead of the raw log
+            summary = stream_command(working_dir, cmd_parts[0], arguments)
+            status = "SUCCESS" if summary["returncode"] == 0 else "FAILED"
+            return f"{status}: {json.dumps(summary, indent=2, default=str)}"
+        
+        if cmd_parts[0] == 'init':
+            # Installs from the shared plugin cache with the pinned lock file
+            result = terraform_init(working_dir, arguments=arguments)
+        elif cmd_parts[0] != 'plan':
+            if cmd_parts[0] == 'validate':
+                ensure_initialized(working_dir)
+            # Execute command; destroy changes infrastructure, so it is never retried
+            result = get_runner().run(
+                full_command,
+                cwd=working_dir,
+                timeout=1800,  # 30 minute timeout
+                retries=0 if cmd_parts[0] == 'destroy' else None
+            )
         
         output = f"STDOUT:\n{result.stdout}\n\nSTDERR:\n{result.stderr}\n\nReturn Code: {result.returncode}"
         
@@ -578,7 +800,7 @@ class Replica():
     def __init__(self):
         super().__init__()
         # Configure Azure OpenAI LLM
-        self.llm = LLM(
+        self.llm = ReplicaLLM(
             model="azure/gpt-4o-mini",
             base_url=os.getenv("AZURE_API_BASE"),
             api_key=os.getenv("AZURE_API_KEY"),
@@ -586,30 +808,83 @@ class Replica():
             temperature=0.2
         
         )
+        self.inputs = {}
+        self.render_report = None
+
+    @before_kickoff
+    def remember_inputs(self, inputs):
+        self.inputs = dict(inputs or {})
+        return inputs
+
+    def render_templates(self, output):
+        """
+        Renders the discovered resources the templates cover once discovery has finished
+        and splits the rest into the generation tiers.
+        """
+        if not self.inputs.get('resource_group'):
+            return
+        args = (self.inputs['resource_group'], self.inputs.get('name_prefix', 'replica'), self.inputs.get('target_environment', 'dev'))
+        try:
+            self.render_report = render_configuration(*args, subscription_id=_current_subscription())
+        except Exception as e:
+            print(f"Template renderer failed, falling back to LLM generation: {str(e)}")
+            try:
+                self.render_report = render_configuration(*args, subscription_id=_current_subscription(), templates=False)
+            except Exception as e:
+                self.render_report = None
+                # Files rendered for an earlier run would otherwise be taken for this one
+                discard_render()
+                print(f"No discovery records to generate from: {str(e)}")
+                return
+        tiers = ", ".join(f"{tier} {len(items)}" for tier, items in self.render_report['tiers'].items())
+        print(f"Template renderer: {len(self.render_report['rendered'])} resources rendered, "
+              f"{len(self.render_report['unrendered'])} left to the generation tiers ({tiers})")
+
+    def tier_generation_task(self, tier: str) -> Task:
+        """
+        Async generation task for one tier, run by its own copy of the generator agent
+        because crewAI agents keep per-task executor state.
+        """
+        # Same agent text for every tier, so the tier prompts share their prefix; the tier is a task parameter
+        generator = Agent(
+            config=stable_agent_config(self.agents_config['terraform_generator_agent']), # type: ignore[index]
+            verbose=True,
+            llm=self.llm,
+            tools=[terraform_file_writer, discovery_detail_reader, terraform_render_report],
+            allow_delegation=False
+        )
+        task_config = stable_task_config(
+            self.tasks_config['terraform_generation_task'], # type: ignore[index]
+            self.agents_config['terraform_generator_agent'] # type: ignore[index]
+        )
+        task_config['description'] = task_config['description'].replace('{tier}', tier)
+        task_config['expected_output'] = task_config['expected_output'].replace('{tier}', tier)
+        task_config['agent'] = generator
+        return TierGenerationTask(config=task_config, tier=tier, async_execution=True)
 
     @agent
     def azure_discovery_agent(self) -> Agent:
         return Agent(
-            config=self.agents_config['azure_discovery_agent'], # type: ignore[index]
+            config=stable_agent_config(self.agents_config['azure_discovery_agent']), # type: ignore[index]
             verbose=True,
             llm=self.llm,
-            tools=[azure_resource_scanner, azure_network_analyzer, azure_dependencies_mapper]
+            tools=[azure_resource_scanner, azure_network_analyzer, azure_dependencies_mapper, discovery_detail_reader]
         )
 
     @agent
     def terraform_generator_agent(self) -> Agent:
         return Agent(
-            config=self.agents_config['terraform_generator_agent'], # type: ignore[index]
+            config=stable_agent_config(self.agents_config['terraform_generator_agent']), # type: ignore[index]
             verbose=True,
             llm=self.llm,
-            tools=[terraform_file_writer],
+            tools=[terraform_file_writer, discovery_detail_reader, terraform_render_report],
             allow_delegation=False
         )
     
     @agent
     def terraform_validation_agent(self) -> Agent:
         return Agent(
-            config=self.agents_config['terraform_validation_agent'], # type: ignore[index]
+            config=stable_agent_config(self.agents_config['terraform_validation_agent']), # type: ignore[index]
             verbose=True,
             llm=self.llm,
             tools=[terraform_validator]
@@ -618,7 +893,7 @@ class Replica():
     @agent
     def terraform_deployment_agent(self) -> Agent:
         return Agent(
-            config=self.agents_config['terraform_deployment_agent'], # type: ignore[index]
+            config=stable_agent_config(self.agents_config['terraform_deployment_agent']), # type: ignore[index]
             verbose=True,
             llm=self.llm,
 
@@ -629,26 +904,44 @@ class Replica():
     @task
     def discovery_task(self) -> Task:
         return Task(
-            config=self.tasks_config['discovery_task'], # type: ignore[index]
+            config=stable_task_config(self.tasks_config['discovery_task'], self.agents_config['azure_discovery_agent']), # type: ignore[index]
+            callback=self.render_templates
         )
 
+    # The tiers run concurrently; the merge waits for all of them
     @task
-    def terraform_generation_task(self) -> Task:
-        return Task(
-            config=self.tasks_config['terraform_generation_task'], # type: ignore[index]
+    def terraform_network_generation_task(self) -> Task:
+        return self.tier_generation_task("network")
+
+    @task
+    def terraform_data_generation_task(self) -> Task:
+        return self.tier_generation_task("data")
+
+    @task
+    def terraform_compute_generation_task(self) -> Task:
+        return self.tier_generation_task("compute")
+
+    @task
+    def terraform_app_generation_task(self) -> Task:
+        return self.tier_generation_task("app")
+
+    @task
+    def terraform_merge_task(self) -> Task:
+        return TierMergeTask(
+            config=stable_task_config(self.tasks_config['terraform_merge_task'], self.agents_config['terraform_generator_agent']), # type: ignore[index]
         )
 
     @task
     def terraform_validation_task(self) -> Task:
-        return Task(
-            config=self.tasks_config['terraform_validation_task'], # type: ignore[index]
+        return ValidationTask(
+            config=stable_task_config(self.tasks_config['terraform_validation_task'], self.agents_config['terraform_validation_agent']), # type: ignore[index]
             output_file='terraform_validation_report.md'
         )
 
     @task
     def terraform_deployment_task(self) -> Task:
         return Task(
-            config=self.tasks_config['terraform_deployment_task'], # type: ignore[index]
+            config=stable_task_config(self.tasks_config['terraform_deployment_task'], self.agents_config['terraform_deployment_agent']), # type: ignore[index]
             output_file='deployment_report.md'
         )
 
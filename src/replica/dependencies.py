@@ -0,0 +1,514 @@
+"""
+Resource dependency graphs and apply scheduling.
+
+Two graphs are built in Python instead of asking the agents to work out a
+creation order from prose:
+
+- over the discovered resources, from the ARM IDs each resource's properties
+  refer to (and child resources to their parent)
+- over the generated configuration, from the references between resource
+  and module blocks (through locals and data sources) and depends_on
+
+Both give topological levels, the critical path and the maximum width. For
+an apply, the configuration graph is list-scheduled with per-resource-type
+duration estimates to predict the apply time. Blocks with a literal `count`
+or `for_each` are expanded into one node per instance, as terraform walks
+them. `-parallelism` is the smallest value from terraform's default of 10 up
+to REPLICA_TF_MAX_PARALLELISM that reaches the shortest predicted time, so
+wide graphs are not held back by the default and concurrent ARM writes stay
+under a throttling-safe limit. Actual per-type durations from streamed
+applies refine the estimates over time.
+"""
+import os
+import re
+import json
+import heapq
+import threading
+
+from replica.cache import DEFAULT_CACHE_DIR
+from replica.tiers import TIERS, tier_of
+
+ARM_ID_PATTERN = re.compile(
+    r"/subscriptions/[^/\s\"']+/resourcegroups/[^/\s\"']+/providers/[^\s\"'?#,;)]+",
+    re.IGNORECASE
+)
+REFERENCE_PATTERN = re.compile(
+    r"(?<![\w.])(data\.[A-Za-z0-9_-]+\.[A-Za-z0-9_-]+|module\.[A-Za-z0-9_-]+|local\.[A-Za-z0-9_-]+|"
+    r"[A-Za-z][A-Za-z0-9]*_[A-Za-z0-9_-]+\.[A-Za-z0-9_-]+)"
+)
+
+# When two discovered resources refer to each other (e.g. a subnet lists the NICs in it
+# and each NIC refers to its subnet), the one earlier in this order is created first
+CREATION_ORDER = (
+    "microsoft.network/networksecuritygroups",
+    "microsoft.network/routetables",
+    "microsoft.network/publicipaddresses",
+    "microsoft.network/virtualnetworks",
+    "microsoft.network/networkinterfaces",
+    "microsoft.storage/storageaccounts",
+    "microsoft.sql/servers",
+    "microsoft.sql/servers/databases",
+    "microsoft.documentdb/databaseaccounts",
+    "microsoft.keyvault/vaults",
+    "microsoft.compute/disks",
+    "microsoft.compute/virtualmachines",
+    "microsoft.web/serverfarms",
+    "microsoft.web/sites",
+)
+
+# Typical create times in seconds per Terraform resource type, used until applies have been observed
+DEFAULT_DURATION = 30
+DEFAULT_DURATIONS = {
+    "azurerm_resource_group": 10,
+    "azurerm_virtual_network": 10,
+    "azurerm_subnet": 10,
+    "azurerm_network_security_group": 5,
+    "azurerm_subnet_network_security_group_association": 10,
+    "azurerm_public_ip": 5,
+    "azurerm_network_interface": 10,
+    "azurerm_storage_account": 30,
+    "azurerm_mssql_server": 90,
+    "azurerm_mssql_database": 60,
+    "azurerm_mssql_firewall_rule": 10,
+    "azurerm_cosmosdb_account": 480,
+    "azurerm_key_vault": 180,
+    "azurerm_service_plan": 15,
+    "azurerm_linux_web_app": 45,
+    "azurerm_windows_web_app": 45,
+    "azurerm_linux_function_app": 60,
+    "azurerm_windows_function_app": 60,
+    "azurerm_linux_virtual_machine": 60,
+    "azurerm_windows_virtual_machine": 90,
+    "random_password": 1,
+    "random_string": 1,
+}
+DURATIONS_FILE = "terraform-durations.json"
+TERRAFORM_DEFAULT_PARALLELISM = 10
+# Weight of the latest observation in the running average of a type's duration
+DURATION_SMOOTHING = 0.3
+
+
+class DependencyGraph:
+    """
+    Nodes and the nodes each one depends on.
+    """
+
+    def __init__(self):
+        self.nodes = {}
+        self.dependencies = {}
+
+    def add(self, node: str, kind: str = ""):
+        self.nodes.setdefault(node, kind)
+        self.dependencies.setdefault(node, set())
+
+    def depend(self, node: str, dependency: str):
+        if node != dependency and dependency in self.nodes:
+            self.dependencies[node].add(dependency)
+
+    def dependents(self) -> dict:
+        """
+        Returns {node: [nodes that depend on it]}.
+        """
+        dependents = {node: [] for node in self.nodes}
+        for node, dependencies in self.dependencies.items():
+            for dependency in dependencies:
+                dependents[dependency].append(node)
+        return dependents
+
+    def levels(self) -> tuple:
+        """
+        Returns (levels, cycle): level 0 holds the nodes without dependencies, level n the
+        nodes whose dependencies are all in earlier levels. Nodes on or behind a dependency
+        cycle cannot be placed and are returned as `cycle`.
+        """
+        remaining = {node: len(dependencies) for node, dependencies in self.dependencies.items()}
+        dependents = self.dependents()
+        levels = []
+        current = sorted(node for node, count in remaining.items() if count == 0)
+        while current:
+            levels.append(current)
+            following = []
+            for node in current:
+                for dependent in dependents[node]:
+                    remaining[dependent] -= 1
+                    if remaining[dependent] == 0:
+                        following.append(dependent)
+            current = sorted(following)
+        placed = {node for level in levels for node in level}
+        return levels, sorted(node for node in self.nodes if node not in placed)
+
+    def critical_path(self, weights: dict = None) -> tuple:
+        """
+        Returns (path, length): the chain of dependencies with the largest total weight
+        (default weight 1 per node), from the first node to create to the last.
+        """
+        levels, _ = self.levels()
+        finish, previous = {}, {}
+        for level in levels:
+            for node in level:
+                before = max(sorted(self.dependencies[node]), key=lambda item: finish[item], default=None)
+                start = finish[before] if before is not None else 0
+                finish[node] = start + (weights.get(node, 0) if weights is not None else 1)
+                previous[node] = before
+        if not finish:
+            return [], 0
+        node = max(sorted(finish), key=lambda item: finish[item])
+        length = finish[node]
+        path = []
+        while node is not None:
+            path.append(node)
+            node = previous[node]
+        return path[::-1], length
+
+    def simulate(self, weights: dict, parallelism: int) -> float:
+        """
+        Predicted time to create every node when at most `parallelism` run at once and a
+        node starts as soon as its dependencies are done, as terraform's graph walk does.
+        """
+        remaining = {node: len(dependencies) for node, dependencies in self.dependencies.items()}
+        dependents = self.dependents()
+        ready = sorted(node for node, count in remaining.items() if count == 0)
+        running, now = [], 0.0
+        while ready or running:
+            while ready and len(running) < parallelism:
+                node = ready.pop(0)
+                heapq.heappush(running, (now + weights.get(node, 0), node))
+            now, node = heapq.heappop(running)
+            for dependent in dependents[node]:
+                remaining[dependent] -= 1
+                if remaining[dependent] == 0:
+                    ready.append(dependent)
+        return now
+
+    def summary(self, weights: dict = None) -> dict:
+        levels, cycle = self.levels()
+        path, length = self.critical_path(weights)
+        return {
+            "nodes": len(self.nodes),
+            "edges": sum(len(dependencies) for dependencies in self.dependencies.values()),
+            "levels": levels,
+            "width": max((len(level) for level in levels), default=0),
+            "critical_path": path,
+            "critical_path_length": length,
+            "cycle": cycle,
+        }
+
+
+def _creation_rank(resource_type: str) -> tuple:
+    resource_type = resource_type.lower()
+    if resource_type in CREATION_ORDER:
+        return (CREATION_ORDER.index(resource_type), 0)
+    return (len(CREATION_ORDER), list(TIERS).index(tier_of(resource_type)))
+
+
+def _arm_references(value, found: set):
+    if isinstance(value, dict):
+        for item in value.values():
+            _arm_references(item, found)
+    elif isinstance(value, list):
+        for item in value:
+            _arm_references(item, found)
+    elif isinstance(value, str) and "/providers/" in value.lower():
+        found.update(match.group(0).rstrip("/").lower() for match in ARM_ID_PATTERN.finditer(value))
+
+
+def _owner(resource_id: str, ids: set):
+    """
+    The discovered resource an ARM ID points into: the ID itself or its closest parent.
+    """
+    while resource_id.count("/") > 6:
+        if resource_id in ids:
+            return resource_id
+        resource_id = resource_id.rsplit("/", 2)[0] if resource_id.count("/") > 8 else ""
+    return None
+
+
+def discovery_graph(records: list) -> DependencyGraph:
+    """
+    Builds the graph of discovered resources (ARM records with id, type and properties):
+    a resource depends on every resource whose ID appears in its properties, and a child
+    resource (e.g. a SQL database) on its parent.
+    """
+    graph = DependencyGraph()
+    types = {}
+    for record in records:
+        if "error" not in record:
+            graph.add(record["id"].lower(), record["type"].lower())
+            types[record["id"].lower()] = record["type"].lower()
+    ids = set(types)
+    for record in records:
+        node = record["id"].lower()
+        if node not in ids:
+            continue
+        parent = _owner(node.rsplit("/", 2)[0], ids) if node.count("/") > 8 else None
+        if parent:
+            graph.depend(node, parent)
+        references = set()
+        _arm_references({key: value for key, value in record.items() if key not in ("id", "name", "type")}, references)
+        for reference in references:
+            owner = _owner(reference, ids)
+            if owner and owner != node and not owner.startswith(node + "/"):
+                graph.depend(node, owner)
+    # Back-references (a subnet listing its NICs, a disk naming its VM) make two-node cycles
+    for node, dependencies in graph.dependencies.items():
+        for dependency in list(dependencies):
+            if node in graph.dependencies[dependency]:
+                first = min((node, dependency), key=lambda item: (_creation_rank(types[item]), item))
+                graph.dependencies[first].discard(dependency if first == node else node)
+    return graph
+
+
+def _references(expression: str) -> set:
+    found = set()
+    for match in REFERENCE_PATTERN.finditer(expression):
+        parts = match.group(1).split(".")
+        found.add(".".join(parts[:3] if parts[0] == "data" else parts[:2]))
+    return found
+
+
+def direct_references(configuration) -> dict:
+    """
+    Returns {address: references in its expressions} for the resource, module, data and
+    output blocks of a configuration (an HclIndex), and for each local as "local.<name>".
+    """
+    direct = {}
+    for block_type in ("resource", "module", "data", "output"):
+        for block in configuration.blocks(block_type):
+            references = set()
+            for nested in block.walk():
+                for attribute in nested.attributes.values():
+                    references |= _references(attribute.expression)
+            direct[block.address] = references
+    for block in configuration.blocks("locals"):
+        for name, attribute in block.attributes.items():
+            direct[f"local.{name}"] = _references(attribute.expression)
+    return direct
+
+
+def configuration_references(configuration) -> dict:
+    """
+    Returns {address: resources and modules it refers to} for the blocks and locals of
+    `direct_references`, following references through locals and data sources.
+    """
+    direct = direct_references(configuration)
+    nodes = {block.address for block_type in ("resource", "module") for block in configuration.blocks(block_type)}
+    resolved = {}
+
+    def resolve(reference: str, visiting: set) -> set:
+        # Locals and data sources are not applied; they pass on what they refer to
+        if reference in resolved:
+            return resolved[reference]
+        if reference in visiting:
+            return set()
+        visiting.add(reference)
+        found = set()
+        for item in direct.get(reference, ()):
+            found |= {item} if item in nodes else resolve(item, visiting)
+        visiting.discard(reference)
+        resolved[reference] = found
+        return found
+
+    return {address: resolve(address, set()) for address in direct}
+
+
+def configuration_graph(configuration) -> DependencyGraph:
+    """
+    Builds the apply graph of a configuration (an HclIndex): one node per resource and
+    module block, depending on the resources and modules its expressions refer to,
+    directly or through locals and data sources.
+    """
+    graph = DependencyGraph()
+    for block in configuration.blocks("resource"):
+        graph.add(block.address, block.labels[0])
+    for block in configuration.blocks("module"):
+        graph.add(block.address, "module")
+    references = configuration_references(configuration)
+    for node in graph.nodes:
+        for dependency in references.get(node, ()):
+            graph.depend(node, dependency)
+    return graph
+
+
+def instance_keys(block):
+    """
+    Index suffixes of the instances of a block with a literal `count` ("[0]", "[1]", ...)
+    or `for_each` ('["key"]', ...); None without one or when it is not a literal.
+    """
+    count = block.attributes.get("count")
+    if count is not None:
+        value = count.literal
+        if isinstance(value, bool) or not isinstance(value, int):
+            return None
+        return [f"[{index}]" for index in range(max(0, value))]
+    for_each = block.attributes.get("for_each")
+    if for_each is None:
+        return None
+    items = for_each.object()
+    if items:
+        return [f"[{json.dumps(key)}]" for key in sorted(items)]
+    tokens = [token for token in for_each.tokens if token.kind != "newline"]
+    if [token.value for token in tokens[:2]] == ["toset", "("] and tokens[-1].value == ")":
+        tokens = tokens[2:-1]
+    if len(tokens) < 2 or tokens[0].value != "[" or tokens[-1].value != "]":
+        return None
+    keys = set()
+    for token in tokens[1:-1]:
+        if token.value == ",":
+            continue
+        if token.kind != "string" or "${" in token.value or "%{" in token.value:
+            return None
+        keys.add(re.sub(r"\\(.)", r"\1", token.value[1:-1]))
+    return [f"[{json.dumps(key)}]" for key in sorted(keys)]
+
+
+def instance_graph(configuration, graph: DependencyGraph = None) -> DependencyGraph:
+    """
+    The configuration graph with each resource block that has a literal `count` or
+    `for_each` replaced by its instances; every instance depends on every instance
+    of the blocks its block depends on.
+    """
+    graph = graph or configuration_graph(configuration)
+    instances = {}
+    for block in configuration.blocks("resource"):
+        keys = instance_keys(block)
+        if keys is not None:
+            instances[block.address] = [block.address + key for key in keys]
+    expanded = DependencyGraph()
+    for node, kind in graph.nodes.items():
+        for instance in instances.get(node, [node]):
+            expanded.add(instance, kind)
+    for node, dependencies in graph.dependencies.items():
+        for instance in instances.get(node, [node]):
+            for dependency in dependencies:
+                for target in instances.get(dependency, [dependency]):
+                    expanded.depend(instance, target)
+    return expanded
+
+
+def _durations_path() -> str:
+    return os.path.join(os.getenv("REPLICA_CACHE_DIR", DEFAULT_CACHE_DIR), DURATIONS_FILE)
+
+
+_durations_lock = threading.Lock()
+
+
+def observed_durations() -> dict:
+    """
+    Returns {resource type: seconds} averaged over the applies observed so far.
+    """
+    path = _durations_path()
+    if not os.path.exists(path):
+        return {}
+    try:
+        with open(path) as f:
+            return {resource_type: entry["seconds"] for resource_type, entry in json.load(f).items()}
+    except (OSError, ValueError, KeyError, TypeError):
+        return {}
+
+
+def address_type(address: str) -> str:
+    """
+    The resource type of a Terraform address such as module.app.azurerm_linux_web_app.site[0].
+    """
+    parts = [part for part in re.sub(r"\[[^\]]*\]", "", address).split(".") if part]
+    while parts[:1] == ["module"]:
+        parts = parts[2:]
+    if parts[:1] == ["data"]:
+        parts = parts[1:]
+    return parts[0] if parts else address
+
+
+def record_durations(completed: dict):
+    """
+    Folds the per-resource seconds of an apply ({address: {"action", "seconds"}}) into the
+    per-type running averages. Only creations are counted; updates are much faster.
+    """
+    samples = {}
+    for address, entry in completed.items():
+        if entry.get("action") == "create" and entry.get("seconds") is not None:
+            samples.setdefault(address_type(address), []).append(float(entry["seconds"]))
+    if not samples:
+        return
+    path = _durations_path()
+    with _durations_lock:
+        history = {}
+        if os.path.exists(path):
+            try:
+                with open(path) as f:
+                    history = json.load(f)
+            except (OSError, ValueError):
+                history = {}
+        for name, values in samples.items():
+            entry = history.get(name) or {"seconds": sum(values) / len(values), "samples": 0}
+            for value in values:
+                entry["seconds"] = round(entry["seconds"] + DURATION_SMOOTHING * (value - entry["seconds"]), 2)
+            entry["samples"] += len(values)
+            history[name] = entry
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        temporary = f"{path}.{os.getpid()}.tmp"
+        with open(temporary, "w") as f:
+            json.dump(history, f, indent=2, sort_keys=True)
+        os.replace(temporary, path)
+
+
+def estimate_durations(graph: DependencyGraph, changed=None) -> dict:
+    """
+    Seconds each node is expected to take: observed averages, then the defaults. With
+    `changed` (the addresses a plan creates or updates), every other node takes 0.
+    Instance nodes ("type.name[0]") are matched against the planned instance addresses.
+    """
+    observed = observed_durations()
+    if changed is not None:
+        instances = set(changed)
+        changed = {re.sub(r"\[[^\]]*\]", "", address) for address in changed}
+        changed |= {".".join(address.split(".")[:2]) for address in changed if address.startswith("module.")}
+    weights = {}
+    for node, kind in graph.nodes.items():
+        # Instance nodes of an expanded graph match the planned instance addresses
+        if changed is not None and (node not in instances if node.endswith("]") else node not in changed):
+            weights[node] = 0
+        else:
+            weights[node] = observed.get(kind, DEFAULT_DURATIONS.get(kind, DEFAULT_DURATION))
+    return weights
+
+
+def max_parallelism() -> int:
+    return max(1, int(os.getenv("REPLICA_TF_MAX_PARALLELISM", "20")))
+
+
+def plan_apply(configuration, changed=None, cap: int = None) -> dict:
+    """
+    Chooses `-parallelism` for applying a configuration: its graph is expanded into
+    instances and simulated at every parallelism from terraform's default of 10 up to
+    `cap` (default: REPLICA_TF_MAX_PARALLELISM); the smallest one with the shortest
+    predicted time wins. Only a cap below 10 sets a lower value. Returns the choice with
+    the graph statistics and the predicted seconds at that parallelism and at the default.
+    """
+    blocks = configuration_graph(configuration)
+    graph = instance_graph(configuration, blocks)
+    weights = estimate_durations(graph, changed)
+    summary = graph.summary(weights)
+    width = max((sum(1 for node in level if weights[node]) for level in summary["levels"]), default=0)
+    cap = cap or max_parallelism()
+    changed_count = sum(1 for weight in weights.values() if weight)
+    floor = min(TERRAFORM_DEFAULT_PARALLELISM, cap)
+    # More slots than resources with work to do cannot shorten the apply
+    parallelism, predicted = floor, graph.simulate(weights, floor)
+    for candidate in range(floor + 1, min(cap, max(floor, changed_count)) + 1):
+        seconds = graph.simulate(weights, candidate)
+        if seconds < predicted:
+            parallelism, predicted = candidate, seconds
+    return {
+        "parallelism": parallelism,
+        "cap": cap,
+        "blocks": len(blocks.nodes),
+        "resources": summary["nodes"],
+        "changed": changed_count,
+        "levels": len(summary["levels"]),
+        "width": width,
+        "critical_path": summary["critical_path"],
+        "critical_path_seconds": round(summary["critical_path_length"]),
+        "predicted_seconds": round(predicted),
+        "predicted_seconds_at_default": round(graph.simulate(weights, TERRAFORM_DEFAULT_PARALLELISM)),
+        "cycle": summary["cycle"],
+    }
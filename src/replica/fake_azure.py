@@ -0,0 +1,245 @@
+"""
+Local fake of the Azure endpoints used by the REST discovery backends.
+
+Serves a canned inventory so the Resource Graph backend and the "rest"
+discovery backend can be exercised offline. Run it with:
+
+    python -m replica.fake_azure inventory.json --port 8080
+
+and point the crew at it with REPLICA_ARM_ENDPOINT=http://127.0.0.1:8080
+and REPLICA_ARM_TOKEN=fake.
+
+The inventory file is a JSON object with:
+- "resources": list of ARM resource documents (id, name, type, resourceGroup, properties, ...),
+  returned by Resource Graph queries, resource group / typed listings and GETs by ID;
+  list-valued properties (e.g. a VNet's "subnets") are served as child collections
+- "actions": optional map of ARM path (without query string) -> response body,
+  used for per-item calls such as `<site id>/config/appsettings/list`
+"""
+import re
+import sys
+import json
+import argparse
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
+
+RESOURCE_GRAPH_PATH = "/providers/microsoft.resourcegraph/resources"
+FAKE_API_VERSION = "2023-01-01"
+
+
+class FakeAzureServer:
+    """
+    Threaded HTTP server answering Resource Graph queries and ARM reads from an in-memory inventory.
+    """
+
+    def __init__(self, inventory: dict, host: str = "127.0.0.1", port: int = 0, page_size: int = None,
+                 drop_requests: int = 0):
+        self.inventory = inventory
+        self.page_size = page_size
+        # The next requests to close the connection without answering, as a dropped keep-alive does
+        self.drop_requests = drop_requests
+        self.requests = []
+        self.connections = 0
+        self._server = ThreadingHTTPServer((host, port), self._make_handler())
+        self._thread = None
+
+    @property
+    def endpoint(self) -> str:
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self):
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def query(self, query: str, options: dict) -> dict:
+        """
+        Evaluates the subset of KQL the backends emit: a resource group filter and a type list.
+        """
+        rows = self.inventory.get("resources", [])
+
+        group = re.search(r"resourceGroup\s*=~\s*'([^']*)'", query)
+        if group:
+            rows = [r for r in rows if self._in_group(r, group.group(1))]
+
+        types = re.search(r"type\s+in~\s*\(([^)]*)\)", query)
+        if types:
+            wanted = {t.strip().strip("'").lower() for t in types.group(1).split(",")}
+            rows = [r for r in rows if (r.get("type") or "").lower() in wanted]
+
+        rows = sorted(rows, key=lambda r: r.get("id", "").lower())
+        offset = int(options.get("$skipToken") or 0)
+        size = self.page_size or int(options.get("$top") or 1000)
+        page = rows[offset:offset + size]
+
+        result = {"totalRecords": len(rows), "count": len(page), "data": page}
+        if offset + size < len(rows):
+            result["$skipToken"] = str(offset + size)
+        return result
+
+    def _in_group(self, resource: dict, resource_group: str) -> bool:
+        group = resource.get("resourceGroup")
+        if not group:
+            match = re.search(r"/resourcegroups/([^/]+)/", resource.get("id", "").lower())
+            group = match.group(1) if match else ""
+        return group.lower() == resource_group.lower()
+
+    def _page(self, items: list, path: str, query: dict) -> dict:
+        """
+        Returns one page of an ARM collection with a nextLink when more items remain.
+        """
+        items = sorted(items, key=lambda r: r.get("id", "").lower())
+        offset = int(query.get("$skiptoken", ["0"])[0])
+        size = self.page_size or len(items) or 1
+        result = {"value": items[offset:offset + size]}
+        if offset + size < len(items):
+            result["nextLink"] = f"{self.endpoint}{path}?api-version={FAKE_API_VERSION}&$skiptoken={offset + size}"
+        return result
+
+    def _provider(self, namespace: str) -> dict:
+        """
+        Returns a provider registration listing every type of that namespace found in the inventory.
+        """
+        types = set()
+        for resource in self.inventory.get("resources", []):
+            provider, _, resource_type = resource.get("type", "").partition("/")
+            if provider.lower() == namespace.lower():
+                types.add(resource_type)
+        return {
+            "namespace": namespace,
+            "resourceTypes": [{"resourceType": t, "apiVersions": [FAKE_API_VERSION]} for t in sorted(types)]
+        }
+
+    def resolve(self, method: str, path: str, query: dict = None):
+        """
+        Returns the canned response for an ARM path, or None when unknown.
+        """
+        query = query or {}
+        actions = {k.lower(): v for k, v in self.inventory.get("actions", {}).items()}
+        if path.lower() in actions:
+            return actions[path.lower()]
+
+        if method != "GET":
+            return None
+
+        lower = path.lower().rstrip("/")
+        resources = self.inventory.get("resources", [])
+
+        match = re.fullmatch(r"/subscriptions/[^/]+/providers/([^/]+)", lower)
+        if match:
+            return self._provider(match.group(1))
+
+        match = re.fullmatch(r"/subscriptions/[^/]+/resourcegroups/([^/]+)/resources", lower)
+        if match:
+            return self._page([r for r in resources if self._in_group(r, match.group(1))], path, query)
+
+        match = re.fullmatch(r"/subscriptions/[^/]+/resourcegroups/([^/]+)/providers/([^/]+/[^/]+)", lower)
+        if match:
+            items = [
+                r for r in resources
+                if self._in_group(r, match.group(1)) and r.get("type", "").lower() == match.group(2)
+            ]
+            return self._page(items, path, query)
+
+        for resource in resources:
+            if resource.get("id", "").lower() == lower:
+                return resource
+
+        # Child collection such as <vnet id>/subnets, served from the parent's properties
+        parent_id, _, collection = lower.rpartition("/")
+        for resource in resources:
+            if resource.get("id", "").lower() == parent_id:
+                for key, value in (resource.get("properties") or {}).items():
+                    if key.lower() == collection and isinstance(value, list):
+                        return self._page(value, path, query)
+        return None
+
+    def _make_handler(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            # HTTP/1.1 keeps connections open so clients can pool them
+            protocol_version = "HTTP/1.1"
+            disable_nagle_algorithm = True
+
+            def setup(self):
+                super().setup()
+                server.connections += 1
+
+            def _reply(self, status: int, body: dict):
+                payload = json.dumps(body).encode()
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(payload)))
+                self.end_headers()
+                self.wfile.write(payload)
+
+            def _handle(self, method: str):
+                parsed = urlparse(self.path)
+                path = parsed.path
+                length = int(self.headers.get("Content-Length") or 0)
+                body = json.loads(self.rfile.read(length)) if length else {}
+                server.requests.append((method, path))
+
+                if server.drop_requests > 0:
+                    server.drop_requests -= 1
+                    self.close_connection = True
+                    return
+
+                if method == "POST" and path.lower() == RESOURCE_GRAPH_PATH:
+                    self._reply(200, server.query(body.get("query", ""), body.get("options") or {}))
+                    return
+
+                response = server.resolve(method, path, parse_qs(parsed.query))
+                if response is None:
+                    self._reply(404, {"error": {"code": "ResourceNotFound", "message": f"{path} not found"}})
+                else:
+                    self._reply(200, response)
+
+            def do_GET(self):
+                self._handle("GET")
+
+            def do_POST(self):
+                self._handle("POST")
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Serve a fake Azure inventory for offline discovery")
+    parser.add_argument("inventory", help="path to the inventory JSON file")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument("--page-size", type=int, default=None, help="force small pages to exercise pagination")
+    args = parser.parse_args(argv)
+
+    with open(args.inventory) as f:
+        inventory = json.load(f)
+
+    server = FakeAzureServer(inventory, host=args.host, port=args.port, page_size=args.page_size)
+    print(f"Fake Azure endpoint listening on {server.endpoint}")
+    try:
+        server._server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server._server.server_close()
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,213 @@
+"""
+Per-run request coalescing for Azure reads.
+
+All discovery tools read Azure through one Fetcher. Identical `az` commands
+and ARM resource reads are executed once per run; concurrent callers asking
+for the same key wait on the single in-flight call instead of issuing their
+own. Full resource documents fetched by one tool (e.g. the scanner's
+`az resource show`) are reused by the others (e.g. the mapper's VM, storage
+and key vault lookups).
+
+Resource and network reads go through the backend selected with
+REPLICA_DISCOVERY_BACKEND (see replica.backends); raw `az` commands always
+use the CLI.
+"""
+import time
+import threading
+from concurrent.futures import Future
+
+from replica.backends import make_backend, run_az_json
+
+
+class Fetcher:
+    """
+    Memoizes reads by key for the lifetime of a run and coalesces concurrent identical reads.
+    Failed reads are not memoized, so a later caller retries them.
+    """
+
+    def __init__(self, backend=None):
+        self.backend = backend or make_backend()
+        self._lock = threading.Lock()
+        self._results = {}
+        self._inflight = {}
+        self.stats = {"requests": 0, "calls": 0, "memo_hits": 0, "coalesced": 0}
+
+    def _claim(self, key):
+        """
+        Returns (future, owner): owner is True when the caller must perform the read.
+        Must be called with the lock held.
+        """
+        if key in self._results:
+            self.stats["memo_hits"] += 1
+            future = Future()
+            future.set_result(self._results[key])
+            return future, False
+        if key in self._inflight:
+            self.stats["coalesced"] += 1
+            return self._inflight[key], False
+        future = Future()
+        self._inflight[key] = future
+        self.stats["calls"] += 1
+        return future, True
+
+    def _resolve(self, key, future, value=None, error=None):
+        with self._lock:
+            self._inflight.pop(key, None)
+            if error is None:
+                self._results[key] = value
+        if error is None:
+            future.set_result(value)
+        else:
+            future.set_exception(error)
+
+    def fetch(self, key, loader):
+        """
+        Returns the value for key, calling loader() only if nobody has read or is reading it.
+        """
+        with self._lock:
+            self.stats["requests"] += 1
+            future, owner = self._claim(key)
+
+        if owner:
+            try:
+                value = loader()
+            except Exception as e:
+                self._resolve(key, future, error=e)
+                raise
+            self._resolve(key, future, value)
+
+        return future.result()
+
+    def fetch_many(self, keys: list, loader) -> dict:
+        """
+        Resolves several keys at once. loader(missing_keys) is called for the keys
+        nobody else holds and must return a dict key -> value; keys it leaves out
+        are reported as KeyError. Returns a dict key -> value or Exception.
+        """
+        owned = []
+        futures = {}
+        with self._lock:
+            for key in keys:
+                self.stats["requests"] += 1
+                future, owner = self._claim(key)
+                futures[key] = future
+                if owner:
+                    owned.append(key)
+
+        if owned:
+            try:
+                values = loader(owned)
+            except Exception as e:
+                values = {}
+                batch_error = e
+            else:
+                batch_error = None
+            for key in owned:
+                if key in values:
+                    self._resolve(key, futures[key], values[key])
+                else:
+                    self._resolve(key, futures[key], error=batch_error or KeyError(key))
+
+        results = {}
+        for key, future in futures.items():
+            try:
+                results[key] = future.result()
+            except Exception as e:
+                results[key] = e
+        return results
+
+    def outcome(self, key, loader) -> dict:
+        """
+        Like fetch(), but returns {'data', 'error', 'seconds'} instead of raising,
+        where seconds is the time this caller waited.
+        """
+        start = time.perf_counter()
+        try:
+            data, error = self.fetch(key, loader), None
+        except Exception as e:
+            data, error = None, str(e)
+        return {'data': data, 'error': error, 'seconds': round(time.perf_counter() - start, 3)}
+
+    def az_json(self, cmd: str) -> dict:
+        """
+        Runs an `az` command at most once per run, whatever the selected backend.
+        """
+        return self.outcome(("az", " ".join(cmd.split())), lambda: run_az_json(cmd))
+
+    def list_resources(self, resource_group: str) -> dict:
+        """
+        Lists the resources of a group (the `az resource list` output) at most once per run.
+        """
+        return self.outcome(("resources", resource_group.lower()), lambda: self.backend.list_resources(resource_group))
+
+    def list_network(self, resource_group: str, kind: str) -> dict:
+        """
+        Lists one kind of network resource (see backends.NETWORK_KINDS) at most once per run.
+        """
+        return self.outcome(
+            ("network", kind, resource_group.lower()),
+            lambda: self.backend.list_network(resource_group, kind)
+        )
+
+    def list_network_children(self, resource_group: str, kind: str, parent: dict) -> dict:
+        """
+        Lists the subnets of a VNet or the rules of an NSG at most once per run.
+        """
+        return self.outcome(
+            ("network", kind, parent['id'].lower()),
+            lambda: self.backend.list_network_children(resource_group, kind, parent)
+        )
+
+    def get_resource(self, resource_id: str):
+        """
+        Returns the full ARM document of a resource, read at most once per run.
+        """
+        return self.fetch(("resource", resource_id.lower()), lambda: self.backend.show_resource(resource_id))
+
+    def get_resources(self, resource_ids: list) -> dict:
+        """
+        Returns {lowercased id: document or Exception} reading all missing IDs in one
+        backend batch. IDs missing from a failed or partial batch are reported as
+        errors so the caller can fall back to get_resource().
+        """
+        original_ids = {rid.lower(): rid for rid in resource_ids}
+
+        def load(keys):
+            details = self.backend.show_resources([original_ids[key[1]] for key in keys])
+            return {("resource", d["id"].lower()): d for d in details if d and d.get("id")}
+
+        results = self.fetch_many([("resource", rid.lower()) for rid in resource_ids], load)
+        return {key[1]: value for key, value in results.items()}
+
+    def release_resources(self, resource_ids: list):
+        """
+        Drops memoized resource documents, e.g. once streaming discovery has written them out.
+        """
+        with self._lock:
+            for resource_id in resource_ids:
+                self._results.pop(("resource", resource_id.lower()), None)
+
+
+_fetcher = None
+_fetcher_lock = threading.Lock()
+
+
+def get_fetcher() -> Fetcher:
+    """
+    Returns the fetcher of the current run.
+    """
+    global _fetcher
+    with _fetcher_lock:
+        if _fetcher is None:
+            _fetcher = Fetcher()
+        return _fetcher
+
+
+def reset_fetcher() -> Fetcher:
+    """
+    Starts a new run: drops everything memoized by the previous one.
+    """
+    global _fetcher
+    with _fetcher_lock:
+        _fetcher = Fetcher()
+        return _fetcher
@@ -0,0 +1,397 @@
+"""
+Minimal HCL reading helpers.
+
+A single-pass tokenizer and parser for Terraform files. Strings, comments and
+heredocs are recognised by the tokenizer, so braces inside them do not count.
+Blocks keep their labels, attributes and nested blocks; attribute values are
+kept as source text and only interpreted when they are literals or object
+constructors. Expressions are never evaluated.
+
+`load_configuration` parses every .tf file of a directory once and returns an
+index that validation checks query instead of re-reading and re-scanning files.
+"""
+import os
+import re
+import bisect
+import hashlib
+
+HEREDOC_PATTERN = re.compile(r"<<-?([A-Za-z_][A-Za-z0-9_]*)\n")
+IDENT_PATTERN = re.compile(r"[A-Za-z_][A-Za-z0-9_-]*")
+NUMBER_PATTERN = re.compile(r"[0-9]+(\.[0-9]+)?([eE][+-]?[0-9]+)?")
+OPERATORS = ("==", "!=", "<=", ">=", "&&", "||", "=>", "...")
+OPENING, CLOSING = "([{", ")]}"
+
+
+class HclError(ValueError):
+    """
+    Raised for text that is not valid HCL structure.
+    """
+
+
+class Token:
+    """
+    One lexical token: kind is ident, string, heredoc, number, newline or punct.
+    """
+    __slots__ = ("kind", "value", "start", "end", "line")
+
+    def __init__(self, kind: str, value: str, start: int, end: int, line: int):
+        self.kind = kind
+        self.value = value
+        self.start = start
+        self.end = end
+        self.line = line
+
+    def __repr__(self):
+        return f"Token({self.kind}, {self.value!r}, line {self.line})"
+
+
+class HclAttribute:
+    """
+    `name = expression`; the expression is kept as tokens and source text.
+    """
+
+    def __init__(self, name: str, tokens: list, source: str, line: int):
+        self.name = name
+        self.tokens = tokens
+        self.line = line
+        self.expression = source[tokens[0].start:tokens[-1].end]
+        self._source = source
+
+    @property
+    def literal(self):
+        """
+        The value of a string without interpolations, a number or a bool; None for anything else.
+        """
+        if len(self.tokens) != 1:
+            return None
+        token = self.tokens[0]
+        if token.kind == "string" and "${" not in token.value and "%{" not in token.value:
+            return re.sub(r"\\(.)", r"\1", token.value[1:-1])
+        if token.kind == "number":
+            return float(token.value) if re.search(r"[.eE]", token.value) else int(token.value)
+        if token.kind == "ident" and token.value in ("true", "false"):
+            return token.value == "true"
+        return None
+
+    def object(self) -> dict:
+        """
+        Items of an object constructor value ({ key = value, ... }) as {key: HclAttribute}; {} otherwise.
+        """
+        if not self.tokens or self.tokens[0].value != "{" or self.tokens[-1].value != "}":
+            return {}
+        items = {}
+        inner = self.tokens[1:-1]
+        index = 0
+        while index < len(inner):
+            token = inner[index]
+            if token.kind == "newline" or token.value == ",":
+                index += 1
+                continue
+            if index + 1 >= len(inner) or inner[index + 1].value not in ("=", ":"):
+                return {}
+            key = token.value[1:-1] if token.kind == "string" else token.value
+            end = _expression_end(inner, index + 2, separators=(",",))
+            if end == index + 2:
+                return {}
+            items[key] = HclAttribute(key, inner[index + 2:end], self._source, token.line)
+            index = end
+        return items
+
+
+class HclBlock:
+    """
+    One block: its type, labels, attributes and nested blocks. `text` is the exact
+    source of a top-level block, with the comments that precede it.
+    """
+
+    def __init__(self, block_type: str, labels: list, text: str, attributes: dict = None, blocks: list = None,
+                 line: int = 0, file: str = ""):
+        self.block_type = block_type
+        self.labels = labels
+        self.text = text
+        self.attributes = attributes or {}
+        self.blocks = blocks or []
+        self.line = line
+        self.file = file
+
+    @property
+    def address(self) -> str:
+        """
+        Terraform address of resource and data blocks ("type.name" / "data.type.name"), else "type.labels".
+        """
+        if self.block_type == "resource":
+            return ".".join(self.labels)
+        return ".".join([self.block_type] + self.labels)
+
+    def nested(self, block_type: str) -> list:
+        """
+        Direct child blocks of the given type.
+        """
+        return [block for block in self.blocks if block.block_type == block_type]
+
+    def walk(self):
+        """
+        Yields this block and all blocks nested in it, depth first.
+        """
+        yield self
+        for block in self.blocks:
+            yield from block.walk()
+
+
+class HclFile:
+    """
+    A parsed file: its top-level blocks and attributes (as in .tfvars files) and its source.
+    """
+
+    def __init__(self, name: str, blocks: list, attributes: dict, source: str = ""):
+        self.name = name
+        self.blocks = blocks
+        self.attributes = attributes
+        self.source = source
+
+
+def _skip_string(text: str, index: int) -> int:
+    """
+    Returns the index after the string starting at text[index] (a double quote).
+    Template interpolations may nest further strings.
+    """
+    index += 1
+    depth = 0
+    while index < len(text):
+        char = text[index]
+        if char == "\\":
+            index += 2
+            continue
+        if char == '"' and depth == 0:
+            return index + 1
+        if text.startswith("${", index) or text.startswith("%{", index):
+            depth += 1
+            index += 2
+            continue
+        if char == "}" and depth:
+            depth -= 1
+        elif char == '"' and depth:
+            index = _skip_string(text, index)
+            continue
+        if char == "\n" and depth == 0:
+            break
+        index += 1
+    raise HclError("unterminated string")
+
+
+def tokenize(text: str) -> list:
+    """
+    Splits HCL source into tokens in one pass; comments are dropped, newlines are kept
+    because they end attributes.
+    """
+    line_starts = [0] + [match.end() for match in re.finditer("\n", text)]
+    tokens = []
+    index = 0
+    length = len(text)
+
+    def line_of(offset):
+        return bisect.bisect_right(line_starts, offset)
+
+    while index < length:
+        char = text[index]
+        if char in " \t\r":
+            index += 1
+        elif char == "\n":
+            tokens.append(Token("newline", "\n", index, index + 1, line_of(index)))
+            index += 1
+        elif char == "#" or text.startswith("//", index):
+            end = text.find("\n", index)
+            index = length if end == -1 else end
+        elif text.startswith("/*", index):
+            end = text.find("*/", index + 2)
+            if end == -1:
+                raise HclError(f"line {line_of(index)}: unterminated comment")
+            index = end + 2
+        elif char == '"':
+            try:
+                end = _skip_string(text, index)
+            except HclError:
+                raise HclError(f"line {line_of(index)}: unterminated string")
+            tokens.append(Token("string", text[index:end], index, end, line_of(index)))
+            index = end
+        elif text.startswith("<<", index) and HEREDOC_PATTERN.match(text, index):
+            heredoc = HEREDOC_PATTERN.match(text, index)
+            end = re.compile(r"^\s*" + re.escape(heredoc.group(1)) + r"\s*$", re.MULTILINE).search(text, heredoc.end())
+            if end is None:
+                raise HclError(f"line {line_of(index)}: unterminated heredoc {heredoc.group(1)}")
+            close = end.end() - len(end.group(0)) + len(end.group(0).rstrip())
+            tokens.append(Token("heredoc", text[index:close], index, close, line_of(index)))
+            index = close
+        elif IDENT_PATTERN.match(text, index):
+            match = IDENT_PATTERN.match(text, index)
+            tokens.append(Token("ident", match.group(0), index, match.end(), line_of(index)))
+            index = match.end()
+        elif char.isdigit():
+            match = NUMBER_PATTERN.match(text, index)
+            tokens.append(Token("number", match.group(0), index, match.end(), line_of(index)))
+            index = match.end()
+        else:
+            operator = next((op for op in OPERATORS if text.startswith(op, index)), char)
+            tokens.append(Token("punct", operator, index, index + len(operator), line_of(index)))
+            index += len(operator)
+    return tokens
+
+
+def _expression_end(tokens: list, index: int, separators: tuple = ()) -> int:
+    """
+    Returns the index after the expression starting at tokens[index]: it ends at a newline,
+    a separator or an unmatched closing bracket outside brackets.
+    """
+    depth = 0
+    while index < len(tokens):
+        token = tokens[index]
+        if token.kind == "punct" and token.value in OPENING:
+            depth += 1
+        elif token.kind == "punct" and token.value in CLOSING:
+            if depth == 0:
+                break
+            depth -= 1
+        elif depth == 0 and (token.kind == "newline" or token.value in separators):
+            break
+        index += 1
+    if depth:
+        raise HclError(f"line {tokens[index - 1].line}: unclosed bracket")
+    return index
+
+
+def _parse_body(tokens: list, index: int, source: str, file: str, opened: Token = None):
+    """
+    Parses attributes and blocks until the brace closing the block opened by `opened`
+    (or the end of the file for the top level). Returns (attributes, blocks, index after the body).
+    """
+    top_level = opened is None
+    attributes, blocks = {}, []
+    previous_end = 0
+    while index < len(tokens):
+        token = tokens[index]
+        if token.kind == "newline":
+            index += 1
+            continue
+        if token.value == "}" and token.kind == "punct":
+            if top_level:
+                raise HclError(f"line {token.line}: unbalanced braces")
+            return attributes, blocks, index + 1
+        if token.kind != "ident":
+            raise HclError(f"line {token.line}: expected an attribute or block, found {token.value!r}")
+
+        following = tokens[index + 1] if index + 1 < len(tokens) else None
+        if following is not None and following.value == "=":
+            end = _expression_end(tokens, index + 2)
+            if end == index + 2:
+                raise HclError(f"line {token.line}: attribute {token.value} has no value")
+            attributes[token.value] = HclAttribute(token.value, tokens[index + 2:end], source, token.line)
+            previous_end = tokens[end - 1].end
+            index = end
+            continue
+
+        labels = []
+        cursor = index + 1
+        while cursor < len(tokens) and tokens[cursor].kind in ("string", "ident"):
+            label = tokens[cursor]
+            labels.append(label.value[1:-1] if label.kind == "string" else label.value)
+            cursor += 1
+        if cursor >= len(tokens) or tokens[cursor].value != "{":
+            raise HclError(f"line {token.line}: expected '{{' after {token.value} block header")
+        body_attributes, body_blocks, after = _parse_body(tokens, cursor + 1, source, file, opened=token)
+        end = tokens[after - 1].end
+        text = source[previous_end if top_level else token.start:end].strip("\n")
+        blocks.append(HclBlock(token.value, labels, text, body_attributes, body_blocks, token.line, file))
+        previous_end = end
+        index = after
+    if not top_level:
+        raise HclError(f"line {opened.line}: {opened.value} block is never closed")
+    return attributes, blocks, index
+
+
+def parse(text: str, name: str = "") -> HclFile:
+    """
+    Parses an HCL document into its top-level blocks and attributes.
+    """
+    tokens = tokenize(text)
+    attributes, blocks, _ = _parse_body(tokens, 0, text, name)
+    return HclFile(name, blocks, attributes, text)
+
+
+def split_blocks(text: str) -> list:
+    """
+    Returns the top-level blocks of an HCL document, in order. Top-level
+    attributes (as in .tfvars files) are ignored.
+    """
+    return parse(text).blocks
+
+
+class HclIndex:
+    """
+    All .tf files of a configuration, parsed once and indexed by block type,
+    resource type, address and attribute name.
+    """
+
+    def __init__(self, files: dict, errors: list):
+        self.files = files
+        self.errors = errors
+        self.by_type = {}
+        self.by_address = {}
+        self.by_resource_type = {}
+        self.by_attribute = {}
+        for hcl_file in files.values():
+            for block in hcl_file.blocks:
+                self.by_type.setdefault(block.block_type, []).append(block)
+                self.by_address.setdefault(block.address, block)
+                if block.block_type == "resource" and block.labels:
+                    self.by_resource_type.setdefault(block.labels[0], []).append(block)
+                for nested in block.walk():
+                    for attribute in nested.attributes.values():
+                        self.by_attribute.setdefault(attribute.name, []).append((block, nested, attribute))
+
+    def blocks(self, block_type: str) -> list:
+        return self.by_type.get(block_type, [])
+
+    def resources(self, resource_type: str = None) -> list:
+        if resource_type is None:
+            return self.blocks("resource")
+        return self.by_resource_type.get(resource_type, [])
+
+    def attributes(self, name: str, block_type: str = None) -> list:
+        """
+        Returns (top-level block, block holding the attribute, attribute) for every attribute
+        with this name, at any nesting depth, optionally only under top-level blocks of a type.
+        """
+        found = self.by_attribute.get(name, [])
+        if block_type is None:
+            return found
+        return [entry for entry in found if entry[0].block_type == block_type]
+
+
+def load_configuration(directory: str, cache: dict = None) -> HclIndex:
+    """
+    Reads and parses every .tf file of a directory once. Files that do not parse are
+    left out of the index and reported in `errors` as (file, message). With a `cache`
+    dict, parse results are kept there by file name and content hash and reused.
+    """
+    files, errors = {}, []
+    for name in sorted(os.listdir(directory)):
+        path = os.path.join(directory, name)
+        if not name.endswith(".tf") or not os.path.isfile(path):
+            continue
+        with open(path) as f:
+            text = f.read()
+        key = (name, hashlib.sha256(text.encode()).hexdigest())
+        if cache is not None and key in cache:
+            parsed = cache[key]
+        else:
+            try:
+                parsed = parse(text, name)
+            except HclError as e:
+                parsed = e
+            if cache is not None:
+                cache[key] = parsed
+        if isinstance(parsed, HclError):
+            errors.append((name, str(parsed)))
+        else:
+            files[name] = parsed
+    return HclIndex(files, errors)
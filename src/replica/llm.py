@@ -0,0 +1,54 @@
+"""
+LLM used by every agent of the crew.
+
+A thin subclass of crewAI's LLM so cross-cutting concerns around completions
+live in one place:
+
+- completions are looked up in the content-addressed completion cache first,
+  and new ones are stored there
+- each call that reaches the model holds a slot of the "llm" limit of the
+  shared runner, which batch mode sets to a semaphore shared by all worker
+  processes
+- every call is recorded in the usage ledger under the task and agent that
+  made it, with its latency and token counts
+"""
+import time
+
+from crewai import LLM
+
+from replica.llm_cache import completion_identity, get_completion_cache
+from replica.runner import get_runner
+from replica.usage import count_tokens, get_usage_ledger
+
+
+class ReplicaLLM(LLM):
+    """
+    crewAI LLM with a completion cache whose calls respect the shared "llm" concurrency limit.
+    """
+
+    def call(self, messages, tools=None, callbacks=None, available_functions=None, from_task=None,
+             from_agent=None, *args, **kwargs):
+        cache = get_completion_cache()
+        ledger = get_usage_ledger()
+        # With available_functions the LLM runs the requested tool itself, which must not be skipped
+        identity = None if available_functions else completion_identity(self, messages, tools)
+        if identity is None:
+            cache.skipped()
+        else:
+            cached = cache.get(identity)
+            if cached is not None:
+                ledger.record(from_task, from_agent, cache_hit=True)
+                return cached
+
+        with get_runner().shared_slot("llm"):
+            started = time.monotonic()
+            response = super().call(messages, tools, callbacks, available_functions, from_task, from_agent,
+                                    *args, **kwargs)
+            seconds = time.monotonic() - started
+
+        prompt_tokens = count_tokens(self.model, messages=identity["messages"] if identity else messages)
+        completion_tokens = count_tokens(self.model, text=response if isinstance(response, str) else str(response))
+        ledger.record(from_task, from_agent, seconds, prompt_tokens, completion_tokens)
+        if identity is not None and isinstance(response, str) and response.strip():
+            cache.set(identity, response, prompt_tokens, completion_tokens)
+        return response
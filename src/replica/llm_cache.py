@@ -0,0 +1,143 @@
+"""
+Content-addressed cache of LLM completions.
+
+A completion is keyed on a hash of the model, the messages, the tool schemas
+and the sampling parameters, so re-runs after a failed deployment, `replay`
+and `test` answer prompts they have already seen from disk. Entries live in
+their own SQLite database next to the discovery cache and reuse its TTL and
+size-bounded LRU eviction.
+
+In strict mode a prompt that is not cached raises CompletionCacheMiss instead
+of calling the model, which keeps test and replay runs reproducible and free.
+"""
+import os
+import json
+import hashlib
+import threading
+
+from replica.cache import DiscoveryCache, DEFAULT_CACHE_DIR, MODE_ENABLED, MODE_REFRESH, MODE_DISABLED
+from replica.usage import count_tokens
+
+MODE_STRICT = "strict"  # read only; a miss is an error
+
+# Parameters of crewAI's LLM that change the completion
+SAMPLING_PARAMETERS = (
+    "temperature", "top_p", "n", "stop", "max_tokens", "max_completion_tokens", "presence_penalty",
+    "frequency_penalty", "logit_bias", "response_format", "seed", "reasoning_effort",
+)
+
+
+class CompletionCacheMiss(LookupError):
+    """
+    Raised in strict mode when a prompt has no cached completion.
+    """
+
+
+def completion_identity(llm, messages, tools=None) -> dict:
+    """
+    Returns everything that determines a completion; secrets, endpoints and timeouts are left out.
+    """
+    if isinstance(messages, str):
+        messages = [{"role": "user", "content": messages}]
+    identity = {"model": llm.model, "messages": messages, "tools": tools or []}
+    for name in SAMPLING_PARAMETERS:
+        value = getattr(llm, name, None)
+        if value not in (None, [], {}):
+            identity[name] = value
+    return identity
+
+
+class CompletionCache:
+    """
+    LLM completion cache on top of a DiscoveryCache database, with hit-rate and saved-token counters.
+    """
+
+    def __init__(self, store: DiscoveryCache, strict: bool = False):
+        self.store = store
+        self.strict = strict
+        self.stats = {"saved_prompt_tokens": 0, "saved_completion_tokens": 0, "uncacheable": 0}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def digest(identity: dict) -> str:
+        text = json.dumps(identity, sort_keys=True, separators=(",", ":"), default=str)
+        return hashlib.sha256(text.encode()).hexdigest()
+
+    def get(self, identity: dict):
+        """
+        Returns the cached completion text or None; in strict mode a miss raises CompletionCacheMiss.
+        """
+        digest = self.digest(identity)
+        entry = self.store.get("", "", "completion", {"digest": digest})
+        if entry is None:
+            if self.strict:
+                raise CompletionCacheMiss(
+                    f"No cached completion for prompt {digest[:12]} ({identity['model']}); "
+                    f"run once with REPLICA_LLM_CACHE=enabled to record it"
+                )
+            return None
+
+        with self._lock:
+            self.stats["saved_prompt_tokens"] += entry["prompt_tokens"]
+            self.stats["saved_completion_tokens"] += entry["completion_tokens"]
+        return entry["response"]
+
+    def set(self, identity: dict, response: str, prompt_tokens: int = None, completion_tokens: int = None):
+        if self.strict:
+            return
+        if prompt_tokens is None:
+            prompt_tokens = count_tokens(identity["model"], messages=identity["messages"])
+        if completion_tokens is None:
+            completion_tokens = count_tokens(identity["model"], text=response)
+        entry = {"response": response, "prompt_tokens": prompt_tokens, "completion_tokens": completion_tokens}
+        self.store.set("", "", "completion", {"digest": self.digest(identity)}, entry)
+
+    def skipped(self):
+        """
+        Counts a call that could not be cached (e.g. native tool calls with side effects).
+        """
+        with self._lock:
+            self.stats["uncacheable"] += 1
+
+    def summary(self) -> dict:
+        """
+        Returns the store's hit/miss counters together with the tokens saved by hits.
+        """
+        summary = self.store.summary()
+        summary.update(self.stats)
+        if self.strict:
+            summary["mode"] = MODE_STRICT
+        return summary
+
+
+_completion_cache = None
+
+
+def configure_completion_cache(mode: str = None) -> CompletionCache:
+    """
+    Creates the process-wide completion cache from REPLICA_LLM_CACHE (enabled, refresh,
+    disabled or strict) and the REPLICA_LLM_CACHE_* size and TTL settings.
+    """
+    global _completion_cache
+    mode = (mode or os.getenv("REPLICA_LLM_CACHE", MODE_ENABLED)).lower()
+    if mode not in (MODE_ENABLED, MODE_REFRESH, MODE_DISABLED, MODE_STRICT):
+        raise ValueError(f"unknown LLM cache mode {mode!r}")
+
+    cache_dir = os.getenv("REPLICA_CACHE_DIR", DEFAULT_CACHE_DIR)
+    store = DiscoveryCache(
+        os.path.join(cache_dir, "completions.sqlite3"),
+        default_ttl=float(os.getenv("REPLICA_LLM_CACHE_TTL", str(30 * 24 * 3600))),
+        max_bytes=int(os.getenv("REPLICA_LLM_CACHE_MAX_BYTES", str(64 * 1024 * 1024))),
+        mode=MODE_ENABLED if mode == MODE_STRICT else mode
+    )
+    _completion_cache = CompletionCache(store, strict=mode == MODE_STRICT)
+    return _completion_cache
+
+
+def get_completion_cache() -> CompletionCache:
+    """
+    Returns the process-wide completion cache, creating it from the environment on first use.
+    """
+    if _completion_cache is None:
+        return configure_completion_cache()
+    return _completion_cache
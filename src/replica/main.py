@@ -1,16 +1,202 @@
 #!/usr/bin/env python
+import os
 import sys
 import warnings
 from datetime import datetime
 from replica.crew import Replica
+from replica.fetcher import reset_fetcher
+from replica.metrics import latency_summary
+from replica.runner import get_runner
+from replica.compaction import compaction_summary
+from replica.batch import load_jobs, run_batch, summary_table
+from replica.cache import configure_cache, get_cache, MODE_ENABLED, MODE_REFRESH, MODE_DISABLED
+from replica.llm_cache import configure_completion_cache, get_completion_cache, MODE_STRICT
+from replica.usage import get_usage_ledger, provider_usage, task_durations
 
 warnings.filterwarnings("ignore", category=SyntaxWarning, module="pysbd")
 
+
+def _configure_cache_from_argv():
+    """
+    Removes --no-cache / --refresh from sys.argv and configures the discovery cache.
+    --no-cache bypasses the cache entirely, --refresh ignores cached entries but stores fresh ones.
+    """
+    mode = MODE_ENABLED
+    if "--no-cache" in sys.argv:
+        mode = MODE_DISABLED
+    elif "--refresh" in sys.argv:
+        mode = MODE_REFRESH
+    sys.argv[:] = [arg for arg in sys.argv if arg not in ("--no-cache", "--refresh")]
+    return configure_cache(mode)
+
+
+def _configure_llm_cache_from_argv():
+    """
+    Removes --no-llm-cache / --strict-llm-cache from sys.argv and configures the LLM completion cache.
+    --strict-llm-cache answers only from cached completions and fails on any prompt not seen before.
+    The mode is exported as REPLICA_LLM_CACHE so batch worker processes inherit it.
+    """
+    mode = os.getenv("REPLICA_LLM_CACHE", MODE_ENABLED)
+    if "--no-llm-cache" in sys.argv:
+        mode = MODE_DISABLED
+    elif "--strict-llm-cache" in sys.argv:
+        mode = MODE_STRICT
+    sys.argv[:] = [arg for arg in sys.argv if arg not in ("--no-llm-cache", "--strict-llm-cache")]
+    os.environ["REPLICA_LLM_CACHE"] = mode
+    return configure_completion_cache(mode)
+
+
+def _append_report_section(title, lines, report_path="deployment_report.md"):
+    """
+    Appends a statistics section to the deployment report if the crew produced one.
+    """
+    if not os.path.exists(report_path):
+        return
+    with open(report_path, "a") as f:
+        f.write(f"\n\n## {title}\n\n")
+        f.write("\n".join(lines) + "\n")
+
+
+def _cache_report_lines():
+    """
+    Formats the discovery cache counters for the console summary and the report.
+    """
+    stats = get_cache().summary()
+    return [
+        f"- Mode: {stats['mode']}",
+        f"- Hits: {stats['hits']}",
+        f"- Misses: {stats['misses']} ({stats['expired']} expired)",
+        f"- Hit rate: {stats['hit_rate']}%",
+        f"- Writes: {stats['writes']}",
+        f"- Evictions: {stats['evictions']}",
+    ]
+
+
+def _llm_cache_report_lines():
+    """
+    Formats the LLM completion cache counters, including the tokens hits did not have to pay for.
+    """
+    stats = get_completion_cache().summary()
+    return [
+        f"- Mode: {stats['mode']}",
+        f"- Hits: {stats['hits']}",
+        f"- Misses: {stats['misses']} ({stats['expired']} expired)",
+        f"- Hit rate: {stats['hit_rate']}%",
+        f"- Tokens saved: {stats['saved_prompt_tokens']} prompt, {stats['saved_completion_tokens']} completion",
+        f"- Uncacheable calls: {stats['uncacheable']}",
+        f"- Writes: {stats['writes']}",
+        f"- Evictions: {stats['evictions']}",
+    ]
+
+
+def _task_usage_report_lines(crew=None):
+    """
+    Formats the LLM calls of each task and agent: cache hits, model latency, tokens
+    (counted offline) and the task's wall-clock time when the crew is known.
+    """
+    durations = task_durations(crew.tasks) if crew is not None else {}
+    lines = []
+    for task, agent, stats in get_usage_ledger().by_task():
+        duration = f", task {durations[task]:.1f} s" if task in durations else ""
+        lines.append(
+            f"- {task} ({agent}): {stats['calls']} calls ({stats['cache_hits']} from cache), "
+            f"LLM {stats['seconds']:.1f} s{duration}, "
+            f"{stats['prompt_tokens']} prompt / {stats['completion_tokens']} completion tokens"
+        )
+    return lines or ["- no LLM calls made"]
+
+
+def _agent_usage_report_lines(crew=None):
+    """
+    Formats the token counts the provider reported per agent, including the prompt tokens
+    it served from its prompt cache.
+    """
+    lines = []
+    for agent, stats in provider_usage(crew.agents if crew is not None else []).items():
+        cached = round(stats['cached_prompt_tokens'] * 100 / stats['prompt_tokens']) if stats['prompt_tokens'] else 0
+        lines.append(
+            f"- {agent}: {stats['requests']} requests, {stats['prompt_tokens']} prompt tokens "
+            f"({stats['cached_prompt_tokens']} cached, {cached}%), {stats['completion_tokens']} completion tokens"
+        )
+    return lines or ["- no provider usage reported"]
+
+
+def _latency_report_lines():
+    """
+    Formats per-backend call latency (az cli, ARM rest, terraform) so the backends can be compared.
+    """
+    lines = []
+    for backend, stats in latency_summary().items():
+        if not stats["count"]:
+            continue
+        lines.append(
+            f"- {backend}: {stats['count']} calls, mean {stats['mean_ms']} ms, "
+            f"p50 {stats['p50_ms']} ms, p95 {stats['p95_ms']} ms, max {stats['max_ms']} ms"
+        )
+    return lines or ["- no Azure calls made"]
+
+
+def _runner_report_lines():
+    """
+    Formats the shared command runner counters: calls, retries, throttling and bytes read.
+    """
+    stats = get_runner().summary()
+    return [
+        f"- Calls: {stats['calls']} ({stats['attempts']} attempts)",
+        f"- Retries: {stats['retries']} ({stats['throttled']} throttled)",
+        f"- Timeouts: {stats['timeouts']}",
+        f"- Failures: {stats['failures']}",
+        f"- Bytes read: {stats['bytes']}",
+    ]
+
+
+def _compaction_report_lines():
+    """
+    Formats the size of each discovery tool's output before and after compaction.
+    """
+    lines = []
+    for tool, stats in compaction_summary().items():
+        saved = 100 - round(stats['returned_bytes'] * 100 / stats['original_bytes']) if stats['original_bytes'] else 0
+        lines.append(
+            f"- {tool}: {stats['original_bytes']} -> {stats['returned_bytes']} bytes ({saved}% smaller), "
+            f"{stats['spilled']} of {stats['calls']} outputs spilled to detail files"
+        )
+    return lines or ["- no discovery output compacted"]
+
+
+def report_run_statistics(report_path="deployment_report.md", crew=None):
+    """
+    Prints the cache, LLM usage, latency, runner and compaction statistics of the run
+    and appends them to the deployment report. Pass the crew that ran to include
+    task durations and provider-reported token usage.
+    """
+    sections = [
+        ("Discovery Cache", "Discovery Cache Statistics", _cache_report_lines()),
+        ("LLM Completion Cache", "LLM Completion Cache", _llm_cache_report_lines()),
+        ("LLM Usage by Task", "LLM Usage by Task", _task_usage_report_lines(crew)),
+        ("LLM Usage by Agent", "LLM Usage by Agent (provider-reported)", _agent_usage_report_lines(crew)),
+        ("Azure Call Latency", "Azure Call Latency", _latency_report_lines()),
+        ("Command Runner", "Command Runner", _runner_report_lines()),
+        ("Discovery Output Compaction", "Discovery Output Compaction", _compaction_report_lines()),
+    ]
+    for heading, title, lines in sections:
+        print(f"{heading}:")
+        for line in lines:
+            print(f"  {line}")
+        _append_report_section(title, lines, report_path)
+
+
 def run():
     """
     Run the Azure infrastructure replication crew.
     Resources will be replicated within the SAME resource group and automatically deployed.
+    Pass --no-cache to bypass the discovery cache or --refresh to rediscover and update it,
+    and --no-llm-cache or --strict-llm-cache to bypass the LLM completion cache or answer only from it.
     """
+    _configure_cache_from_argv()
+    _configure_llm_cache_from_argv()
+    reset_fetcher()
+    
     # Get inputs from command line or use defaults
     if len(sys.argv) > 1:
         resource_group = sys.argv[1]
@@ -58,7 +244,8 @@ def run():
     
     try:
         print("\n🚀 Starting infrastructure replication workflow...\n")
-        result = Replica().crew().kickoff(inputs=inputs)
+        replica_crew = Replica().crew()
+        result = replica_crew.kickoff(inputs=inputs)
         
         print(f"\n{'='*70}")
         print("✅ Infrastructure replication workflow completed!")
@@ -77,6 +264,8 @@ def run():
         print(f"")
         print(f"Check 'terraform_validation_report.md' for code quality score")
         print(f"Check 'deployment_report.md' for detailed deployment results")
+        print(f"{'='*70}")
+        report_run_statistics(crew=replica_crew)
         print(f"{'='*70}\n")
         
         return result
@@ -86,6 +275,48 @@ def run():
         raise Exception(f"An error occurred while running the crew: {e}")
 
 
+def batch():
+    """
+    Replicate several resource groups in parallel.
+    Usage: replica_batch <groups file | rg[:prefix[:env]]>... [--workers N] [--no-cache | --refresh]
+                         [--no-llm-cache | --strict-llm-cache]
+    A groups file holds one "resource_group prefix environment" line per group (or a .json list).
+    """
+    cache = _configure_cache_from_argv()
+    _configure_llm_cache_from_argv()
+    args = sys.argv[1:]
+    workers = None
+    if "--workers" in args:
+        position = args.index("--workers")
+        workers = int(args[position + 1])
+        del args[position:position + 2]
+    
+    jobs = load_jobs(args)
+    if not jobs:
+        print("Usage: replica_batch <groups file | rg[:prefix[:env]]>... [--workers N] [--no-cache | --refresh]")
+        return []
+    
+    print(f"\n{'='*70}")
+    print(f"Azure Infrastructure Replication - Batch of {len(jobs)} resource groups")
+    print(f"{'='*70}\n")
+    
+    start = datetime.now()
+    results = run_batch(jobs, workers=workers, cache_mode=cache.mode)
+    lines = summary_table(results)
+    
+    print(f"\n{'='*70}")
+    for line in lines:
+        print(line)
+    print(f"Wall time: {round((datetime.now() - start).total_seconds(), 1)}s")
+    print(f"{'='*70}\n")
+    
+    with open("batch_summary.md", "w") as f:
+        f.write(f"# Batch Replication Summary ({start:%Y-%m-%d %H:%M})\n\n")
+        f.write("\n".join(lines) + "\n")
+    
+    return results
+
+
 def train():
     """
     Train the crew for a given number of iterations.
@@ -109,7 +340,9 @@ def train():
 def replay():
     """
     Replay the crew execution from a specific task.
+    Pass --strict-llm-cache to answer only from the LLM completion cache.
     """
+    _configure_llm_cache_from_argv()
     try:
         Replica().crew().replay(task_id=sys.argv[1])
     except Exception as e:
@@ -119,7 +352,9 @@ def replay():
 def test():
     """
     Test the crew execution and returns the results.
+    Pass --strict-llm-cache to answer only from the LLM completion cache.
     """
+    _configure_llm_cache_from_argv()
     inputs = {
         "resource_group": "test-rg",
         "name_prefix": "test",
@@ -0,0 +1,72 @@
+"""
+In-process latency counters for the discovery backends.
+"""
+import threading
+
+
+class LatencyRecorder:
+    """
+    Collects call durations and summarises them as count, mean and percentiles (milliseconds).
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._samples = []
+
+    def record(self, seconds: float):
+        with self._lock:
+            self._samples.append(seconds)
+
+    def reset(self):
+        with self._lock:
+            self._samples = []
+
+    def summary(self) -> dict:
+        with self._lock:
+            samples = sorted(self._samples)
+        if not samples:
+            return {"count": 0}
+
+        def percentile(p):
+            return round(samples[min(len(samples) - 1, int(p / 100 * len(samples)))] * 1000, 1)
+
+        return {
+            "count": len(samples),
+            "mean_ms": round(sum(samples) / len(samples) * 1000, 1),
+            "p50_ms": percentile(50),
+            "p95_ms": percentile(95),
+            "max_ms": round(samples[-1] * 1000, 1),
+        }
+
+
+_recorders = {}
+_recorders_lock = threading.Lock()
+
+
+def get_recorder(name: str) -> LatencyRecorder:
+    """
+    Returns the process-wide recorder for a backend, e.g. "cli" or "rest".
+    """
+    with _recorders_lock:
+        if name not in _recorders:
+            _recorders[name] = LatencyRecorder()
+        return _recorders[name]
+
+
+def latency_summary() -> dict:
+    """
+    Returns the latency summary of every backend that made at least one call.
+    """
+    with _recorders_lock:
+        recorders = dict(_recorders)
+    return {name: recorder.summary() for name, recorder in sorted(recorders.items())}
+
+
+def reset_metrics():
+    """
+    Clears every recorder, e.g. between the jobs a batch worker runs.
+    """
+    with _recorders_lock:
+        recorders = list(_recorders.values())
+    for recorder in recorders:
+        recorder.reset()
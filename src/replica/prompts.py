@@ -0,0 +1,71 @@
+"""
+Prompt layout that keeps provider-side prompt caching effective.
+
+Providers reuse the longest prompt prefix they have already seen. crewAI
+interpolates run inputs such as {resource_group} wherever they appear in the
+YAML, so a group name near the top of a several-hundred-line task made every
+prompt unique from that point on. When the crew builds its tasks and agents,
+their texts are rewritten to refer to the inputs by name (<resource_group>),
+and the values are given once, in a short "Run parameters" block at the very
+end of the text crewAI places last in the prompt: the expected output of a
+task. Agent texts keep only the placeholders, because crewAI renders the
+agent into the system prompt ahead of the tools and the task; the inputs
+they name are listed in the parameters block of each task the agent runs.
+"""
+import os
+import re
+
+# Same placeholder syntax crewAI interpolates
+PLACEHOLDER_PATTERN = re.compile(r"\{([A-Za-z_][A-Za-z0-9_\-]*)\}")
+PARAMETERS_HEADING = "Run parameters (values of the <placeholders> used above):"
+
+
+def stable_prompts_enabled() -> bool:
+    return os.getenv("REPLICA_STABLE_PROMPTS", "1") != "0"
+
+
+def _placeholders(*texts) -> list:
+    names = []
+    for text in texts:
+        for name in PLACEHOLDER_PATTERN.findall(text or ""):
+            if name not in names:
+                names.append(name)
+    return names
+
+
+AGENT_FIELDS = ("role", "backstory", "goal")
+
+
+def _replace(config: dict, fields: tuple) -> dict:
+    config = dict(config)
+    for field in fields:
+        if config.get(field):
+            config[field] = PLACEHOLDER_PATTERN.sub(lambda m: f"<{m.group(1)}>", config[field])
+    return config
+
+
+def stable_task_config(config: dict, agent_config: dict = None) -> dict:
+    """
+    Returns a copy of the task `config` with {name} replaced by <name> and the parameters
+    block, covering the inputs named by the task and by the raw config of its agent, appended
+    to the expected output, which crewAI renders after the description.
+    """
+    fields = ("description", "expected_output")
+    names = _placeholders(*(config.get(field) for field in fields),
+                          *((agent_config or {}).get(field) for field in AGENT_FIELDS))
+    if not names or not stable_prompts_enabled():
+        return dict(config)
+    config = _replace(config, fields)
+    parameters = "\n".join(f"- <{name}> = {{{name}}}" for name in names)
+    config["expected_output"] = f"{(config.get('expected_output') or '').rstrip()}\n\n{PARAMETERS_HEADING}\n{parameters}\n"
+    return config
+
+
+def stable_agent_config(config: dict) -> dict:
+    """
+    Returns a copy of the agent `config` with {name} replaced by <name>; the values go in the
+    tasks' parameters block (see stable_task_config), so the system prompt is the same every run.
+    """
+    if not stable_prompts_enabled():
+        return dict(config)
+    return _replace(config, AGENT_FIELDS)
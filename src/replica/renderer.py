@@ -0,0 +1,1120 @@
+"""
+Deterministic Terraform renderer for discovered Azure resources.
+
+Maps the records of the Azure Resource Scanner (read from its NDJSON
+artifact) straight to HCL for the resource types listed as MODERN RESOURCES
+in tasks.yaml. The same discovery input always yields byte-identical files.
+Records of other types, or using properties the templates do not cover, are
+listed as "unrendered" in terraform/render_report.json and left to the
+Terraform generator agent.
+"""
+import os
+import re
+import json
+import time
+
+from replica.dependencies import discovery_graph
+from replica.streaming import artifact_path, iter_ndjson
+from replica.tiers import MERGED_FILES, TIER_DIR, plan_tiers
+
+RENDER_REPORT = "render_report.json"
+DOCS_URL = "https://registry.terraform.io/providers/hashicorp/azurerm/latest/docs/resources"
+
+
+class Unsupported(Exception):
+    """
+    Raised when a record uses a type or property the templates do not cover.
+    """
+
+
+class Expr(str):
+    """
+    A raw HCL expression, emitted without quoting.
+    """
+
+
+def hcl_string(text: str) -> str:
+    text = str(text).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+    return '"' + text.replace("${", "$${").replace("%{", "%%{") + '"'
+
+
+def hcl_key(key: str) -> str:
+    return key if re.fullmatch(r"[A-Za-z_][A-Za-z0-9_-]*", key) else hcl_string(key)
+
+
+def hcl_value(value) -> str:
+    if isinstance(value, Expr):
+        return str(value)
+    if isinstance(value, bool):
+        return "true" if value else "false"
+    if isinstance(value, (int, float)):
+        return str(value)
+    if isinstance(value, str):
+        return hcl_string(value)
+    if isinstance(value, (list, tuple)):
+        return "[" + ", ".join(hcl_value(item) for item in value) + "]"
+    if isinstance(value, dict):
+        if not value:
+            return "{}"
+        return "{ " + ", ".join(f"{hcl_key(k)} = {hcl_value(v)}" for k, v in value.items()) + " }"
+    raise Unsupported(f"cannot express {type(value).__name__} in HCL")
+
+
+class Block:
+    """
+    An HCL block rendered the way `terraform fmt` lays it out.
+    """
+
+    def __init__(self, block_type: str, *labels):
+        self.block_type = block_type
+        self.labels = labels
+        self.items = []
+
+    def set(self, key: str, value):
+        if value is not None:
+            self.items.append((key, value))
+        return self
+
+    def block(self, block_type: str, *labels):
+        child = Block(block_type, *labels)
+        self.items.append((None, child))
+        return child
+
+    def render(self, indent: int = 0) -> str:
+        pad = "  " * indent
+        header = " ".join([self.block_type] + [hcl_string(label) for label in self.labels])
+        if not self.items:
+            return f"{pad}{header} {{}}"
+
+        lines = [f"{pad}{header} {{"]
+        # Consecutive attributes are aligned on "="; nested blocks are set apart by blank lines
+        group = []
+        for index, (key, value) in enumerate(self.items):
+            if key is not None:
+                group.append((key, value))
+                continue
+            lines.extend(self._attributes(group, indent + 1))
+            if index > 0:
+                lines.append("")
+            lines.append(value.render(indent + 1))
+            group = []
+            if index + 1 < len(self.items) and self.items[index + 1][0] is not None:
+                lines.append("")
+        lines.extend(self._attributes(group, indent + 1))
+        lines.append(f"{pad}}}")
+        return "\n".join(lines)
+
+    @staticmethod
+    def _attributes(group: list, indent: int) -> list:
+        if not group:
+            return []
+        width = max(len(key) for key, _ in group)
+        return [f"{'  ' * indent}{key.ljust(width)} = {hcl_value(value)}" for key, value in group]
+
+
+def _props(value: dict) -> dict:
+    """
+    Returns the ARM `properties` of an object, accepting already flattened objects too.
+    """
+    if not isinstance(value, dict):
+        return {}
+    return value.get("properties") if isinstance(value.get("properties"), dict) else value
+
+
+def _normalize_location(location: str) -> str:
+    return (location or "").replace(" ", "").lower()
+
+
+def _prefixed_name(name: str, separator: str = "-") -> Expr:
+    return Expr('"${var.name_prefix}' + separator + hcl_string(name)[1:-1] + '"')
+
+
+def _restricted_name(name: str, max_length: int, hyphens: bool = True) -> Expr:
+    """
+    Lower-case prefixed name stripped to the characters a globally unique Azure name allows.
+    """
+    allowed = "a-z0-9-" if hyphens else "a-z0-9"
+    source = _prefixed_name(name, "-" if hyphens else "")
+    return Expr(f'substr(replace(lower({source}), "/[^{allowed}]/", ""), 0, {max_length})')
+
+
+class RenderContext:
+    """
+    State shared by the type renderers: resource addresses, local names, outputs and providers.
+    """
+
+    def __init__(self, records: list, default_location: str):
+        self.discovered = {record["id"].lower() for record in records}
+        self.default_location = default_location
+        self.addresses = {}
+        self.registered = {}
+        self.local_names = {}
+        self._taken = set()
+        self.outputs = []
+        self.extra_blocks = []
+        self.providers = set()
+        self.client_config = False
+        self.lenient = True
+
+    def local_name(self, key: str, name: str) -> str:
+        key = key.lower()
+        if key not in self.local_names:
+            base = re.sub(r"[^a-z0-9_]", "_", name.lower()).strip("_") or "resource"
+            if not base[0].isalpha():
+                base = f"r_{base}"
+            local, suffix = base, 2
+            while local in self._taken:
+                local, suffix = f"{base}_{suffix}", suffix + 1
+            self._taken.add(local)
+            self.local_names[key] = local
+        return self.local_names[key]
+
+    def register(self, arm_id: str, address: str):
+        self.registered[arm_id.lower()] = address
+
+    def ref(self, arm_id: str, attribute: str = "id"):
+        """
+        Returns a reference to a rendered resource, or the literal ID of a resource outside the group.
+        """
+        key = arm_id.lower()
+        if key in self.addresses:
+            return Expr(f"{self.addresses[key]}.{attribute}")
+        parent_discovered = any(key.startswith(f"{d}/") for d in self.discovered)
+        if key in self.discovered or parent_discovered:
+            if self.lenient:
+                return Expr(f"unresolved.{attribute}")
+            raise Unsupported(f"depends on {arm_id}, which is not rendered from templates")
+        if attribute != "id":
+            raise Unsupported(f"needs the {attribute} of {arm_id}, which is outside the group")
+        return arm_id
+
+    def location(self, record: dict):
+        location = _normalize_location(record.get("location"))
+        return Expr("var.location") if location == self.default_location else location
+
+    def output(self, name: str, value: Expr, description: str, sensitive: bool = False):
+        block = Block("output", name).set("description", description).set("value", value)
+        if sensitive:
+            block.set("sensitive", True)
+        self.outputs.append(block)
+
+    def random_password(self, local: str) -> Expr:
+        self.providers.add("random")
+        self.extra_blocks.append(
+            Block("resource", "random_password", local)
+            .set("length", 24)
+            .set("special", True)
+            .set("min_lower", 1)
+            .set("min_upper", 1)
+            .set("min_numeric", 1)
+            .set("override_special", "!#%*()-_=+[]{}<>:?")
+        )
+        return Expr(f"random_password.{local}.result")
+
+
+def _resource(ctx: RenderContext, tf_type: str, record: dict, name) -> Block:
+    local = ctx.local_name(record["id"], record["name"].split("/")[-1])
+    block = Block("resource", tf_type, local)
+    block.set("name", name)
+    block.set("resource_group_name", Expr("data.azurerm_resource_group.main.name"))
+    block.set("location", ctx.location(record))
+    ctx.register(record["id"], f"{tf_type}.{local}")
+    ctx.output(f"{local}_id", Expr(f"{tf_type}.{local}.id"), f"ID of {record['name']} replica")
+    return block
+
+
+def _tags(block: Block, record: dict):
+    tags = record.get("tags") or {}
+    block.set("tags", Expr(f"merge(var.tags, {hcl_value(tags)})") if tags else Expr("var.tags"))
+
+
+def _identity(block: Block, record: dict):
+    identity = record.get("identity") or {}
+    identity_type = identity.get("type")
+    if not identity_type or identity_type == "None":
+        return
+    if identity_type != "SystemAssigned":
+        raise Unsupported(f"{identity_type} managed identity")
+    block.block("identity").set("type", "SystemAssigned")
+
+
+def _enabled(value):
+    return None if value is None else value != "Disabled"
+
+
+def render_service_plan(record: dict, ctx: RenderContext) -> list:
+    props = _props(record)
+    sku = record.get("sku") or {}
+    if not sku.get("name"):
+        raise Unsupported("service plan without a SKU")
+
+    if props.get("hyperV"):
+        os_type = "WindowsContainer"
+    elif props.get("reserved") or "linux" in (record.get("kind") or "").lower():
+        os_type = "Linux"
+    else:
+        os_type = "Windows"
+
+    block = _resource(ctx, "azurerm_service_plan", record, _prefixed_name(record["name"]))
+    block.set("os_type", os_type)
+    block.set("sku_name", sku["name"])
+    if (sku.get("capacity") or 0) > 1:
+        block.set("worker_count", sku["capacity"])
+    if props.get("zoneRedundant"):
+        block.set("zone_balancing_enabled", True)
+    _tags(block, record)
+    return [block]
+
+
+# linuxFxVersion runtime -> application_stack argument
+LINUX_STACKS = {
+    "DOTNETCORE": "dotnet_version",
+    "DOTNET": "dotnet_version",
+    "DOTNET-ISOLATED": "dotnet_version",
+    "NODE": "node_version",
+    "PYTHON": "python_version",
+    "PHP": "php_version",
+}
+WINDOWS_DOTNET_VERSIONS = {"v2.0", "v3.0", "v4.0", "v5.0", "v6.0", "v7.0", "v8.0"}
+
+
+def _linux_stack(linux_fx: str, function_app: bool) -> dict:
+    runtime, _, version = (linux_fx or "").partition("|")
+    runtime = runtime.upper()
+    if not runtime:
+        return {}
+    if runtime == "POWERSHELL" and function_app:
+        return {"powershell_core_version": version}
+    if runtime == "PHP" and function_app:
+        raise Unsupported("PHP function app")
+    if runtime not in LINUX_STACKS:
+        raise Unsupported(f"runtime stack {linux_fx}")
+    if function_app and runtime == "NODE":
+        version = version.replace("-lts", "")
+    stack = {LINUX_STACKS[runtime]: version}
+    if runtime == "DOTNET-ISOLATED":
+        stack["use_dotnet_isolated_runtime"] = True
+    return stack
+
+
+def _site_config(block: Block, site_config: dict, stack: dict):
+    config = block.block("site_config")
+    config.set("always_on", site_config.get("alwaysOn"))
+    config.set("ftps_state", site_config.get("ftpsState"))
+    config.set("minimum_tls_version", site_config.get("minTlsVersion"))
+    config.set("http2_enabled", site_config.get("http20Enabled"))
+    config.set("websockets_enabled", site_config.get("webSocketsEnabled"))
+    config.set("use_32_bit_worker", site_config.get("use32BitWorkerProcess"))
+    if site_config.get("healthCheckPath"):
+        config.set("health_check_path", site_config["healthCheckPath"])
+        config.set("health_check_eviction_time_in_min", 10)
+    if stack:
+        application_stack = config.block("application_stack")
+        for key, value in stack.items():
+            application_stack.set(key, value)
+
+
+def render_site(record: dict, ctx: RenderContext) -> list:
+    props = _props(record)
+    kind = (record.get("kind") or "").lower()
+    if not kind:
+        raise Unsupported("site kind unknown (rediscover to capture it)")
+    function_app = "functionapp" in kind
+    linux = "linux" in kind or bool(props.get("reserved"))
+    if "container" in kind or "workflowapp" in kind:
+        raise Unsupported(f"site kind {kind}")
+
+    site_config = props.get("siteConfig") or {}
+    if linux:
+        stack = _linux_stack(site_config.get("linuxFxVersion"), function_app)
+    else:
+        dotnet = site_config.get("netFrameworkVersion")
+        stack = {"current_stack": "dotnet", "dotnet_version": dotnet} if dotnet in WINDOWS_DOTNET_VERSIONS and not function_app else {}
+
+    os_name = "linux" if linux else "windows"
+    tf_type = f"azurerm_{os_name}_{'function_app' if function_app else 'web_app'}"
+    block = _resource(ctx, tf_type, record, _prefixed_name(record["name"]))
+    if not props.get("serverFarmId"):
+        raise Unsupported("site without an App Service plan")
+    block.set("service_plan_id", ctx.ref(props["serverFarmId"]))
+
+    if function_app:
+        # The backing account is only known for sure when the group holds exactly one
+        accounts = sorted({a for a in ctx.addresses.values() if a.startswith("azurerm_storage_account.")})
+        if len(accounts) != 1 and not ctx.lenient:
+            raise Unsupported("no single rendered storage account to back the function app")
+        account = accounts[0] if len(accounts) == 1 else "unresolved"
+        block.set("storage_account_name", Expr(f"{account}.name"))
+        block.set("storage_account_access_key", Expr(f"{account}.primary_access_key"))
+        block.set("functions_extension_version", "~4")
+
+    block.set("https_only", props.get("httpsOnly"))
+    block.set("client_affinity_enabled", props.get("clientAffinityEnabled"))
+    block.set("public_network_access_enabled", _enabled(props.get("publicNetworkAccess")))
+    if props.get("virtualNetworkSubnetId"):
+        block.set("virtual_network_subnet_id", ctx.ref(props["virtualNetworkSubnetId"]))
+    _tags(block, record)
+    _site_config(block, site_config, stack)
+    _identity(block, record)
+
+    local = block.labels[1]
+    ctx.output(f"{local}_default_hostname", Expr(f"{tf_type}.{local}.default_hostname"), f"Default hostname of {record['name']} replica")
+    return [block]
+
+
+def render_sql_server(record: dict, ctx: RenderContext) -> list:
+    props = _props(record)
+    administrators = props.get("administrators") or {}
+    if administrators.get("azureADOnlyAuthentication"):
+        raise Unsupported("Entra ID only authentication")
+    if not props.get("administratorLogin"):
+        raise Unsupported("SQL server without an administrator login")
+
+    block = _resource(ctx, "azurerm_mssql_server", record, _restricted_name(record["name"], 63))
+    local = block.labels[1]
+    block.set("version", props.get("version") or "12.0")
+    block.set("administrator_login", props["administratorLogin"])
+    block.set("administrator_login_password", ctx.random_password(f"{local}_admin"))
+    if props.get("minimalTlsVersion") in ("1.0", "1.1", "1.2"):
+        block.set("minimum_tls_version", props["minimalTlsVersion"])
+    block.set("public_network_access_enabled", _enabled(props.get("publicNetworkAccess")))
+    _tags(block, record)
+    if administrators.get("login") and administrators.get("sid"):
+        (block.block("azuread_administrator")
+         .set("login_username", administrators["login"])
+         .set("object_id", administrators["sid"]))
+    _identity(block, record)
+
+    ctx.output(f"{local}_fqdn", Expr(f"azurerm_mssql_server.{local}.fully_qualified_domain_name"), f"FQDN of {record['name']} replica")
+    ctx.output(f"{local}_admin_password", Expr(f"random_password.{local}_admin.result"), f"Administrator password of {record['name']} replica", sensitive=True)
+    return [block]
+
+
+def render_sql_database(record: dict, ctx: RenderContext) -> list:
+    props = _props(record)
+    server_id, _, database = record["id"].rpartition("/databases/")
+    sku_name = props.get("requestedServiceObjectiveName") or props.get("currentServiceObjectiveName")
+    if not sku_name or sku_name == "ElasticPool" or props.get("elasticPoolId"):
+        raise Unsupported("elastic pool database")
+
+    local = ctx.local_name(record["id"], "_".join(record["name"].split("/")))
+    block = Block("resource", "azurerm_mssql_database", local)
+    block.set("name", database)
+    block.set("server_id", ctx.ref(server_id))
+    block.set("sku_name", sku_name)
+    if props.get("maxSizeBytes"):
+        block.set("max_size_gb", int(props["maxSizeBytes"]) // (1024 ** 3))
+    block.set("collation", props.get("collation"))
+    block.set("zone_redundant", props.get("zoneRedundant"))
+    block.set("license_type", props.get("licenseType"))
+    if props.get("requestedBackupStorageRedundancy") in ("Geo", "Local", "Zone", "GeoZone"):
+        block.set("storage_account_type", props["requestedBackupStorageRedundancy"])
+    if props.get("autoPauseDelay"):
+        block.set("auto_pause_delay_in_minutes", props["autoPauseDelay"])
+    if props.get("minCapacity"):
+        block.set("min_capacity", props["minCapacity"])
+    _tags(block, record)
+
+    ctx.register(record["id"], f"azurerm_mssql_database.{local}")
+    ctx.output(f"{local}_id", Expr(f"azurerm_mssql_database.{local}.id"), f"ID of {record['name']} replica")
+    return [block]
+
+
+def render_storage_account(record: dict, ctx: RenderContext) -> list:
+    props = _props(record)
+    sku_name = (record.get("sku") or {}).get("name") or ""
+    tier, _, replication = sku_name.partition("_")
+    if not replication:
+        raise Unsupported(f"storage SKU {sku_name!r}")
+
+    block = _resource(ctx, "azurerm_storage_account", record, _restricted_name(record["name"], 24, hyphens=False))
+    local = block.labels[1]
+    block.set("account_tier", tier)
+    block.set("account_replication_type", replication)
+    block.set("account_kind", record.get("kind"))
+    block.set("access_tier", props.get("accessTier"))
+    block.set("min_tls_version", props.get("minimumTlsVersion"))
+    block.set("https_traffic_only_enabled", props.get("supportsHttpsTrafficOnly"))
+    block.set("allow_nested_items_to_be_public", props.get("allowBlobPublicAccess"))
+    block.set("shared_access_key_enabled", props.get("allowSharedKeyAccess"))
+    block.set("public_network_access_enabled", _enabled(props.get("publicNetworkAccess")))
+    block.set("is_hns_enabled", props.get("isHnsEnabled"))
+    _tags(block, record)
+
+    acls = props.get("networkAcls") or {}
+    ip_rules = [rule.get("value") for rule in acls.get("ipRules") or [] if rule.get("value")]
+    subnet_ids = [ctx.ref(rule["id"]) for rule in acls.get("virtualNetworkRules") or [] if rule.get("id")]
+    if acls.get("defaultAction") == "Deny" or ip_rules or subnet_ids:
+        rules = block.block("network_rules")
+        rules.set("default_action", acls.get("defaultAction") or "Allow")
+        bypass = [item.strip() for item in (acls.get("bypass") or "").split(",") if item.strip()]
+        rules.set("bypass", bypass or None)
+        rules.set("ip_rules", ip_rules or None)
+        rules.set("virtual_network_subnet_ids", subnet_ids or None)
+    _identity(block, record)
+
+    ctx.output(f"{local}_primary_blob_endpoint", Expr(f"azurerm_storage_account.{local}.primary_blob_endpoint"), f"Blob endpoint of {record['name']} replica")
+    return [block]
+
+
+def render_virtual_network(record: dict, ctx: RenderContext) -> list:
+    props = _props(record)
+    prefixes = (props.get("addressSpace") or {}).get("addressPrefixes") or []
+    if not prefixes:
+        raise Unsupported("virtual network without an address space")
+    if props.get("virtualNetworkPeerings"):
+        raise Unsupported("virtual network peerings")
+
+    block = _resource(ctx, "azurerm_virtual_network", record, _prefixed_name(record["name"]))
+    vnet_local = block.labels[1]
+    block.set("address_space", prefixes)
+    block.set("dns_servers", (props.get("dhcpOptions") or {}).get("dnsServers") or None)
+    _tags(block, record)
+    blocks = [block]
+
+    for subnet in props.get("subnets") or []:
+        subnet_props = _props(subnet)
+        if subnet_props.get("routeTable") or subnet_props.get("natGateway"):
+            raise Unsupported(f"subnet {subnet.get('name')} uses a route table or NAT gateway")
+
+        local = ctx.local_name(subnet["id"], f"{vnet_local}_{subnet['name']}")
+        subnet_block = Block("resource", "azurerm_subnet", local)
+        subnet_block.set("name", subnet["name"])
+        subnet_block.set("resource_group_name", Expr("data.azurerm_resource_group.main.name"))
+        subnet_block.set("virtual_network_name", Expr(f"azurerm_virtual_network.{vnet_local}.name"))
+        address_prefixes = subnet_props.get("addressPrefixes") or [subnet_props.get("addressPrefix")]
+        subnet_block.set("address_prefixes", [p for p in address_prefixes if p])
+        endpoints = [e.get("service") for e in subnet_props.get("serviceEndpoints") or [] if e.get("service")]
+        subnet_block.set("service_endpoints", endpoints or None)
+        if subnet_props.get("privateEndpointNetworkPolicies") in ("Disabled", "Enabled", "NetworkSecurityGroupEnabled", "RouteTableEnabled"):
+            subnet_block.set("private_endpoint_network_policies", subnet_props["privateEndpointNetworkPolicies"])
+        if subnet_props.get("privateLinkServiceNetworkPolicies"):
+            subnet_block.set("private_link_service_network_policies_enabled", subnet_props["privateLinkServiceNetworkPolicies"] == "Enabled")
+        for delegation in subnet_props.get("delegations") or []:
+            delegation_props = _props(delegation)
+            (subnet_block.block("delegation")
+             .set("name", delegation.get("name"))
+             .block("service_delegation")
+             .set("name", delegation_props.get("serviceName"))
+             .set("actions", delegation_props.get("actions") or None))
+        ctx.register(subnet["id"], f"azurerm_subnet.{local}")
+        blocks.append(subnet_block)
+
+        nsg = subnet_props.get("networkSecurityGroup") or {}
+        if nsg.get("id"):
+            blocks.append(
+                Block("resource", "azurerm_subnet_network_security_group_association", local)
+                .set("subnet_id", Expr(f"azurerm_subnet.{local}.id"))
+                .set("network_security_group_id", ctx.ref(nsg["id"]))
+            )
+    return blocks
+
+
+def render_network_security_group(record: dict, ctx: RenderContext) -> list:
+    props = _props(record)
+    block = _resource(ctx, "azurerm_network_security_group", record, _prefixed_name(record["name"]))
+    _tags(block, record)
+
+    for rule in sorted(props.get("securityRules") or [], key=lambda r: (_props(r).get("direction", ""), _props(r).get("priority", 0))):
+        rule_props = _props(rule)
+        if rule_props.get("sourceApplicationSecurityGroups") or rule_props.get("destinationApplicationSecurityGroups"):
+            raise Unsupported(f"rule {rule.get('name')} uses application security groups")
+        security_rule = block.block("security_rule")
+        security_rule.set("name", rule.get("name"))
+        security_rule.set("priority", rule_props.get("priority"))
+        security_rule.set("direction", rule_props.get("direction"))
+        security_rule.set("access", rule_props.get("access"))
+        security_rule.set("protocol", rule_props.get("protocol"))
+        for single, plural, argument, arguments in (
+            ("sourcePortRange", "sourcePortRanges", "source_port_range", "source_port_ranges"),
+            ("destinationPortRange", "destinationPortRanges", "destination_port_range", "destination_port_ranges"),
+            ("sourceAddressPrefix", "sourceAddressPrefixes", "source_address_prefix", "source_address_prefixes"),
+            ("destinationAddressPrefix", "destinationAddressPrefixes", "destination_address_prefix", "destination_address_prefixes"),
+        ):
+            if rule_props.get(single):
+                security_rule.set(argument, rule_props[single])
+            elif rule_props.get(plural):
+                security_rule.set(arguments, rule_props[plural])
+        security_rule.set("description", rule_props.get("description") or None)
+    return [block]
+
+
+def render_public_ip(record: dict, ctx: RenderContext) -> list:
+    props = _props(record)
+    sku = record.get("sku") or {}
+    block = _resource(ctx, "azurerm_public_ip", record, _prefixed_name(record["name"]))
+    local = block.labels[1]
+    block.set("allocation_method", props.get("publicIPAllocationMethod") or "Static")
+    block.set("sku", sku.get("name"))
+    if sku.get("tier") == "Global":
+        block.set("sku_tier", "Global")
+    block.set("ip_version", props.get("publicIPAddressVersion"))
+    block.set("idle_timeout_in_minutes", props.get("idleTimeoutInMinutes"))
+    block.set("zones", record.get("zones") or None)
+    label = (props.get("dnsSettings") or {}).get("domainNameLabel")
+    if label:
+        block.set("domain_name_label", Expr(f"lower({_prefixed_name(label)})"))
+    _tags(block, record)
+    ctx.output(f"{local}_ip_address", Expr(f"azurerm_public_ip.{local}.ip_address"), f"IP address of {record['name']} replica")
+    return [block]
+
+
+def render_network_interface(record: dict, ctx: RenderContext) -> list:
+    props = _props(record)
+    block = _resource(ctx, "azurerm_network_interface", record, _prefixed_name(record["name"]))
+    local = block.labels[1]
+    block.set("accelerated_networking_enabled", props.get("enableAcceleratedNetworking"))
+    block.set("ip_forwarding_enabled", props.get("enableIPForwarding"))
+    block.set("dns_servers", (props.get("dnsSettings") or {}).get("dnsServers") or None)
+    _tags(block, record)
+
+    configurations = props.get("ipConfigurations") or []
+    if not configurations:
+        raise Unsupported("network interface without IP configurations")
+    for configuration in configurations:
+        config_props = _props(configuration)
+        if config_props.get("loadBalancerBackendAddressPools") or config_props.get("applicationGatewayBackendAddressPools") or config_props.get("applicationSecurityGroups"):
+            raise Unsupported("network interface joined to load balancer, gateway pools or application security groups")
+        subnet_id = (config_props.get("subnet") or {}).get("id")
+        ip_configuration = block.block("ip_configuration")
+        ip_configuration.set("name", configuration.get("name"))
+        subnet = ctx.ref(subnet_id) if subnet_id else None
+        ip_configuration.set("subnet_id", subnet)
+        static = config_props.get("privateIPAllocationMethod") == "Static" and isinstance(subnet, Expr)
+        # A static address only stays free when the subnet itself is replicated
+        ip_configuration.set("private_ip_address_allocation", "Static" if static else "Dynamic")
+        if static:
+            ip_configuration.set("private_ip_address", config_props.get("privateIPAddress"))
+        public_ip = (config_props.get("publicIPAddress") or {}).get("id")
+        if public_ip:
+            ip_configuration.set("public_ip_address_id", ctx.ref(public_ip))
+        if len(configurations) > 1:
+            ip_configuration.set("primary", bool(config_props.get("primary")))
+
+    blocks = [block]
+    nsg = (props.get("networkSecurityGroup") or {}).get("id")
+    if nsg:
+        blocks.append(
+            Block("resource", "azurerm_network_interface_security_group_association", local)
+            .set("network_interface_id", Expr(f"azurerm_network_interface.{local}.id"))
+            .set("network_security_group_id", ctx.ref(nsg))
+        )
+    return blocks
+
+
+def render_virtual_machine(record: dict, ctx: RenderContext) -> list:
+    props = _props(record)
+    storage = props.get("storageProfile") or {}
+    os_disk = storage.get("osDisk") or {}
+    image = storage.get("imageReference") or {}
+    os_profile = props.get("osProfile") or {}
+    if storage.get("dataDisks"):
+        raise Unsupported("virtual machine data disks")
+    if image.get("id") or image.get("sharedGalleryImageId") or not image.get("publisher"):
+        raise Unsupported("virtual machine from a custom or gallery image")
+    if not os_profile.get("adminUsername"):
+        raise Unsupported("virtual machine without an OS profile (specialized disk)")
+    if props.get("priority") == "Spot":
+        raise Unsupported("spot virtual machine")
+
+    linux = os_disk.get("osType") == "Linux"
+    tf_type = "azurerm_linux_virtual_machine" if linux else "azurerm_windows_virtual_machine"
+    block = _resource(ctx, tf_type, record, _prefixed_name(record["name"]))
+    local = block.labels[1]
+    block.set("size", (props.get("hardwareProfile") or {}).get("vmSize"))
+    block.set("admin_username", os_profile["adminUsername"])
+    if linux and (os_profile.get("linuxConfiguration") or {}).get("disablePasswordAuthentication"):
+        ctx.providers.add("tls")
+        ctx.extra_blocks.append(
+            Block("resource", "tls_private_key", local).set("algorithm", "RSA").set("rsa_bits", 4096)
+        )
+        ctx.output(f"{local}_ssh_private_key", Expr(f"tls_private_key.{local}.private_key_openssh"), f"SSH key of {record['name']} replica", sensitive=True)
+        ssh_key = True
+    else:
+        block.set("admin_password", ctx.random_password(f"{local}_admin"))
+        ctx.output(f"{local}_admin_password", Expr(f"random_password.{local}_admin.result"), f"Administrator password of {record['name']} replica", sensitive=True)
+        ssh_key = False
+        if linux:
+            block.set("disable_password_authentication", False)
+    if not linux:
+        block.set("computer_name", Expr(f'substr(replace({_prefixed_name(record["name"])}, "/[^A-Za-z0-9-]/", ""), 0, 15)'))
+    interfaces = [nic["id"] for nic in (props.get("networkProfile") or {}).get("networkInterfaces") or []]
+    if not interfaces:
+        raise Unsupported("virtual machine without network interfaces")
+    refs = [ctx.ref(nic) for nic in interfaces]
+    if not ctx.lenient and not all(isinstance(ref, Expr) for ref in refs):
+        raise Unsupported("virtual machine network interfaces are outside the group")
+    block.set("network_interface_ids", refs)
+    block.set("license_type", props.get("licenseType"))
+    block.set("zone", (record.get("zones") or [None])[0])
+    _tags(block, record)
+
+    if ssh_key:
+        (block.block("admin_ssh_key")
+         .set("username", os_profile["adminUsername"])
+         .set("public_key", Expr(f"tls_private_key.{local}.public_key_openssh")))
+    disk = block.block("os_disk")
+    disk.set("caching", os_disk.get("caching") or "ReadWrite")
+    disk.set("storage_account_type", (os_disk.get("managedDisk") or {}).get("storageAccountType") or "Standard_LRS")
+    disk.set("disk_size_gb", os_disk.get("diskSizeGB"))
+    (block.block("source_image_reference")
+     .set("publisher", image["publisher"])
+     .set("offer", image.get("offer"))
+     .set("sku", image.get("sku"))
+     .set("version", image.get("version") or "latest"))
+    if ((props.get("diagnosticsProfile") or {}).get("bootDiagnostics") or {}).get("enabled"):
+        block.block("boot_diagnostics")
+    _identity(block, record)
+
+    os_disk_id = (os_disk.get("managedDisk") or {}).get("id")
+    if os_disk_id:
+        ctx.register(os_disk_id, f"{tf_type}.{local}")
+    return [block]
+
+
+# Key Vault permission names as the provider spells them
+KEY_PERMISSIONS = [
+    "Backup", "Create", "Decrypt", "Delete", "Encrypt", "Get", "Import", "List", "Purge", "Recover",
+    "Restore", "Sign", "UnwrapKey", "Update", "Verify", "WrapKey", "Release", "Rotate",
+    "GetRotationPolicy", "SetRotationPolicy",
+]
+SECRET_PERMISSIONS = ["Backup", "Delete", "Get", "List", "Purge", "Recover", "Restore", "Set"]
+CERTIFICATE_PERMISSIONS = [
+    "Backup", "Create", "Delete", "DeleteIssuers", "Get", "GetIssuers", "Import", "List", "ListIssuers",
+    "ManageContacts", "ManageIssuers", "Purge", "Recover", "Restore", "SetIssuers", "Update",
+]
+
+
+def _permissions(values: list, allowed: list) -> list:
+    canonical = {name.lower(): name for name in allowed}
+    result = []
+    for value in values or []:
+        if value.lower() not in canonical:
+            raise Unsupported(f"key vault permission {value!r}")
+        result.append(canonical[value.lower()])
+    return result or None
+
+
+def render_key_vault(record: dict, ctx: RenderContext) -> list:
+    props = _props(record)
+    ctx.client_config = True
+    block = _resource(ctx, "azurerm_key_vault", record, _restricted_name(record["name"], 24))
+    local = block.labels[1]
+    block.set("tenant_id", Expr("data.azurerm_client_config.current.tenant_id"))
+    block.set("sku_name", ((props.get("sku") or {}).get("name") or "standard").lower())
+    block.set("soft_delete_retention_days", props.get("softDeleteRetentionInDays"))
+    block.set("purge_protection_enabled", props.get("enablePurgeProtection"))
+    block.set("enable_rbac_authorization", props.get("enableRbacAuthorization"))
+    block.set("enabled_for_deployment", props.get("enabledForDeployment"))
+    block.set("enabled_for_disk_encryption", props.get("enabledForDiskEncryption"))
+    block.set("enabled_for_template_deployment", props.get("enabledForTemplateDeployment"))
+    block.set("public_network_access_enabled", _enabled(props.get("publicNetworkAccess")))
+    _tags(block, record)
+
+    acls = props.get("networkAcls") or {}
+    if acls:
+        network_acls = block.block("network_acls")
+        network_acls.set("default_action", acls.get("defaultAction") or "Allow")
+        network_acls.set("bypass", acls.get("bypass") or "AzureServices")
+        network_acls.set("ip_rules", [rule["value"] for rule in acls.get("ipRules") or [] if rule.get("value")] or None)
+        subnet_ids = [ctx.ref(rule["id"]) for rule in acls.get("virtualNetworkRules") or [] if rule.get("id")]
+        network_acls.set("virtual_network_subnet_ids", subnet_ids or None)
+
+    for policy in props.get("accessPolicies") or []:
+        permissions = policy.get("permissions") or {}
+        if permissions.get("storage"):
+            raise Unsupported("key vault storage permissions")
+        access_policy = block.block("access_policy")
+        access_policy.set("tenant_id", policy.get("tenantId"))
+        access_policy.set("object_id", policy.get("objectId"))
+        access_policy.set("application_id", policy.get("applicationId"))
+        access_policy.set("key_permissions", _permissions(permissions.get("keys"), KEY_PERMISSIONS))
+        access_policy.set("secret_permissions", _permissions(permissions.get("secrets"), SECRET_PERMISSIONS))
+        access_policy.set("certificate_permissions", _permissions(permissions.get("certificates"), CERTIFICATE_PERMISSIONS))
+
+    ctx.output(f"{local}_vault_uri", Expr(f"azurerm_key_vault.{local}.vault_uri"), f"URI of {record['name']} replica")
+    return [block]
+
+
+def render_cosmosdb_account(record: dict, ctx: RenderContext) -> list:
+    props = _props(record)
+    kind = record.get("kind") or "GlobalDocumentDB"
+    if kind not in ("GlobalDocumentDB", "MongoDB"):
+        raise Unsupported(f"Cosmos DB kind {kind}")
+    if (props.get("backupPolicy") or {}).get("type") == "Continuous":
+        raise Unsupported("continuous backup")
+
+    block = _resource(ctx, "azurerm_cosmosdb_account", record, _restricted_name(record["name"], 44))
+    local = block.labels[1]
+    block.set("offer_type", "Standard")
+    block.set("kind", kind)
+    if kind == "MongoDB":
+        block.set("mongo_server_version", (props.get("apiProperties") or {}).get("serverVersion"))
+    block.set("free_tier_enabled", props.get("enableFreeTier"))
+    block.set("automatic_failover_enabled", props.get("enableAutomaticFailover"))
+    block.set("multiple_write_locations_enabled", props.get("enableMultipleWriteLocations"))
+    block.set("local_authentication_disabled", props.get("disableLocalAuth"))
+    block.set("public_network_access_enabled", _enabled(props.get("publicNetworkAccess")))
+    ip_rules = [rule.get("ipAddressOrRange") for rule in props.get("ipRules") or [] if rule.get("ipAddressOrRange")]
+    block.set("ip_range_filter", ip_rules or None)
+    subnet_rules = [rule["id"] for rule in props.get("virtualNetworkRules") or [] if rule.get("id")]
+    if subnet_rules:
+        block.set("is_virtual_network_filter_enabled", True)
+    _tags(block, record)
+
+    consistency = props.get("consistencyPolicy") or {}
+    policy = block.block("consistency_policy")
+    policy.set("consistency_level", consistency.get("defaultConsistencyLevel") or "Session")
+    if consistency.get("defaultConsistencyLevel") == "BoundedStaleness":
+        policy.set("max_interval_in_seconds", consistency.get("maxIntervalInSeconds"))
+        policy.set("max_staleness_prefix", consistency.get("maxStalenessPrefix"))
+
+    locations = sorted(props.get("locations") or [], key=lambda l: l.get("failoverPriority", 0))
+    if not locations:
+        locations = [{"locationName": record.get("location"), "failoverPriority": 0}]
+    for location in locations:
+        (block.block("geo_location")
+         .set("location", _normalize_location(location.get("locationName")))
+         .set("failover_priority", location.get("failoverPriority", 0))
+         .set("zone_redundant", location.get("isZoneRedundant")))
+    for capability in props.get("capabilities") or []:
+        block.block("capabilities").set("name", capability.get("name"))
+    for subnet_id in subnet_rules:
+        block.block("virtual_network_rule").set("id", ctx.ref(subnet_id))
+
+    ctx.output(f"{local}_endpoint", Expr(f"azurerm_cosmosdb_account.{local}.endpoint"), f"Endpoint of {record['name']} replica")
+    return [block]
+
+
+# ARM type (lower-case) -> renderer, in the order resources are written to main.tf
+RENDERERS = {
+    "microsoft.network/networksecuritygroups": render_network_security_group,
+    "microsoft.network/virtualnetworks": render_virtual_network,
+    "microsoft.network/publicipaddresses": render_public_ip,
+    "microsoft.network/networkinterfaces": render_network_interface,
+    "microsoft.storage/storageaccounts": render_storage_account,
+    "microsoft.sql/servers": render_sql_server,
+    "microsoft.sql/servers/databases": render_sql_database,
+    "microsoft.documentdb/databaseaccounts": render_cosmosdb_account,
+    "microsoft.keyvault/vaults": render_key_vault,
+    "microsoft.web/serverfarms": render_service_plan,
+    "microsoft.web/sites": render_site,
+    "microsoft.compute/virtualmachines": render_virtual_machine,
+}
+
+# Resources created implicitly with another one; skipped when that one is rendered
+MANAGED_DISK_TYPE = "microsoft.compute/disks"
+
+
+def _sort_key(record: dict):
+    order = list(RENDERERS)
+    resource_type = record["type"].lower()
+    return (order.index(resource_type) if resource_type in order else len(order), record["id"].lower())
+
+
+def _render_pass(records: list, ctx: RenderContext):
+    """
+    Renders every record once; returns (blocks per record id, failure reason per record id).
+    """
+    ctx.registered = {}
+    ctx.outputs = []
+    ctx.extra_blocks = []
+    ctx.providers = set()
+    ctx.client_config = False
+    rendered, failures = {}, {}
+    for record in records:
+        registered_before = dict(ctx.registered)
+        outputs_before, extras_before, providers_before = len(ctx.outputs), len(ctx.extra_blocks), set(ctx.providers)
+        try:
+            rendered[record["id"].lower()] = RENDERERS[record["type"].lower()](record, ctx)
+        except Unsupported as e:
+            failures[record["id"].lower()] = str(e)
+            ctx.registered = registered_before
+            del ctx.outputs[outputs_before:]
+            del ctx.extra_blocks[extras_before:]
+            ctx.providers = providers_before
+    return rendered, failures
+
+
+def _render_records(records: list):
+    """
+    Renders the records the templates cover. References between resources are
+    resolved iteratively: a resource depending on one that could not be rendered
+    is itself left to the LLM.
+    Returns (ctx, blocks per record id, unrendered reason per record id).
+    """
+    locations = [_normalize_location(r.get("location")) for r in records if r.get("location") and r.get("location") != "global"]
+    default_location = max(sorted(set(locations)), key=locations.count) if locations else "eastus"
+    ctx = RenderContext(records, default_location)
+
+    unrendered = {}
+    candidates = []
+    for record in records:
+        resource_type = record["type"].lower()
+        if "error" in record:
+            unrendered[record["id"].lower()] = f"discovery failed: {record['error']}"
+        elif resource_type == "microsoft.sql/servers/databases" and record["name"].lower().endswith("/master"):
+            continue
+        elif resource_type in RENDERERS:
+            candidates.append(record)
+        elif resource_type != MANAGED_DISK_TYPE:
+            unrendered[record["id"].lower()] = f"no template for {record['type']}"
+
+    # First pass collects addresses without resolving references
+    _render_pass(candidates, ctx)
+    ctx.addresses = dict(ctx.registered)
+    ctx.lenient = False
+    while True:
+        rendered, failures = _render_pass(candidates, ctx)
+        if not failures:
+            break
+        unrendered.update(failures)
+        candidates = [record for record in candidates if record["id"].lower() not in failures]
+        ctx.addresses = {key: address for key, address in ctx.registered.items()}
+
+    # OS disks are created by their virtual machine
+    covered = {}
+    for record in records:
+        if record["type"].lower() == MANAGED_DISK_TYPE and "error" not in record:
+            owner = ctx.registered.get(record["id"].lower())
+            if owner:
+                covered[record["id"].lower()] = owner
+            else:
+                unrendered[record["id"].lower()] = "standalone managed disk"
+    return ctx, rendered, unrendered, covered
+
+
+def _provider_file(ctx: RenderContext) -> str:
+    required = Block("required_providers")
+    versions = {
+        "azurerm": ("hashicorp/azurerm", "~> 4.1"),
+        "random": ("hashicorp/random", "~> 3.6"),
+        "tls": ("hashicorp/tls", "~> 4.0"),
+    }
+    for name in ["azurerm"] + sorted(ctx.providers):
+        source, version = versions[name]
+        required.set(name, {"source": source, "version": version})
+    terraform = Block("terraform").set("required_version", ">= 1.0")
+    terraform.items.append((None, required))
+    provider = Block("provider", "azurerm").set("subscription_id", Expr("var.subscription_id"))
+    provider.block("features")
+    return terraform.render() + "\n\n" + provider.render() + "\n"
+
+
+# Variables declared in variables.tf: name -> (type, description, default)
+STANDARD_VARIABLES = {
+    "subscription_id": ("string", "Subscription the replicas are deployed to", None),
+    "resource_group_name": ("string", "Existing resource group the replicas are created in", None),
+    "location": ("string", "Default Azure region of the replicas", None),
+    "name_prefix": ("string", "Prefix added to the name of every replica", None),
+    "environment": ("string", "Target environment of the replicas", None),
+    "tags": ("map(string)", "Tags added to every replica", Expr("{}")),
+}
+
+
+def _variables_file() -> str:
+    blocks = []
+    for name, (var_type, description, default) in STANDARD_VARIABLES.items():
+        block = Block("variable", name).set("description", description).set("type", Expr(var_type))
+        block.set("default", default)
+        blocks.append(block.render())
+    return "\n\n".join(blocks) + "\n"
+
+
+def _tfvars_file(subscription_id: str, resource_group: str, location: str, name_prefix: str, environment: str) -> str:
+    values = [
+        ("subscription_id", subscription_id),
+        ("resource_group_name", resource_group),
+        ("location", location),
+        ("name_prefix", name_prefix),
+        ("environment", environment),
+        ("tags", {"environment": environment, "replicated_from": resource_group, "managed_by": "terraform"}),
+    ]
+    return "\n".join(Block._attributes(values, 0)) + "\n"
+
+
+def _readme(resource_group: str, rendered_types: list, unrendered: list) -> str:
+    lines = [
+        f"# Replica of resource group {resource_group}",
+        "",
+        "Generated deterministically from the discovered resources by the Terraform template renderer.",
+        "",
+        "## Prerequisites",
+        "",
+        "- Terraform >= 1.0",
+        "- Azure CLI logged in to the target subscription (`az login`)",
+        "",
+        "## Deployment",
+        "",
+        "```bash",
+        "terraform init",
+        "terraform plan -out tfplan",
+        "terraform apply tfplan",
+        "```",
+        "",
+        "Passwords and SSH keys of the replicas are generated by Terraform and exposed as sensitive outputs.",
+        "App settings and connection strings of web apps are not copied.",
+        "",
+        "## Resource Documentation",
+        "",
+        "This Terraform configuration uses the Azure Resource Manager (azurerm) provider.",
+        "",
+        "**Provider Documentation**: https://registry.terraform.io/providers/hashicorp/azurerm/latest/docs",
+        "",
+        "**Resources Created**:",
+    ]
+    for tf_type in rendered_types:
+        lines.append(f"- [{tf_type}]({DOCS_URL}/{tf_type.replace('azurerm_', '', 1)})")
+    lines += [
+        "",
+        "**Version Information**:",
+        "- Terraform: >= 1.0",
+        "- azurerm Provider: ~> 4.1",
+    ]
+    if unrendered:
+        lines += ["", "## Resources Not Rendered From Templates", ""]
+        lines += [f"- {item['name']} ({item['type']}): {item['reason']}" for item in unrendered]
+    return "\n".join(lines) + "\n"
+
+
+def renderer_enabled() -> bool:
+    return os.getenv("REPLICA_TEMPLATE_RENDERER", "1") != "0"
+
+
+def _remove_tier_output(terraform_dir: str):
+    stale = [os.path.join(terraform_dir, name) for name in MERGED_FILES]
+    tier_dir = os.path.join(terraform_dir, TIER_DIR)
+    if os.path.isdir(tier_dir):
+        stale += [os.path.join(tier_dir, name) for name in os.listdir(tier_dir) if name.endswith(".tf")]
+    for path in stale:
+        if os.path.exists(path):
+            os.remove(path)
+
+
+def discard_render(terraform_dir: str = "terraform"):
+    """
+    Removes the render report of an earlier run with the files it lists and the tier
+    output built on it, so a run whose render failed cannot reuse them.
+    """
+    report = load_render_report(terraform_dir)
+    if report is None:
+        return
+    for name in report.get("files", []):
+        path = os.path.join(terraform_dir, name)
+        if os.path.exists(path):
+            os.remove(path)
+    _remove_tier_output(terraform_dir)
+    os.remove(os.path.join(terraform_dir, RENDER_REPORT))
+
+
+def render_configuration(resource_group: str, name_prefix: str, target_environment: str, subscription_id: str = "",
+                         terraform_dir: str = "terraform", records: list = None, templates: bool = None) -> dict:
+    """
+    Writes provider.tf, variables.tf, main.tf, outputs.tf, terraform.tfvars and README.md
+    for the discovered resources of a group and returns the render report, which is
+    also written to terraform/render_report.json. With templates off (default:
+    REPLICA_TEMPLATE_RENDERER) only the skeleton is written and every resource is unrendered.
+    """
+    start = time.perf_counter()
+    artifact = None
+    if records is None:
+        artifact = artifact_path(resource_group)
+        records = list(iter_ndjson(artifact))
+    # Line of each record in the artifact, for the Discovery Detail Reader
+    lines = {record["id"].lower(): index for index, record in enumerate(records)}
+    records = sorted(records, key=_sort_key)
+    by_id = {record["id"].lower(): record for record in records}
+
+    if renderer_enabled() if templates is None else templates:
+        ctx, rendered, unrendered, covered = _render_records(records)
+    else:
+        # Skeleton files only; every resource goes to the generator agents
+        ctx = RenderContext(records, "eastus")
+        locations = [_normalize_location(r.get("location")) for r in records if r.get("location") not in (None, "", "global")]
+        ctx.default_location = max(sorted(set(locations)), key=locations.count) if locations else "eastus"
+        rendered, covered = {}, {}
+        unrendered = {
+            record["id"].lower(): "template rendering disabled"
+            for record in records if not record["name"].lower().endswith("/master")
+        }
+
+    main = [
+        Block("data", "azurerm_resource_group", "main").set("name", Expr("var.resource_group_name")).render()
+    ]
+    if ctx.client_config:
+        main.append(Block("data", "azurerm_client_config", "current").render())
+    main += [block.render() for block in ctx.extra_blocks]
+    for record in records:
+        for block in rendered.get(record["id"].lower(), []):
+            main.append(block.render())
+
+    files = {
+        "provider.tf": _provider_file(ctx),
+        "variables.tf": _variables_file(),
+        "main.tf": "\n\n".join(main) + "\n",
+        "outputs.tf": "\n\n".join(block.render() for block in ctx.outputs) + "\n" if ctx.outputs else "",
+        "terraform.tfvars": _tfvars_file(subscription_id, resource_group, ctx.default_location, name_prefix, target_environment),
+    }
+
+    unrendered_items = []
+    for record_id in sorted(unrendered, key=lambda key: _sort_key(by_id[key])):
+        item = {
+            "id": by_id[record_id]["id"],
+            "name": by_id[record_id]["name"],
+            "type": by_id[record_id]["type"],
+            "reason": unrendered[record_id],
+        }
+        if artifact:
+            item["detail"] = {"tool_name": artifact, "pointer": f"/resources/{lines[record_id]}"}
+        unrendered_items.append(item)
+    rendered_types = sorted({
+        block.labels[0] for blocks in rendered.values() for block in blocks if block.labels[0].startswith("azurerm_")
+    })
+    files["README.md"] = _readme(resource_group, rendered_types, unrendered_items)
+
+    os.makedirs(terraform_dir, exist_ok=True)
+    # Output of the tier tasks of an earlier run no longer matches this render
+    _remove_tier_output(terraform_dir)
+    for filename, content in files.items():
+        with open(os.path.join(terraform_dir, filename), "w") as f:
+            f.write(content)
+
+    report = {
+        "resource_group": resource_group,
+        "files": sorted(files),
+        "complete": not unrendered_items,
+        "rendered": [
+            {"id": by_id[record_id]["id"], "name": by_id[record_id]["name"], "address": ctx.registered.get(record_id)}
+            for record_id in rendered
+        ],
+        "covered": [{"id": by_id[record_id]["id"], "by": owner} for record_id, owner in covered.items()],
+        "unrendered": unrendered_items,
+        "references": {record_id: address for record_id, address in ctx.registered.items()},
+        "seconds": round(time.perf_counter() - start, 4),
+    }
+    # Creation order of the discovered resources, from the ARM IDs their properties refer to
+    graph = discovery_graph(records)
+    graph_summary = graph.summary()
+    original = lambda node: by_id[node]["id"]
+    report["dependencies"] = {
+        "levels": [[original(node) for node in level] for level in graph_summary["levels"]],
+        "width": graph_summary["width"],
+        "critical_path": [original(node) for node in graph_summary["critical_path"]],
+        "cycle": [original(node) for node in graph_summary["cycle"]],
+        "depends_on": {
+            original(node): sorted(original(dependency) for dependency in dependencies)
+            for node, dependencies in graph.dependencies.items() if dependencies
+        },
+    }
+    report["tiers"] = plan_tiers(report)
+    with open(os.path.join(terraform_dir, RENDER_REPORT), "w") as f:
+        json.dump(report, f, indent=2)
+    return report
+
+
+def load_render_report(terraform_dir: str = "terraform"):
+    path = os.path.join(terraform_dir, RENDER_REPORT)
+    if not os.path.exists(path):
+        return None
+    with open(path) as f:
+        return json.load(f)
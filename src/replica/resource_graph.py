@@ -0,0 +1,203 @@
+"""
+Azure Resource Graph backend for the Azure Service Dependencies Mapper.
+
+Fetches the whole service inventory of a resource group with a single paginated
+KQL query instead of one `az <service> list` call per service type. Rows are
+returned in the shape of the matching `az` listing, so the mapper output is
+the same with either backend: `properties` are flattened into the item
+(key vaults keep them nested, as `az keyvault list` does) and function apps
+are listed apart from web apps.
+"""
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+from replica.arm_client import get_arm_client, get_subscription_id
+
+RESOURCE_GRAPH_API_VERSION = "2021-03-01"
+WEB_API_VERSION = "2022-03-01"
+SQL_API_VERSION = "2021-11-01"
+
+# Rows requested per Resource Graph page (the service caps this at 1000)
+RESOURCE_GRAPH_PAGE_SIZE = int(os.getenv("REPLICA_GRAPH_PAGE_SIZE", "1000"))
+
+# Resource type -> key in the mapper output
+SERVICE_TYPES = {
+    "microsoft.storage/storageaccounts": "storage_accounts",
+    "microsoft.sql/servers": "sql_servers",
+    "microsoft.web/sites": "webapps",
+    "microsoft.web/serverfarms": "app_service_plans",
+    "microsoft.documentdb/databaseaccounts": "cosmos_accounts",
+    "microsoft.keyvault/vaults": "keyvaults",
+    "microsoft.compute/virtualmachines": "virtual_machines",
+}
+
+SQL_DATABASE_TYPE = "microsoft.sql/servers/databases"
+
+# ARM property names that the az CLI reports under another name
+CLI_PROPERTY_NAMES = {
+    "storage_accounts": {"networkAcls": "networkRuleSet"},
+}
+# Services whose `az ... list` output keeps the properties nested
+NESTED_PROPERTIES = ("keyvaults",)
+
+
+def query_resources(query: str, subscriptions: list, client=None, page_size: int = RESOURCE_GRAPH_PAGE_SIZE) -> list:
+    """
+    Runs a Resource Graph query and follows $skipToken until every page has been read.
+    """
+    client = client or get_arm_client()
+    rows = []
+    skip_token = None
+
+    while True:
+        options = {"$top": page_size, "resultFormat": "objectArray"}
+        if skip_token:
+            options["$skipToken"] = skip_token
+
+        page = client.post(
+            "/providers/Microsoft.ResourceGraph/resources",
+            body={"subscriptions": subscriptions, "query": query, "options": options},
+            api_version=RESOURCE_GRAPH_API_VERSION
+        )
+        rows.extend(page.get("data", []))
+
+        skip_token = page.get("$skipToken")
+        if not skip_token:
+            return rows
+
+
+def build_inventory_query(resource_group: str) -> str:
+    """
+    Builds the KQL query returning every service resource the mapper reports on.
+    """
+    types = ", ".join(f"'{t}'" for t in list(SERVICE_TYPES) + [SQL_DATABASE_TYPE])
+    resource_group = resource_group.replace("'", "\\'")
+    return (
+        "resources "
+        f"| where resourceGroup =~ '{resource_group}' "
+        f"| where type in~ ({types}) "
+        "| project id, name, type, kind, location, resourceGroup, subscriptionId, sku, tags, identity, properties "
+        "| order by id asc"
+    )
+
+
+def flatten(row: dict, key: str = None) -> dict:
+    """
+    Returns an ARM document in the shape of the `az` listing of its service: the entries
+    of `properties` moved to the top level, under their CLI names.
+    """
+    renames = CLI_PROPERTY_NAMES.get(key, {})
+    flattened = {name: value for name, value in row.items() if name not in ("properties", "subscriptionId")}
+    for name, value in (row.get("properties") or {}).items():
+        flattened.setdefault(renames.get(name, name), value)
+    return flattened
+
+
+def _list_app_settings(site_id: str, client) -> list:
+    """
+    Returns app settings in the `az webapp config appsettings list` format.
+    """
+    response = client.post(f"{site_id}/config/appsettings/list", api_version=WEB_API_VERSION)
+    return [
+        {"name": name, "value": value, "slotSetting": False}
+        for name, value in (response.get("properties") or {}).items()
+    ]
+
+
+def _list_connection_strings(site_id: str, client) -> list:
+    """
+    Returns connection strings in the `az webapp config connection-string list` format.
+    """
+    response = client.post(f"{site_id}/config/connectionstrings/list", api_version=WEB_API_VERSION)
+    return [
+        {"name": name, "value": value.get("value"), "type": value.get("type"), "slotSetting": False}
+        for name, value in (response.get("properties") or {}).items()
+    ]
+
+
+def _list_firewall_rules(server_id: str, client) -> list:
+    """
+    Returns the firewall rules of a SQL server in the `az sql server firewall-rule list` format,
+    following nextLink across pages.
+    """
+    return [flatten(rule) for rule in client.list(f"{server_id}/firewallRules", api_version=SQL_API_VERSION)]
+
+
+def map_dependencies(resource_group: str, max_workers: int = 8, client=None) -> dict:
+    """
+    Builds the Azure Service Dependencies Mapper output from Resource Graph.
+
+    Everything Resource Graph indexes comes from one paginated query. App
+    settings, connection strings and SQL firewall rules are not indexed, so
+    they are read with per-item ARM calls run concurrently.
+    """
+    client = client or get_arm_client()
+    rows = query_resources(build_inventory_query(resource_group), [get_subscription_id()], client)
+
+    dependencies = {key: [] for key in SERVICE_TYPES.values()}
+    dependencies["function_apps"] = []
+    servers_by_id = {}
+    databases = []
+
+    for row in rows:
+        resource_type = row.get("type", "").lower()
+
+        if resource_type == SQL_DATABASE_TYPE:
+            databases.append(flatten(row))
+            continue
+
+        key = SERVICE_TYPES.get(resource_type)
+        if key is None:
+            continue
+        if key == "webapps":
+            # `az webapp list` leaves out function apps and sites without a kind
+            kind = (row.get("kind") or "").lower()
+            if not kind:
+                continue
+            if "function" in kind:
+                key = "function_apps"
+
+        properties = row.get("properties") or {}
+        if key in NESTED_PROPERTIES:
+            item = {name: value for name, value in row.items() if name != "subscriptionId"}
+        else:
+            item = flatten(row, key)
+        if key == "storage_accounts":
+            item["network_rules"] = item.get("networkRuleSet")
+        elif key == "keyvaults":
+            item["access_policies"] = properties.get("accessPolicies", [])
+        elif key == "virtual_machines":
+            # The full resource document, as the CLI backend reads it
+            item["details"] = dict(row)
+        elif key == "sql_servers":
+            item["databases"] = []
+            servers_by_id[item["id"].lower()] = item
+
+        dependencies[key].append(item)
+
+    for database in databases:
+        server_id = database["id"].lower().rsplit("/databases/", 1)[0]
+        if server_id in servers_by_id:
+            servers_by_id[server_id]["databases"].append(database)
+
+    # Follow-up reads for data Resource Graph does not index
+    followups = []
+    for server in dependencies["sql_servers"]:
+        followups.append((server, "firewall_rules", _list_firewall_rules))
+    for webapp in dependencies["webapps"]:
+        followups.append((webapp, "app_settings", _list_app_settings))
+        followups.append((webapp, "connection_strings", _list_connection_strings))
+    for func in dependencies["function_apps"]:
+        followups.append((func, "app_settings", _list_app_settings))
+
+    def run_followup(followup):
+        item, field, fetch = followup
+        try:
+            item[field] = fetch(item["id"], client)
+        except Exception as e:
+            item.setdefault("errors", {})[field] = str(e)
+
+    with ThreadPoolExecutor(max_workers=max(1, max_workers)) as executor:
+        list(executor.map(run_followup, followups))
+
+    return dependencies
@@ -0,0 +1,291 @@
+"""
+Rule packs for Terraform validation.
+
+Rules are declared in packs: YAML files (the built-in ones live in
+config/rules/) or Python modules exposing a RULES list of the same dicts.
+Extra packs are listed in REPLICA_RULE_PACKS, separated by os.pathsep, as
+YAML files, directories of YAML files or importable module names.
+
+All rules are compiled once into a single matcher: resource-type and attribute
+rules into lookup tables keyed on the resource type or attribute name, pattern
+rules into one alternation regex. Evaluating a configuration is then one pass
+over its resources, one over its attributes and one regex scan per file,
+however many rules are loaded. Every rule counts its own hits and time.
+
+A pattern with global inline flags such as (?i) is scoped to its own
+alternative; one that cannot share the alternation (named groups,
+backreferences) is scanned on its own. The time of the shared scan is
+split across the pattern rules by the time each takes alone, measured on
+a sampling run every SAMPLE_INTERVAL evaluations. The sampling run also
+counts, per rule, the matches it lost to an earlier alternative matching
+the same text ("shadowed"), so such rules are not reported as silent.
+"""
+import os
+import re
+import json
+import time
+import hashlib
+import importlib
+import threading
+
+import yaml
+
+BUILTIN_PACK_DIR = os.path.join(os.path.dirname(__file__), "config", "rules")
+MATCH_TYPES = ("resource_type", "attribute", "pattern")
+SEVERITIES = ("critical", "high", "medium", "low")
+# Evaluations between two sampling runs that time each pattern rule alone
+SAMPLE_INTERVAL = 20
+GLOBAL_FLAGS = re.compile(r"^\(\?([aiLmsux]+)\)")
+BACKREFERENCE = re.compile(r"\\[1-9]|\(\?P=")
+
+
+class Rule:
+    """
+    One compiled rule.
+    """
+
+    def __init__(self, spec: dict, pack: str):
+        self.id = spec["id"]
+        self.pack = pack
+        self.spec = spec
+        self.match = spec["match"]
+        if self.match not in MATCH_TYPES:
+            raise ValueError(f"rule {self.id}: unknown match {self.match!r}, use one of {', '.join(MATCH_TYPES)}")
+        self.severity = spec.get("severity", "medium")
+        if self.severity not in SEVERITIES:
+            raise ValueError(f"rule {self.id}: unknown severity {self.severity!r}")
+        self.category = spec.get("category", "config")
+        self.message = spec.get("message", self.id)
+        self.replacement = spec.get("replacement")
+        self.documentation = spec.get("documentation")
+        self.resource_types = set(spec.get("resource_types") or ())
+        self.attributes = list(spec.get("attributes") or ())
+        self.literal = bool(spec.get("literal"))
+        self.value = re.compile(spec["value"]) if spec.get("value") else None
+        self.pattern = spec.get("pattern")
+        if self.match == "resource_type" and not self.resource_types:
+            raise ValueError(f"rule {self.id}: resource_type rules need resource_types")
+        if self.match == "attribute" and not self.attributes:
+            raise ValueError(f"rule {self.id}: attribute rules need attributes")
+        if self.match == "pattern":
+            if not self.pattern:
+                raise ValueError(f"rule {self.id}: pattern rules need a pattern")
+            try:
+                self.regex = re.compile(self.pattern, re.MULTILINE)
+            except re.error as e:
+                raise ValueError(f"rule {self.id}: invalid pattern: {e}")
+
+    def finding(self, file: str, line: int, address: str, snippet: str) -> dict:
+        return {
+            "rule": self.id,
+            "pack": self.pack,
+            "category": self.category,
+            "severity": self.severity,
+            "message": self.message,
+            "file": file,
+            "line": line,
+            "address": address,
+            "replacement": self.replacement,
+            "documentation": self.documentation,
+            "code_snippet": snippet,
+        }
+
+
+def _load_yaml_pack(path: str) -> tuple:
+    with open(path) as f:
+        pack = yaml.safe_load(f) or {}
+    name = pack.get("pack") or os.path.splitext(os.path.basename(path))[0]
+    return name, pack.get("rules") or []
+
+
+def _load_python_pack(module_name: str) -> tuple:
+    module = importlib.import_module(module_name)
+    return getattr(module, "PACK", module_name), list(getattr(module, "RULES"))
+
+
+def load_packs(sources=None) -> list:
+    """
+    Returns the compiled rules of the built-in packs followed by `sources`
+    (default: REPLICA_RULE_PACKS). Rule ids must be unique across packs.
+    """
+    if sources is None:
+        sources = [source for source in os.getenv("REPLICA_RULE_PACKS", "").split(os.pathsep) if source]
+    packs = []
+    for source in [BUILTIN_PACK_DIR] + list(sources):
+        if os.path.isdir(source):
+            packs += [
+                _load_yaml_pack(os.path.join(source, name))
+                for name in sorted(os.listdir(source)) if name.endswith((".yaml", ".yml"))
+            ]
+        elif source.endswith((".yaml", ".yml")):
+            packs.append(_load_yaml_pack(source))
+        else:
+            packs.append(_load_python_pack(source))
+
+    rules, seen = [], {}
+    for pack, specs in packs:
+        for spec in specs:
+            rule = Rule(spec, pack)
+            if rule.id in seen:
+                raise ValueError(f"rule {rule.id} of pack {pack} is already defined by pack {seen[rule.id]}")
+            seen[rule.id] = pack
+            rules.append(rule)
+    return rules
+
+
+def _embeddable(pattern: str):
+    """
+    The pattern rewritten to be one alternative of the combined regex (leading global
+    flags scoped to it), or None when it has to be scanned on its own.
+    """
+    flags = GLOBAL_FLAGS.match(pattern)
+    if flags:
+        if set(flags.group(1)) - set("imsx"):
+            return None
+        pattern = f"(?{flags.group(1)}:{pattern[flags.end():]})"
+    try:
+        # Group names and numbers would clash with or shift under the other alternatives
+        if re.compile(pattern).groupindex or BACKREFERENCE.search(pattern):
+            return None
+        re.compile(f"(?P<r>{pattern})|(?P<s>x)", re.MULTILINE)
+    except re.error:
+        return None
+    return pattern
+
+
+class RuleEngine:
+    """
+    All loaded rules compiled into lookup tables and one combined regex, plus the
+    pattern rules that cannot be part of it.
+    """
+
+    def __init__(self, rules: list):
+        self.rules = rules
+        self.packs = sorted({rule.pack for rule in rules})
+        self.by_resource_type = {}
+        self.by_attribute = {}
+        self.pattern_rules = {}
+        self.separate_rules = []
+        alternatives = []
+        for rule in rules:
+            for resource_type in rule.resource_types if rule.match == "resource_type" else ():
+                self.by_resource_type.setdefault(resource_type, []).append(rule)
+            for attribute in rule.attributes if rule.match == "attribute" else ():
+                self.by_attribute.setdefault(attribute, []).append(rule)
+            if rule.match == "pattern":
+                pattern = _embeddable(rule.pattern)
+                if pattern is None:
+                    self.separate_rules.append(rule)
+                    continue
+                group = f"r{len(self.pattern_rules)}"
+                self.pattern_rules[group] = rule
+                alternatives.append(f"(?P<{group}>{pattern})")
+        self.combined = re.compile("|".join(alternatives), re.MULTILINE) if alternatives else None
+        self.stats = {rule.id: {"hits": 0, "seconds": 0.0, "shadowed": 0} for rule in rules}
+        # Seconds each combined pattern rule took alone on the last sampling run
+        self.sampled = {}
+        self._evaluations = 0
+        # Identifies the loaded rules, so results memoized under other rules are not reused
+        self.fingerprint = hashlib.sha256(
+            json.dumps([(rule.pack, rule.spec) for rule in rules], sort_keys=True, default=str).encode()
+        ).hexdigest()
+        self._lock = threading.Lock()
+
+    def evaluate(self, configuration) -> tuple:
+        """
+        Runs every rule against an HclIndex. Returns (findings, per-rule stats of this evaluation:
+        hits, seconds and, on sampling runs, matches shadowed by an earlier pattern rule).
+        """
+        findings = []
+        stats = {rule.id: {"hits": 0, "seconds": 0.0, "shadowed": 0} for rule in self.rules}
+
+        def record(rule, started, hits):
+            stats[rule.id]["hits"] += len(hits)
+            stats[rule.id]["seconds"] += time.perf_counter() - started
+            findings.extend(hits)
+
+        for resource_type, blocks in configuration.by_resource_type.items():
+            for rule in self.by_resource_type.get(resource_type, ()):
+                started = time.perf_counter()
+                record(rule, started, [
+                    rule.finding(block.file, block.line, block.address, f'resource "{resource_type}" "{block.labels[-1]}" {{')
+                    for block in blocks
+                ])
+
+        for name, entries in configuration.by_attribute.items():
+            for rule in self.by_attribute.get(name, ()):
+                started = time.perf_counter()
+                hits = []
+                for top, _, attribute in entries:
+                    if rule.resource_types and (top.block_type != "resource" or top.labels[0] not in rule.resource_types):
+                        continue
+                    if rule.literal and not isinstance(attribute.literal, str):
+                        continue
+                    if rule.value is not None and not rule.value.search(attribute.expression):
+                        continue
+                    hits.append(rule.finding(top.file, attribute.line, top.address,
+                                             f"{attribute.name} = {attribute.expression}"))
+                record(rule, started, hits)
+
+        def finding(rule, name, source, match):
+            line = source.count("\n", 0, match.start()) + 1
+            return rule.finding(name, line, "", match.group(0).strip())
+
+        for rule in self.separate_rules:
+            started = time.perf_counter()
+            record(rule, started, [
+                finding(rule, name, hcl_file.source, match)
+                for name, hcl_file in configuration.files.items() for match in rule.regex.finditer(hcl_file.source)
+            ])
+
+        if self.combined is not None:
+            with self._lock:
+                sampling = self._evaluations % SAMPLE_INTERVAL == 0
+                self._evaluations += 1
+            scanned = 0.0
+            for name, hcl_file in configuration.files.items():
+                started = time.perf_counter()
+                matches = list(self.combined.finditer(hcl_file.source))
+                scanned += time.perf_counter() - started
+                for match in matches:
+                    rule = self.pattern_rules[match.lastgroup]
+                    stats[rule.id]["hits"] += 1
+                    findings.append(finding(rule, name, hcl_file.source, match))
+            if sampling:
+                sampled = {}
+                for rule in self.pattern_rules.values():
+                    started = time.perf_counter()
+                    alone = sum(
+                        1 for hcl_file in configuration.files.values() for _ in rule.regex.finditer(hcl_file.source)
+                    )
+                    sampled[rule.id] = time.perf_counter() - started
+                    # Matches an earlier alternative took over in the combined scan
+                    stats[rule.id]["shadowed"] = max(0, alone - stats[rule.id]["hits"])
+                with self._lock:
+                    self.sampled = sampled
+            weights = self.sampled
+            total = sum(weights.get(rule.id, 0.0) for rule in self.pattern_rules.values())
+            for rule in self.pattern_rules.values():
+                share = weights.get(rule.id, 0.0) / total if total else 1 / len(self.pattern_rules)
+                stats[rule.id]["seconds"] += scanned * share
+
+        with self._lock:
+            for rule_id, rule_stats in stats.items():
+                self.stats[rule_id]["hits"] += rule_stats["hits"]
+                self.stats[rule_id]["seconds"] += rule_stats["seconds"]
+                self.stats[rule_id]["shadowed"] += rule_stats["shadowed"]
+        findings.sort(key=lambda finding: (SEVERITIES.index(finding["severity"]), finding["file"], finding["line"]))
+        return findings, stats
+
+
+_engine = None
+
+
+def get_rule_engine() -> RuleEngine:
+    """
+    Returns the process-wide rule engine, compiling the rule packs on first use.
+    """
+    global _engine
+    if _engine is None:
+        _engine = RuleEngine(load_packs())
+    return _engine
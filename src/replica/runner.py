@@ -0,0 +1,241 @@
+"""
+Shared runner for every external command (`az`, `terraform`) and ARM call budget.
+
+- one process-wide semaphore caps how many commands run at the same time
+- every command gets a timeout
+- throttling (HTTP 429) and transient failures are retried with exponential
+  backoff and full jitter, honouring Retry-After hints when present
+- calls, retries, bytes and latency are counted for the final run summary
+"""
+import os
+import re
+import time
+import random
+import threading
+import subprocess
+from collections import deque
+from contextlib import nullcontext
+from dataclasses import dataclass
+
+from replica.metrics import get_recorder
+
+# Status codes only count in a status context, so resource names, IDs, ports or SKUs that
+# contain 429 or 50x, and terraform diagnostics about timeouts, do not trigger retries
+THROTTLING_PATTERNS = re.compile(
+    r"status([\s_]*code)?\s*[:=]?\s*['\"(]?429\b|HTTP/\d(\.\d)?\s+429\b|too\s*many\s*requests|"
+    r"\b\w*RequestsThrottled\b|[\"(]\w*Throttled[\")]|rate\s*limit(ed|\s+exceeded|\s+reached)",
+    re.IGNORECASE
+)
+TRANSIENT_PATTERNS = re.compile(
+    r"status([\s_]*code)?\s*[:=]?\s*['\"(]?50[0234]\b|HTTP/\d(\.\d)?\s+50[0234]\b|"
+    r"\b(InternalServerError|ServiceUnavailable|GatewayTimeout|BadGateway)\b|"
+    r"temporarily unavailable|connection (reset|aborted|refused)|(read|connect|connection|request) timed out|"
+    r"\b(ReadTimeout|ConnectTimeout)(Error)?\b|dial tcp[^\n]*i/o timeout|RemoteDisconnected|"
+    r"EOF occurred|Max retries exceeded",
+    re.IGNORECASE
+)
+RETRY_AFTER_PATTERN = re.compile(r"retry[- ]after\D{0,10}(\d+)", re.IGNORECASE)
+
+
+@dataclass
+class CommandResult:
+    """
+    Outcome of a command after retries.
+    """
+    returncode: int
+    stdout: str
+    stderr: str
+    seconds: float
+    attempts: int
+
+
+def classify_failure(output: str):
+    """
+    Returns "throttled", "transient" or None for a failed command's output or error message.
+    """
+    if THROTTLING_PATTERNS.search(output or ""):
+        return "throttled"
+    if TRANSIENT_PATTERNS.search(output or ""):
+        return "transient"
+    return None
+
+
+class CommandRunner:
+    """
+    Runs shell commands under a shared concurrency budget with timeouts and retries.
+    """
+
+    def __init__(self, max_concurrency: int = 16, default_timeout: float = 300, max_retries: int = 4,
+                 base_delay: float = 1.0, max_delay: float = 30.0):
+        self.max_concurrency = max(1, max_concurrency)
+        self.default_timeout = default_timeout
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self._budget = threading.BoundedSemaphore(self.max_concurrency)
+        self._shared_limits = {}
+        self._lock = threading.Lock()
+        self.stats = {"calls": 0, "attempts": 0, "retries": 0, "throttled": 0, "timeouts": 0, "failures": 0, "bytes": 0}
+
+    def count(self, **increments):
+        with self._lock:
+            for key, value in increments.items():
+                self.stats[key] = self.stats.get(key, 0) + value
+
+    def budget(self):
+        """
+        Context manager holding one slot of the shared concurrency budget.
+        """
+        return self._budget
+
+    def set_shared_limit(self, program: str, semaphore):
+        """
+        Caps a program ("az", "terraform" or "llm") with a semaphore shared by several processes (batch mode).
+        """
+        self._shared_limits[program] = semaphore
+
+    def shared_slot(self, program: str):
+        """
+        Context manager holding one slot of the cross-process limit of a program, if one is set.
+        """
+        return self._shared_limits.get(program) or nullcontext()
+
+    def backoff_delay(self, attempt: int, output: str = "") -> float:
+        """
+        Exponential backoff with full jitter; a Retry-After hint sets the minimum wait.
+        """
+        delay = random.uniform(0, min(self.max_delay, self.base_delay * (2 ** attempt)))
+        hint = RETRY_AFTER_PATTERN.search(output or "")
+        if hint:
+            delay = max(delay, min(float(hint.group(1)), self.max_delay))
+        return delay
+
+    def run(self, cmd: str, cwd: str = None, timeout: float = None, retries: int = None) -> CommandResult:
+        """
+        Runs a shell command, retrying throttled and transient failures.
+        Raises subprocess.TimeoutExpired if the last attempt timed out.
+        """
+        timeout = self.default_timeout if timeout is None else timeout
+        retries = self.max_retries if retries is None else retries
+        program = os.path.basename(cmd.split()[0])
+        recorder = get_recorder("cli" if program == "az" else program)
+        self.count(calls=1)
+
+        start = time.perf_counter()
+        attempt = 0
+        while True:
+            self.count(attempts=1)
+            attempt_start = time.perf_counter()
+            try:
+                with self._budget, self.shared_slot(program):
+                    result = subprocess.run(cmd, shell=True, cwd=cwd, capture_output=True, text=True, timeout=timeout)
+            except subprocess.TimeoutExpired:
+                recorder.record(time.perf_counter() - attempt_start)
+                self.count(timeouts=1)
+                if attempt >= retries:
+                    self.count(failures=1)
+                    raise
+                kind, output = "transient", ""
+            else:
+                recorder.record(time.perf_counter() - attempt_start)
+                self.count(bytes=len(result.stdout or "") + len(result.stderr or ""))
+                if result.returncode == 0:
+                    return CommandResult(0, result.stdout, result.stderr, time.perf_counter() - start, attempt + 1)
+
+                output = f"{result.stderr}\n{result.stdout}"
+                kind = classify_failure(output)
+                if kind is None or attempt >= retries:
+                    self.count(failures=1)
+                    return CommandResult(result.returncode, result.stdout, result.stderr, time.perf_counter() - start, attempt + 1)
+
+            if kind == "throttled":
+                self.count(throttled=1)
+            self.count(retries=1)
+            time.sleep(self.backoff_delay(attempt, output))
+            attempt += 1
+
+    def stream(self, cmd: str, on_line=None, cwd: str = None, timeout: float = None, tail: int = 50) -> CommandResult:
+        """
+        Runs a shell command once, passing each stdout line to `on_line` as it is written.
+        Only the last `tail` lines of stdout and stderr are kept for the result, so memory
+        stays flat however long the command runs. Not retried; meant for long-running
+        commands that change infrastructure. Raises subprocess.TimeoutExpired on timeout.
+        """
+        timeout = self.default_timeout if timeout is None else timeout
+        program = os.path.basename(cmd.split()[0])
+        recorder = get_recorder("cli" if program == "az" else program)
+        self.count(calls=1, attempts=1)
+        stdout_tail, stderr_tail = deque(maxlen=tail), deque(maxlen=tail)
+        timed_out = threading.Event()
+
+        def drain_stderr(stream):
+            for line in stream:
+                self.count(bytes=len(line))
+                stderr_tail.append(line.rstrip("\n"))
+
+        def kill(process):
+            timed_out.set()
+            process.kill()
+
+        start = time.perf_counter()
+        with self._budget, self.shared_slot(program):
+            process = subprocess.Popen(cmd, shell=True, cwd=cwd, stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+                                       text=True, bufsize=1)
+            reader = threading.Thread(target=drain_stderr, args=(process.stderr,), daemon=True)
+            reader.start()
+            timer = threading.Timer(timeout, kill, args=(process,))
+            timer.start()
+            try:
+                for line in process.stdout:
+                    self.count(bytes=len(line))
+                    stdout_tail.append(line.rstrip("\n"))
+                    if on_line is not None:
+                        on_line(line)
+                process.wait()
+            finally:
+                timer.cancel()
+                if process.poll() is None:
+                    process.kill()
+                    process.wait()
+                reader.join()
+        recorder.record(time.perf_counter() - start)
+
+        if timed_out.is_set():
+            self.count(timeouts=1, failures=1)
+            raise subprocess.TimeoutExpired(cmd, timeout)
+        if process.returncode != 0:
+            self.count(failures=1)
+        return CommandResult(process.returncode, "\n".join(stdout_tail), "\n".join(stderr_tail),
+                             time.perf_counter() - start, 1)
+
+    def reset_stats(self):
+        with self._lock:
+            self.stats = {key: 0 for key in self.stats}
+
+    def summary(self) -> dict:
+        """
+        Returns a snapshot of the counters; latency percentiles are kept per program in replica.metrics.
+        """
+        with self._lock:
+            return dict(self.stats)
+
+
+_runner = None
+_runner_lock = threading.Lock()
+
+
+def get_runner() -> CommandRunner:
+    """
+    Returns the process-wide runner configured from the REPLICA_* environment settings.
+    """
+    global _runner
+    with _runner_lock:
+        if _runner is None:
+            _runner = CommandRunner(
+                max_concurrency=int(os.getenv("REPLICA_MAX_CONCURRENT_COMMANDS", "16")),
+                default_timeout=float(os.getenv("REPLICA_COMMAND_TIMEOUT", "300")),
+                max_retries=int(os.getenv("REPLICA_COMMAND_RETRIES", "4")),
+                base_delay=float(os.getenv("REPLICA_RETRY_BASE_DELAY", "1.0")),
+                max_delay=float(os.getenv("REPLICA_RETRY_MAX_DELAY", "30"))
+            )
+        return _runner
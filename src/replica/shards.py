@@ -0,0 +1,438 @@
+"""
+Sharded Terraform layout: one root module and state per tier.
+
+With REPLICA_TF_LAYOUT=sharded, the configuration in terraform/ stays the one
+that is generated and validated, and `plan`, `apply` and `destroy` run on
+root modules written from it to terraform/shards/<shard>/, one per tier
+(network, data, compute, app), each with its own local state. A plan then
+only refreshes the resources of its shard, and one slow resource only holds
+back the shards that depend on its own.
+
+- every resource goes to the tier of the discovered resource it was rendered
+  or generated for; helper resources (passwords, keys, associations) go with
+  the resources that use them
+- tiers that refer to each other both ways are merged into one shard, so the
+  shards form a DAG
+- a resource referenced from another shard is exported whole as a sensitive
+  output, and the other shard reads it through a terraform_remote_state data
+  source on the local backend
+- shards are planned and applied concurrently as soon as the shards they read
+  from have been applied (destroyed in the reverse order)
+"""
+import os
+import re
+import json
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+
+from replica.dependencies import (
+    DependencyGraph, configuration_graph, configuration_references, direct_references, max_parallelism
+)
+from replica.hcl import HclError, load_configuration, tokenize
+from replica.renderer import Block, Expr, load_render_report
+from replica.runner import get_runner
+from replica.terraform import (
+    APPLY_TIMEOUT, LOCK_FILE, apply_plan, configure_terraform_environment, ensure_initialized, plan, stream_command,
+    streaming_enabled
+)
+from replica.tiers import TIERS, tier_of
+
+SHARD_DIR = "shards"
+MANIFEST = "manifest.json"
+STATE_FILE = "terraform.tfstate"
+SHARED_FILES = ("terraform.tfvars", LOCK_FILE)
+
+
+def sharded_layout() -> bool:
+    return os.getenv("REPLICA_TF_LAYOUT", "single") == "sharded"
+
+
+def _arm_type(resource_id: str) -> str:
+    parts = resource_id.lower().split("/providers/", 1)[-1].split("/")
+    return "/".join([parts[0]] + parts[1::2])
+
+
+def assign_tiers(terraform_dir: str, graph: DependencyGraph) -> dict:
+    """
+    Returns {address: tier} for the resources and modules of the configuration graph.
+    """
+    tiers = {}
+    report = load_render_report(terraform_dir) or {}
+    for record_id, address in (report.get("references") or {}).items():
+        tiers.setdefault(address, tier_of(_arm_type(record_id)))
+    merge_path = os.path.join(terraform_dir, "merge_report.json")
+    if os.path.exists(merge_path):
+        with open(merge_path) as f:
+            tiers.update(json.load(f).get("resources") or {})
+    tiers = {address: tier for address, tier in tiers.items() if address in graph.nodes}
+
+    # Helpers go to the earliest tier using them, else to the latest tier they use
+    order = list(TIERS)
+    dependents = graph.dependents()
+    changed = True
+    while changed:
+        changed = False
+        for node in sorted(graph.nodes):
+            if node in tiers:
+                continue
+            users = [tiers[item] for item in dependents[node] if item in tiers]
+            used = [tiers[item] for item in graph.dependencies[node] if item in tiers]
+            if users or used:
+                tiers[node] = min(users, key=order.index) if users else max(used, key=order.index)
+                changed = True
+    for node in graph.nodes:
+        tiers.setdefault(node, "app")
+    return tiers
+
+
+def _group_tiers(graph: DependencyGraph, tiers: dict) -> tuple:
+    """
+    Merges tiers that depend on each other into one shard. Returns ({tier: shard}, {shard: shards it reads from}).
+    """
+    order = list(TIERS)
+    used = sorted(set(tiers.values()), key=order.index)
+    edges = {tier: set() for tier in used}
+    for node, dependencies in graph.dependencies.items():
+        for dependency in dependencies:
+            if tiers[dependency] != tiers[node]:
+                edges[tiers[node]].add(tiers[dependency])
+
+    def reachable(start: str) -> set:
+        seen, stack = set(), [start]
+        while stack:
+            for item in edges[stack.pop()]:
+                if item not in seen:
+                    seen.add(item)
+                    stack.append(item)
+        return seen
+
+    reach = {tier: reachable(tier) for tier in used}
+    shard_of = {}
+    for tier in used:
+        group = [other for other in used if other == tier or (other in reach[tier] and tier in reach[other])]
+        shard_of[tier] = "-".join(group)
+    depends = {shard: set() for shard in shard_of.values()}
+    for tier, targets in edges.items():
+        depends[shard_of[tier]] |= {shard_of[target] for target in targets if shard_of[target] != shard_of[tier]}
+    return shard_of, depends
+
+
+def _export_name(address: str) -> str:
+    return address.replace(".", "__")
+
+
+def _state_name(shard: str) -> str:
+    return shard.replace("-", "_")
+
+
+def _rewrite(text: str, foreign: dict) -> str:
+    """
+    Points references to resources of other shards ({address: shard}) at their remote state.
+    """
+    if not foreign:
+        return text
+    pattern = re.compile(
+        r"(?<![\w.])(" + "|".join(re.escape(address) for address in sorted(foreign, key=len, reverse=True)) + r")(?![\w-])"
+    )
+    text = pattern.sub(
+        lambda match: (f"data.terraform_remote_state.{_state_name(foreign[match.group(1)])}"
+                       f".outputs.{_export_name(match.group(1))}"),
+        text
+    )
+
+    # depends_on only takes addresses; the shard order already covers other shards
+    def keep_local(match):
+        items = [item.strip() for item in match.group(2).split(",")]
+        return match.group(1) + ", ".join(item for item in items if item and ".outputs." not in item) + "]"
+
+    return re.sub(r"(depends_on\s*=\s*\[)([^\]]*)\]", keep_local, text)
+
+
+def _without_backend(text: str) -> str:
+    """
+    Text of a terraform block without its backend or cloud blocks; every shard gets its own local backend.
+    """
+    tokens = tokenize(text)
+    spans, depth, index = [], 0, 0
+    while index < len(tokens):
+        token = tokens[index]
+        if depth == 1 and token.kind == "ident" and token.value in ("backend", "cloud"):
+            opening = index + 1
+            while opening < len(tokens) and tokens[opening].kind == "string":
+                opening += 1
+            if opening < len(tokens) and tokens[opening].value == "{":
+                nested, end = 0, opening
+                for end in range(opening, len(tokens)):
+                    nested += {"{": 1, "}": -1}.get(tokens[end].value, 0)
+                    if nested == 0:
+                        break
+                spans.append((token.start, tokens[end].end))
+                index = end + 1
+                continue
+        depth += {"{": 1, "}": -1}.get(token.value, 0) if token.kind == "punct" else 0
+        index += 1
+    for start, end in reversed(spans):
+        line_start = text.rfind("\n", 0, start) + 1
+        line_end = text.find("\n", end)
+        # Whole lines go when the block is alone on them
+        if not text[line_start:start].strip() and (line_end == -1 or not text[end:line_end].strip()):
+            start, end = line_start, len(text) if line_end == -1 else line_end + 1
+        text = text[:start] + text[end:]
+    return text
+
+
+def _write(path: str, content: str):
+    # Unchanged files keep their content, so saved plans of the shard stay valid
+    if os.path.exists(path):
+        with open(path) as f:
+            if f.read() == content:
+                return
+    with open(path, "w") as f:
+        f.write(content)
+
+
+def write_shards(terraform_dir: str = "terraform") -> dict:
+    """
+    Writes one root module per shard to terraform/shards/<shard>/ and returns the manifest
+    (also written to terraform/shards/manifest.json): the shards with their tiers, resources
+    and the shards they read from, and the shard levels in dependency order.
+    """
+    configuration = load_configuration(terraform_dir)
+    if configuration.errors:
+        raise HclError("cannot shard a configuration that does not parse: " +
+                       "; ".join(f"{name}: {message}" for name, message in configuration.errors))
+    graph = configuration_graph(configuration)
+    tiers = assign_tiers(terraform_dir, graph)
+    shard_of, depends = _group_tiers(graph, tiers)
+    owner = {address: shard_of[tier] for address, tier in tiers.items()}
+    direct = direct_references(configuration)
+    references = configuration_references(configuration)
+
+    shard_graph = DependencyGraph()
+    for shard in depends:
+        shard_graph.add(shard)
+    for shard, upstream in depends.items():
+        for other in upstream:
+            shard_graph.depend(shard, other)
+    levels, _ = shard_graph.levels()
+    if not levels:
+        raise ValueError("nothing to shard: the configuration has no resource or module blocks")
+    position = {shard: index for index, level in enumerate(levels) for shard in level}
+
+    # Outputs go to the last shard whose resources they use
+    outputs = {}
+    for block in configuration.blocks("output"):
+        used = {owner[address] for address in references.get(block.address, ()) if address in owner}
+        outputs[block.address] = max(used, key=lambda shard: (position[shard], shard)) if used else levels[0][0]
+
+    blocks = [block for hcl_file in configuration.files.values() for block in hcl_file.blocks]
+    locals_ = {
+        f"local.{name}": attribute
+        for block in configuration.blocks("locals") for name, attribute in block.attributes.items()
+    }
+    root = os.path.join(terraform_dir, SHARD_DIR)
+    members, exports = {}, {shard: set() for shard in depends}
+    for shard in depends:
+        own = [block for block in blocks if owner.get(block.address) == shard or outputs.get(block.address) == shard]
+        # Locals and data sources the shard's blocks use, directly or through each other
+        needed, stack = set(), [item for block in own for item in direct.get(block.address, ())]
+        while stack:
+            item = stack.pop()
+            if item.startswith(("local.", "data.")) and item not in needed:
+                needed.add(item)
+                stack.extend(direct.get(item, ()))
+        members[shard] = (own, needed)
+        for block in own:
+            for item in direct.get(block.address, ()):
+                if owner.get(item, shard) != shard:
+                    exports[owner[item]].add(item)
+        for item in needed:
+            for reference in direct.get(item, ()):
+                if owner.get(reference, shard) != shard:
+                    exports[owner[reference]].add(reference)
+
+    manifest = {"shards": {}, "levels": levels}
+    for shard, (own, needed) in members.items():
+        directory = os.path.join(root, shard)
+        os.makedirs(directory, exist_ok=True)
+        foreign = {address: other for address, other in owner.items() if other != shard}
+        read_from = sorted({
+            foreign[item] for address in [block.address for block in own] + sorted(needed)
+            for item in direct.get(address, ()) if item in foreign
+        })
+
+        main, outputs_text = [], []
+        for block in blocks:
+            if block.block_type in ("resource", "module") and block in own:
+                text = block.text
+                if block.block_type == "module":
+                    # Local module sources are two directories further away
+                    text = re.sub(r'(\bsource\s*=\s*")(\.\.?/)', r"\1../../\2", text)
+                main.append(_rewrite(text, foreign))
+            elif block.block_type == "data" and block.address in needed:
+                main.append(_rewrite(block.text, foreign))
+            elif block.block_type == "output" and block in own:
+                outputs_text.append(_rewrite(block.text, foreign))
+        local_blocks = [
+            f"locals {{\n  {name.split('.', 1)[1]} = {_rewrite(locals_[name].expression, foreign)}\n}}"
+            for name in sorted(needed) if name in locals_
+        ]
+        for address in sorted(exports[shard]):
+            outputs_text.append(
+                Block("output", _export_name(address)).set("value", Expr(address)).set("sensitive", True).render()
+            )
+        remote_states = [
+            Block("data", "terraform_remote_state", _state_name(other))
+            .set("backend", "local")
+            .set("config", {"path": f"../{other}/{STATE_FILE}"})
+            .render()
+            for other in read_from
+        ]
+        backend = Block("terraform")
+        backend.block("backend", "local").set("path", STATE_FILE)
+
+        files = {
+            "provider.tf": "\n\n".join(
+                _without_backend(block.text) if block.block_type == "terraform" else block.text
+                for block in blocks if block.block_type in ("terraform", "provider")
+            ),
+            "backend.tf": backend.render(),
+            "variables.tf": "\n\n".join(block.text for block in blocks if block.block_type == "variable"),
+            "main.tf": "\n\n".join(local_blocks + main),
+            "outputs.tf": "\n\n".join(outputs_text),
+            "remote_state.tf": "\n\n".join(remote_states),
+        }
+        for name, content in files.items():
+            path = os.path.join(directory, name)
+            if content:
+                _write(path, content + "\n")
+            elif os.path.exists(path):
+                os.remove(path)
+        # Inputs and provider pins follow terraform/ on every run
+        for name in SHARED_FILES:
+            source = os.path.join(terraform_dir, name)
+            if os.path.exists(source):
+                with open(source) as f:
+                    _write(os.path.join(directory, name), f.read())
+        manifest["shards"][shard] = {
+            "tiers": [tier for tier in TIERS if shard_of.get(tier) == shard],
+            "resources": sorted(block.address for block in own if block.block_type in ("resource", "module")),
+            "depends_on": sorted(depends[shard]),
+            "exports": sorted(exports[shard]),
+        }
+
+    if os.path.isdir(root):
+        stale = [name for name in os.listdir(root) if os.path.isdir(os.path.join(root, name)) and name not in depends]
+        # Shards of an earlier layout may still hold state; they are reported, never deleted
+        manifest["stale"] = sorted(stale)
+    with open(os.path.join(root, MANIFEST), "w") as f:
+        json.dump(manifest, f, indent=2)
+    return manifest
+
+
+def _has_state(directory: str) -> bool:
+    path = os.path.join(directory, STATE_FILE)
+    if not os.path.exists(path):
+        return False
+    with open(path) as f:
+        try:
+            return bool(json.load(f).get("resources"))
+        except ValueError:
+            return False
+
+
+def _failed(result, stage: str) -> dict:
+    return {"status": "failed", "stage": stage, "returncode": result.returncode,
+            "stdout": (result.stdout or "")[-2000:], "stderr": (result.stderr or "")[-2000:]}
+
+
+def _run_shard(directory: str, shard: str, command: str, replan: bool, cap: int) -> dict:
+    """
+    Runs one shard: init with its local backend, then plan (saved for apply), apply the
+    saved plan, or destroy.
+    """
+    initialized = ensure_initialized(directory, backend=True)
+    if initialized is not None and initialized.returncode != 0:
+        return _failed(initialized, "init")
+    if command == "plan":
+        result, summary = plan(directory)
+        return {"status": "success", "plan": summary} if summary is not None else _failed(result, "plan")
+    if command == "apply":
+        applied = apply_plan(directory, replan=replan, cap=cap, label=shard)
+        if applied.get("stage") == "plan":
+            applied["stdout"], applied["stderr"] = applied["stdout"][-2000:], applied["stderr"][-2000:]
+        elif not streaming_enabled() and "apply" in applied:
+            raw = applied["apply"]
+            raw["stdout"], raw["stderr"] = raw["stdout"][-2000:], raw["stderr"][-2000:]
+        applied["changed"] = bool(applied.get("plan") and (applied["plan"]["add"] or applied["plan"]["change"]
+                                                            or applied["plan"]["destroy"]))
+        return applied
+    if streaming_enabled():
+        destroyed = stream_command(directory, "destroy", label=shard)
+    else:
+        result = get_runner().run("terraform destroy -auto-approve", cwd=directory, timeout=APPLY_TIMEOUT, retries=0)
+        destroyed = {"returncode": result.returncode, "seconds": round(result.seconds, 1),
+                     "stdout": result.stdout[-2000:], "stderr": result.stderr[-2000:]}
+    return {"status": "success" if destroyed["returncode"] == 0 else "failed", "destroy": destroyed}
+
+
+def run_shards(terraform_dir: str = "terraform", command: str = "apply") -> dict:
+    """
+    Runs `plan`, `apply` or `destroy` over the shards written from the configuration.
+    apply starts a shard as soon as the shards it reads from have been applied; destroy
+    goes in the reverse order; plan covers the shards whose upstream shards already have
+    state (the others can only be planned during apply). Up to REPLICA_TF_SHARD_CONCURRENCY
+    shards run at once, sharing the REPLICA_TF_MAX_PARALLELISM budget.
+    """
+    configure_terraform_environment()
+    manifest = write_shards(terraform_dir)
+    root = os.path.join(terraform_dir, SHARD_DIR)
+    shards = manifest["shards"]
+    upstream = {shard: set(entry["depends_on"]) for shard, entry in shards.items()}
+    if command == "destroy":
+        upstream = {shard: {other for other in shards if shard in shards[other]["depends_on"]} for shard in shards}
+    workers = max(1, min(int(os.getenv("REPLICA_TF_SHARD_CONCURRENCY", "4")), len(shards) or 1))
+    cap = max(1, max_parallelism() // workers)
+
+    results = {}
+    if command == "plan":
+        for shard in shards:
+            waiting = [other for other in upstream[shard] if not _has_state(os.path.join(root, other))]
+            if waiting:
+                results[shard] = {"status": "waiting", "message": f"planned during apply, after {', '.join(waiting)}"}
+        upstream = {shard: set() for shard in shards}
+
+    pending = [shard for level in manifest["levels"] for shard in level if shard not in results]
+    if command == "destroy":
+        pending.reverse()
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        running = {}
+        while pending or running:
+            for shard in list(pending):
+                if any(results.get(other, {}).get("status") in ("failed", "refused", "skipped")
+                       for other in upstream[shard]):
+                    results[shard] = {"status": "skipped", "message": f"an upstream shard did not {command}"}
+                    pending.remove(shard)
+                elif all(other in results for other in upstream[shard]):
+                    # A plan saved before an upstream shard changed read outdated remote state
+                    replan = any(results[other].get("changed") for other in upstream[shard])
+                    running[executor.submit(_run_shard, os.path.join(root, shard), shard, command, replan, cap)] = shard
+                    pending.remove(shard)
+            if not running:
+                continue
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                shard = running.pop(future)
+                try:
+                    results[shard] = future.result()
+                except Exception as e:
+                    results[shard] = {"status": "failed", "message": str(e)}
+
+    statuses = {result["status"] for result in results.values()}
+    return {
+        "status": "success" if statuses <= {"success", "waiting"} else "failed",
+        "layout": "sharded",
+        "levels": manifest["levels"],
+        "shards": {shard: dict(results[shard], tiers=shards[shard]["tiers"], depends_on=shards[shard]["depends_on"])
+                   for shard in shards},
+        "stale": manifest.get("stale", []),
+    }
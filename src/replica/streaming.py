@@ -0,0 +1,75 @@
+"""
+NDJSON artifacts for streaming discovery.
+
+In streaming mode the Azure Resource Scanner writes one resource record per
+line as soon as it is hydrated, instead of building the whole inventory in
+memory and serialising it at once. Readers iterate the file line by line, so
+memory stays flat however many resources a group holds.
+"""
+import os
+import re
+import json
+
+
+def artifact_path(resource_group: str, directory: str = None) -> str:
+    """
+    Returns the NDJSON artifact of a resource group's scan inside the discovery detail directory.
+    """
+    directory = directory or os.getenv("REPLICA_DISCOVERY_DETAIL_DIR", "discovery")
+    safe_name = re.sub(r"[^A-Za-z0-9._-]", "_", resource_group.lower())
+    return os.path.join(directory, f"azure_resource_scanner.{safe_name}.ndjson")
+
+
+class NdjsonWriter:
+    """
+    Writes one JSON record per line to a temporary file that replaces `path` only when
+    the writer is closed without an error, so readers never see a partial artifact.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.count = 0
+        self._tmp_path = f"{path}.tmp"
+        self._file = None
+
+    def __enter__(self):
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        self._file = open(self._tmp_path, "w")
+        return self
+
+    def write(self, record: dict) -> int:
+        """
+        Appends a record and returns its line index.
+        """
+        self._file.write(json.dumps(record, separators=(",", ":"), default=str))
+        self._file.write("\n")
+        self.count += 1
+        return self.count - 1
+
+    def __exit__(self, exc_type, exc, tb):
+        self._file.close()
+        if exc_type is None:
+            os.replace(self._tmp_path, self.path)
+        else:
+            os.remove(self._tmp_path)
+
+
+def iter_ndjson(path: str):
+    """
+    Yields the records of an NDJSON file one at a time.
+    """
+    with open(path) as f:
+        for line in f:
+            if line.strip():
+                yield json.loads(line)
+
+
+def read_record(path: str, index: int) -> dict:
+    """
+    Returns the record on line `index` (0-based) without loading the other lines.
+    """
+    for position, record in enumerate(iter_ndjson(path)):
+        if position == index:
+            return record
+    raise IndexError(f"{path} has no record {index}")
+
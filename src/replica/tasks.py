@@ -0,0 +1,36 @@
+"""
+Crew tasks whose output is produced in Python instead of by the agent.
+
+crewAI finishes a task by recording its output and end time, calling the
+task callback and writing output_file. Tasks that override _execute_core to
+skip the LLM finish through DirectTask._finish, so they behave like any
+other task of the crew.
+"""
+import datetime
+
+from crewai import Task
+from crewai.tasks.task_output import TaskOutput
+from crewai.tasks.output_format import OutputFormat
+
+
+class DirectTask(Task):
+    """
+    Task that can complete with a raw output computed without the agent.
+    """
+
+    def _finish(self, agent, raw: str) -> TaskOutput:
+        agent = agent or self.agent
+        self.start_time = self.start_time or datetime.datetime.now()
+        self.output = TaskOutput(
+            name=self.name,
+            description=self.description,
+            raw=raw,
+            agent=agent.role if agent else "",
+            output_format=OutputFormat.RAW,
+        )
+        self.end_time = datetime.datetime.now()
+        if self.callback:
+            self.callback(self.output)
+        if self.output_file:
+            self._save_file(raw)
+        return self.output
@@ -0,0 +1,541 @@
+"""
+Terraform working-directory management shared by the executor and the validator.
+
+- providers are installed once into a plugin cache shared by every run and
+  batch worker (TF_PLUGIN_CACHE_DIR, default <REPLICA_CACHE_DIR>/terraform-plugins)
+- with REPLICA_TF_PROVIDER_MIRROR set, providers are installed only from that
+  filesystem mirror, so init works without network access
+- the dependency lock file of a successful init is pinned per set of provider
+  requirements and copied into new directories with the same requirements, so
+  every run selects the same provider versions and finds them in the cache
+- `ensure_initialized` runs a fast `init -backend=false` when a directory has
+  not been initialized for its current provider requirements, which is all
+  `terraform validate` needs
+
+Terraform does not support concurrent installs into one plugin cache, so
+inits holding the cache are serialized with a file lock across processes.
+
+`plan` saves the plan to a file and summarizes `terraform show -json` of it
+(adds, changes and destroys per resource type); `apply` applies exactly that
+saved plan, so providers refresh against ARM once per deployment, and refuses
+plans that destroy anything unless REPLICA_ALLOW_DESTROY=1.
+
+`apply` and `destroy` run in streaming mode with terraform's machine-readable
+UI (`-json`): events are parsed as they arrive, progress is printed and written
+to a log file under REPLICA_TF_LOG_DIR, and the caller gets a compact summary
+with only a bounded tail of the output instead of the whole log.
+"""
+import os
+import json
+import time
+import shutil
+import hashlib
+from collections import deque
+from contextlib import contextmanager
+
+from replica.cache import DEFAULT_CACHE_DIR
+from replica.dependencies import plan_apply, record_durations
+from replica.hcl import load_configuration
+from replica.runner import get_runner
+
+LOCK_FILE = ".terraform.lock.hcl"
+INIT_MARKER = os.path.join(".terraform", "replica-init.json")
+INIT_TIMEOUT = 600
+APPLY_TIMEOUT = 1800
+STREAMED_COMMANDS = ("apply", "destroy")
+PLAN_FILE = "tfplan"
+PLAN_TIMEOUT = 1800
+# Options `apply` accepts together with a saved plan; the others shape the plan itself
+APPLY_PLAN_OPTIONS = ("-parallelism", "-lock", "-lock-timeout", "-no-color")
+
+
+def _write_atomic(path: str, content: str):
+    """
+    Replaces a file shared by concurrent runs without readers ever seeing it half written.
+    """
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    if os.path.exists(path):
+        with open(path) as f:
+            if f.read() == content:
+                return
+    temporary = f"{path}.{os.getpid()}.tmp"
+    with open(temporary, "w") as f:
+        f.write(content)
+    os.replace(temporary, path)
+
+
+def configure_terraform_environment() -> dict:
+    """
+    Exports the plugin cache (and the CLI configuration for the provider mirror) to the
+    environment terraform commands inherit. Returns the settings; safe to call repeatedly.
+    """
+    cache_dir = os.path.abspath(os.getenv("REPLICA_CACHE_DIR", DEFAULT_CACHE_DIR))
+    plugin_cache = os.path.abspath(os.getenv("TF_PLUGIN_CACHE_DIR", os.path.join(cache_dir, "terraform-plugins")))
+    os.makedirs(plugin_cache, exist_ok=True)
+    os.environ["TF_PLUGIN_CACHE_DIR"] = plugin_cache
+    os.environ.setdefault("TF_IN_AUTOMATION", "1")
+    os.environ.setdefault("TF_INPUT", "0")
+
+    mirror = os.getenv("REPLICA_TF_PROVIDER_MIRROR")
+    if mirror:
+        mirror = os.path.abspath(mirror)
+        cli_config = os.path.join(cache_dir, "terraform-mirror.tfrc")
+        _write_atomic(cli_config, (
+            "provider_installation {\n"
+            f"  filesystem_mirror {{\n    path = {json.dumps(mirror)}\n  }}\n"
+            "}\n"
+        ))
+        os.environ["TF_CLI_CONFIG_FILE"] = cli_config
+    return {"plugin_cache": plugin_cache, "mirror": mirror, "locks": os.path.join(cache_dir, "terraform-locks")}
+
+
+def provider_requirements(terraform_dir: str) -> dict:
+    """
+    Returns {provider: {"source": ..., "version": ...}} from the required_providers blocks.
+    """
+    requirements = {}
+    configuration = load_configuration(terraform_dir)
+    for block in configuration.blocks("terraform"):
+        for providers in block.nested("required_providers"):
+            for name, attribute in providers.attributes.items():
+                spec = {key: item.literal for key, item in attribute.object().items()}
+                requirements[name] = spec or {"version": attribute.literal}
+    return requirements
+
+
+def _requirements_digest(terraform_dir: str) -> str:
+    requirements = json.dumps(provider_requirements(terraform_dir), sort_keys=True)
+    return hashlib.sha256(requirements.encode()).hexdigest()
+
+
+@contextmanager
+def _plugin_cache_lock(plugin_cache: str):
+    """
+    Serializes inits that install into the shared plugin cache, across processes.
+    """
+    try:
+        import fcntl
+    except ImportError:  # no advisory locks on this platform
+        yield
+        return
+    with open(os.path.join(plugin_cache, ".init.lock"), "w") as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock, fcntl.LOCK_UN)
+
+
+def is_initialized(terraform_dir: str, backend: bool = False) -> bool:
+    """
+    True when the directory was initialized for its current provider requirements
+    (and with its backend, if `backend`).
+    """
+    marker = os.path.join(terraform_dir, INIT_MARKER)
+    if not os.path.exists(marker) or not os.path.exists(os.path.join(terraform_dir, LOCK_FILE)):
+        return False
+    with open(marker) as f:
+        state = json.load(f)
+    return state.get("requirements") == _requirements_digest(terraform_dir) and (state.get("backend") or not backend)
+
+
+def init(terraform_dir: str = "terraform", backend: bool = True, arguments: str = ""):
+    """
+    Runs `terraform init` with the shared plugin cache and the pinned lock file.
+    Returns the runner's CommandResult.
+    """
+    settings = configure_terraform_environment()
+    digest = _requirements_digest(terraform_dir)
+    pinned = os.path.join(settings["locks"], f"{digest}.hcl")
+    lock_path = os.path.join(terraform_dir, LOCK_FILE)
+    if not os.path.exists(lock_path) and os.path.exists(pinned):
+        shutil.copyfile(pinned, lock_path)
+
+    command = "terraform init -input=false"
+    if not backend:
+        command += " -backend=false"
+    if arguments:
+        command += f" {arguments}"
+    with _plugin_cache_lock(settings["plugin_cache"]):
+        result = get_runner().run(command, cwd=terraform_dir, timeout=INIT_TIMEOUT)
+
+    if result.returncode == 0 and os.path.exists(lock_path):
+        # Pin the lock file for the next directory with the same requirements
+        with open(lock_path) as f:
+            _write_atomic(pinned, f.read())
+        os.makedirs(os.path.join(terraform_dir, ".terraform"), exist_ok=True)
+        with open(os.path.join(terraform_dir, INIT_MARKER), "w") as f:
+            json.dump({"requirements": digest, "backend": backend}, f)
+    return result
+
+
+def ensure_initialized(terraform_dir: str = "terraform", backend: bool = False):
+    """
+    Runs `init` (by default with -backend=false) unless the directory is already initialized
+    for its current provider requirements. Returns the init CommandResult, or None if none was needed.
+    """
+    if is_initialized(terraform_dir, backend):
+        return None
+    return init(terraform_dir, backend=backend)
+
+
+def streaming_enabled() -> bool:
+    return os.getenv("REPLICA_TF_STREAMING", "1") != "0"
+
+
+class ApplyProgress:
+    """
+    Folds the events of `terraform apply -json` (or `destroy -json`) into progress
+    messages and a compact summary.
+    """
+
+    def __init__(self, tail: int = 20, slowest: int = 5):
+        self.planned = {}
+        self.started = {}
+        self.completed = {}
+        self.failed = {}
+        self.changes = None
+        self.outputs = {}
+        self.errors = []
+        self.warnings = 0
+        self.slowest = slowest
+        self.tail = deque(maxlen=tail)
+
+    def remaining(self) -> int:
+        return max(len(self.planned) - len(self.completed) - len(self.failed), 0)
+
+    def _counts(self) -> str:
+        counts = f"{len(self.completed)}/{len(self.planned) or '?'} done"
+        if self.failed:
+            counts += f", {len(self.failed)} failed"
+        return f"{counts}, {self.remaining()} remaining"
+
+    def feed(self, line: str):
+        """
+        Consumes one line of output. Returns a progress message, or None for events not worth printing.
+        """
+        line = line.strip()
+        if not line:
+            return None
+        try:
+            event = json.loads(line)
+        except ValueError:
+            self.tail.append(line)
+            return None
+        if not isinstance(event, dict):
+            return None
+        kind = event.get("type")
+        message = event.get("@message", "")
+        if message:
+            self.tail.append(message)
+        hook = event.get("hook") or {}
+        address = (hook.get("resource") or {}).get("addr")
+
+        if kind == "planned_change":
+            change = event.get("change") or {}
+            resource = (change.get("resource") or {}).get("addr")
+            if resource and change.get("action") not in ("noop", "read"):
+                self.planned[resource] = change.get("action")
+        elif kind == "change_summary":
+            self.changes = event.get("changes")
+            return message
+        elif kind == "apply_start" and address:
+            self.started[address] = time.perf_counter()
+            return f"{message} ({self._counts()})"
+        elif kind == "apply_progress" and address:
+            return message
+        elif kind == "apply_complete" and address:
+            if self.planned.get(address) == "replace" and hook.get("action") == "delete":
+                # The create half of the replacement is still to come
+                return message
+            seconds = hook.get("elapsed_seconds")
+            if seconds is None and address in self.started:
+                seconds = round(time.perf_counter() - self.started[address])
+            self.completed[address] = {"action": hook.get("action"), "seconds": seconds}
+            return f"{message} ({self._counts()})"
+        elif kind == "apply_errored" and address:
+            self.failed[address] = {"action": hook.get("action"), "seconds": hook.get("elapsed_seconds")}
+            return f"{message} ({self._counts()})"
+        elif kind == "diagnostic":
+            diagnostic = event.get("diagnostic") or {}
+            if diagnostic.get("severity") == "error":
+                self.errors.append({
+                    "summary": diagnostic.get("summary"),
+                    "detail": (diagnostic.get("detail") or "")[:1000],
+                    "address": diagnostic.get("address"),
+                })
+                return f"Error: {diagnostic.get('summary')}"
+            self.warnings += 1
+        elif kind == "outputs":
+            self.outputs = {
+                name: "(sensitive)" if value.get("sensitive") else value.get("value")
+                for name, value in (event.get("outputs") or {}).items()
+            }
+        return None
+
+    def summary(self, result) -> dict:
+        """
+        Returns the compact summary handed to the agent in place of the raw log.
+        """
+        slowest = sorted(self.completed.items(), key=lambda item: item[1]["seconds"] or 0, reverse=True)
+        summary = {
+            "status": "success" if result.returncode == 0 else "failed",
+            "returncode": result.returncode,
+            "seconds": round(result.seconds, 1),
+            "resources": {
+                "planned": len(self.planned),
+                "completed": len(self.completed),
+                "failed": len(self.failed),
+                "remaining": self.remaining(),
+            },
+            "changes": self.changes,
+            "slowest": [
+                {"address": address, "action": entry["action"], "seconds": entry["seconds"]}
+                for address, entry in slowest[:self.slowest]
+            ],
+            "failed_resources": [{"address": address, **entry} for address, entry in self.failed.items()],
+            "errors": self.errors,
+            "warnings": self.warnings,
+            "outputs": self.outputs,
+        }
+        if result.returncode != 0:
+            summary["tail"] = list(self.tail)
+            if result.stderr:
+                summary["stderr"] = result.stderr
+        return summary
+
+
+def stream_command(terraform_dir: str, command: str, arguments: str = "", timeout: float = APPLY_TIMEOUT,
+                   label: str = None) -> dict:
+    """
+    Runs `terraform apply` or `destroy` with -auto-approve -json, printing progress as
+    resources complete and logging it to REPLICA_TF_LOG_DIR (default: terraform_logs).
+    `label` tells apart the progress of commands running at the same time (e.g. shards).
+    Returns the summary from ApplyProgress plus the paths of the progress log and raw event log.
+    """
+    if command not in STREAMED_COMMANDS:
+        raise ValueError(f"streaming is supported for {', '.join(STREAMED_COMMANDS)}, not {command}")
+    configure_terraform_environment()
+    arguments = " ".join(part for part in arguments.split() if part not in ("-json", "-auto-approve"))
+    tail = int(os.getenv("REPLICA_TF_LOG_TAIL", "20"))
+    log_dir = os.path.abspath(os.getenv("REPLICA_TF_LOG_DIR", "terraform_logs"))
+    os.makedirs(log_dir, exist_ok=True)
+    name = f"{command}-{label + '-' if label else ''}{time.strftime('%Y%m%d-%H%M%S')}-{os.getpid()}"
+    log_path = os.path.join(log_dir, f"{name}.log")
+    events_path = os.path.join(log_dir, f"{name}.jsonl")
+
+    progress = ApplyProgress(tail=tail)
+    start = time.perf_counter()
+    with open(log_path, "w") as log, open(events_path, "w") as events:
+        def on_line(line):
+            events.write(line if line.endswith("\n") else f"{line}\n")
+            message = progress.feed(line)
+            if message:
+                stamped = f"[terraform {command}{' ' + label if label else ''} {time.perf_counter() - start:6.0f}s] {message}"
+                print(stamped, flush=True)
+                log.write(stamped + "\n")
+                log.flush()
+
+        result = get_runner().stream(
+            f"terraform {command} -auto-approve -json {arguments}".strip(),
+            on_line=on_line, cwd=terraform_dir, timeout=timeout, tail=tail
+        )
+    # Observed creation times refine the apply duration estimates
+    record_durations(progress.completed)
+    summary = progress.summary(result)
+    summary["command"] = f"{command} {arguments}".strip()
+    summary["log"] = log_path
+    summary["events"] = events_path
+    return summary
+
+
+def _configuration_digest(terraform_dir: str) -> str:
+    """
+    Digest of the root module files and the lock file a saved plan was made from.
+    """
+    digest = hashlib.sha256()
+    for name in sorted(os.listdir(terraform_dir)):
+        if name.endswith((".tf", ".tfvars")) or name == LOCK_FILE:
+            digest.update(name.encode())
+            with open(os.path.join(terraform_dir, name), "rb") as f:
+                digest.update(hashlib.sha256(f.read()).digest())
+    return digest.hexdigest()
+
+
+def _file_digest(path: str) -> str:
+    with open(path, "rb") as f:
+        return hashlib.sha256(f.read()).hexdigest()
+
+
+def _planned_changes(plan: dict) -> list:
+    """
+    The resource changes of a `terraform show -json` plan that do something on apply.
+    """
+    return [
+        change for change in plan.get("resource_changes") or []
+        if not set((change.get("change") or {}).get("actions") or ()) <= {"no-op", "read"}
+    ]
+
+
+def summarize_plan(plan: dict) -> dict:
+    """
+    Summarizes the output of `terraform show -json <plan file>`. Replacements count as
+    one add and one destroy, as in terraform's own "Plan:" line.
+    """
+    summary = {"add": 0, "change": 0, "destroy": 0, "replace": 0, "by_type": {}, "destroys": [], "outputs": []}
+    for change in _planned_changes(plan):
+        actions = set(change["change"]["actions"])
+        counts = summary["by_type"].setdefault(change.get("type", "?"), {"create": 0, "update": 0, "delete": 0, "replace": 0})
+        if {"create", "delete"} <= actions:
+            summary["replace"] += 1
+            counts["replace"] += 1
+        elif "create" in actions:
+            counts["create"] += 1
+        elif "update" in actions:
+            counts["update"] += 1
+        elif "delete" in actions:
+            counts["delete"] += 1
+        summary["add"] += "create" in actions
+        summary["change"] += "update" in actions
+        if "delete" in actions:
+            summary["destroy"] += 1
+            summary["destroys"].append(change.get("address"))
+    summary["by_type"] = {
+        resource_type: {action: count for action, count in counts.items() if count}
+        for resource_type, counts in summary["by_type"].items()
+    }
+    summary["outputs"] = sorted(plan.get("output_changes") or {})
+    return summary
+
+
+def destroy_guard(summary: dict):
+    """
+    Returns why a plan must not be applied, or None. Plans that delete or replace
+    resources are refused unless REPLICA_ALLOW_DESTROY=1.
+    """
+    if summary["destroy"] and os.getenv("REPLICA_ALLOW_DESTROY", "0") != "1":
+        return (f"the plan destroys {summary['destroy']} resource(s) ({', '.join(summary['destroys'][:10])}); "
+                f"a replica deployment only adds resources. Set REPLICA_ALLOW_DESTROY=1 to apply it anyway")
+    return None
+
+
+def plan(terraform_dir: str = "terraform", arguments: str = "", plan_file: str = PLAN_FILE) -> tuple:
+    """
+    Runs `terraform plan -out=<plan_file>` and summarizes the saved plan.
+    Returns (CommandResult of the plan, summary or None if planning failed). The summary
+    is also written next to the plan, so `saved_plan` can find it without another `show`.
+    """
+    configure_terraform_environment()
+    arguments = " ".join(part for part in arguments.split() if not part.startswith("-out"))
+    runner = get_runner()
+    result = runner.run(f"terraform plan -input=false -out={plan_file} {arguments}".strip(),
+                        cwd=terraform_dir, timeout=PLAN_TIMEOUT)
+    if result.returncode != 0:
+        return result, None
+    shown = runner.run(f"terraform show -json {plan_file}", cwd=terraform_dir, timeout=PLAN_TIMEOUT)
+    if shown.returncode != 0:
+        return shown, None
+    shown = json.loads(shown.stdout)
+    summary = summarize_plan(shown)
+    summary["plan_file"] = plan_file
+    with open(os.path.join(terraform_dir, f"{plan_file}.json"), "w") as f:
+        json.dump({
+            "configuration": _configuration_digest(terraform_dir),
+            "plan": _file_digest(os.path.join(terraform_dir, plan_file)),
+            "summary": summary,
+            "addresses": [change.get("address") for change in _planned_changes(shown)],
+        }, f, indent=2)
+    return result, summary
+
+
+def saved_plan(terraform_dir: str = "terraform", plan_file: str = PLAN_FILE):
+    """
+    Returns the summary of the saved plan if it is still the plan of the current
+    configuration, otherwise None.
+    """
+    plan_path = os.path.join(terraform_dir, plan_file)
+    summary_path = f"{plan_path}.json"
+    if not os.path.exists(plan_path) or not os.path.exists(summary_path):
+        return None
+    with open(summary_path) as f:
+        saved = json.load(f)
+    if saved.get("plan") != _file_digest(plan_path):
+        return None
+    if saved.get("configuration") != _configuration_digest(terraform_dir):
+        return None
+    return saved["summary"]
+
+
+def planned_addresses(terraform_dir: str = "terraform", plan_file: str = PLAN_FILE):
+    """
+    Addresses of the resources the saved plan creates, updates or deletes; None without a saved plan.
+    """
+    summary_path = os.path.join(terraform_dir, f"{plan_file}.json")
+    if not os.path.exists(summary_path):
+        return None
+    with open(summary_path) as f:
+        return json.load(f).get("addresses")
+
+
+def discard_plan(terraform_dir: str = "terraform", plan_file: str = PLAN_FILE):
+    """
+    Removes a saved plan once applied; terraform refuses to apply it a second time anyway.
+    """
+    for name in (plan_file, f"{plan_file}.json"):
+        path = os.path.join(terraform_dir, name)
+        if os.path.exists(path):
+            os.remove(path)
+
+
+def schedule_apply(terraform_dir: str = "terraform", plan_file: str = PLAN_FILE, cap: int = None) -> dict:
+    """
+    Sizes `-parallelism` for applying the saved plan from the dependency graph of the
+    configuration; see replica.dependencies.plan_apply.
+    """
+    return plan_apply(load_configuration(terraform_dir), planned_addresses(terraform_dir, plan_file), cap)
+
+
+def apply_plan(terraform_dir: str = "terraform", options=(), plan_options=(), plan_file: str = PLAN_FILE,
+               replan: bool = False, cap: int = None, label: str = None) -> dict:
+    """
+    Applies the saved plan, planning first (with `plan_options`) when there is none for the
+    current configuration or `replan` is set. Plans that destroy resources are refused.
+    Without a -parallelism option, it is sized from the dependency graph within `cap`.
+    Returns {"status": "success", "failed" or "refused", "plan", "schedule", "apply"}; if
+    planning failed, {"status": "failed", "stage": "plan", "returncode", "stdout", "stderr"}.
+    """
+    summary = None if replan else saved_plan(terraform_dir, plan_file)
+    if summary is None:
+        result, summary = plan(terraform_dir, " ".join(plan_options), plan_file=plan_file)
+        if summary is None:
+            return {"status": "failed", "stage": "plan", "returncode": result.returncode,
+                    "stdout": result.stdout, "stderr": result.stderr}
+    refusal = destroy_guard(summary)
+    if refusal:
+        return {"status": "refused", "plan": summary, "message": refusal}
+
+    options, schedule = list(options), None
+    if not any(option.startswith("-parallelism") for option in options):
+        # As wide as the dependency graph allows, within the throttling-safe cap
+        schedule = schedule_apply(terraform_dir, plan_file, cap)
+        options.append(f"-parallelism={schedule['parallelism']}")
+    arguments = " ".join(options + [plan_file])
+    try:
+        if streaming_enabled():
+            applied = stream_command(terraform_dir, "apply", arguments, label=label)
+        else:
+            # apply changes infrastructure, so it is never retried
+            result = get_runner().run(f"terraform apply -auto-approve {arguments}", cwd=terraform_dir,
+                                      timeout=APPLY_TIMEOUT, retries=0)
+            applied = {"returncode": result.returncode, "seconds": round(result.seconds, 1),
+                       "stdout": result.stdout, "stderr": result.stderr}
+    finally:
+        discard_plan(terraform_dir, plan_file)
+    if schedule is not None:
+        schedule["actual_seconds"] = applied["seconds"]
+    return {
+        "status": "success" if applied["returncode"] == 0 else "failed",
+        "plan": summary,
+        "schedule": schedule,
+        "apply": applied,
+    }
@@ -0,0 +1,207 @@
+"""
+Per-tier Terraform generation for the resources the template renderer left over.
+
+The unrendered resources are split into independent tiers (network, data,
+compute, app) that are generated concurrently, one async crew task per tier,
+each writing terraform/tiers/<tier>.tf. Every resource gets a fixed local name
+up front; a tier refers to a resource of another tier as
+`ref.<local_name>.<attribute>`. The merge step then combines the tier files
+in a fixed order into llm_resources.tf, llm_variables.tf and llm_outputs.tf
+and resolves those references to real Terraform addresses.
+"""
+import os
+import re
+import json
+import datetime
+
+from replica.hcl import split_blocks
+from replica.tasks import DirectTask
+
+# Tier -> ARM resource provider namespaces (lower-case); "app" takes everything else
+TIERS = {
+    "network": ("microsoft.network/",),
+    "data": (
+        "microsoft.sql/", "microsoft.storage/", "microsoft.documentdb/", "microsoft.keyvault/",
+        "microsoft.dbforpostgresql/", "microsoft.dbformysql/", "microsoft.cache/", "microsoft.servicebus/",
+        "microsoft.eventhub/",
+    ),
+    "compute": (
+        "microsoft.compute/", "microsoft.containerservice/", "microsoft.containerinstance/",
+        "microsoft.containerregistry/", "microsoft.batch/",
+    ),
+    "app": (),
+}
+TIER_DIR = "tiers"
+MERGED_FILES = ("llm_resources.tf", "llm_variables.tf", "llm_outputs.tf")
+REFERENCE_PATTERN = re.compile(r"\bref\.([A-Za-z_][A-Za-z0-9_]*)\b")
+
+
+def tier_of(resource_type: str) -> str:
+    resource_type = resource_type.lower()
+    for tier, namespaces in TIERS.items():
+        if resource_type.startswith(namespaces):
+            return tier
+    return "app"
+
+
+def local_name(name: str, taken: set) -> str:
+    base = re.sub(r"[^a-z0-9_]", "_", name.lower()).strip("_") or "resource"
+    if not base[0].isalpha():
+        base = f"r_{base}"
+    local, suffix = base, 2
+    while local in taken:
+        local, suffix = f"{base}_{suffix}", suffix + 1
+    taken.add(local)
+    return local
+
+
+def plan_tiers(report: dict) -> dict:
+    """
+    Assigns every unrendered resource of a render report to a tier and a local name
+    that does not collide with the rendered resources. Returns {tier: [items]}, each
+    tier in creation order, with the IDs each item depends on.
+    """
+    taken = {address.split(".")[-1] for address in report["references"].values()}
+    dependencies = report.get("dependencies") or {}
+    level = {resource_id: index for index, ids in enumerate(dependencies.get("levels", [])) for resource_id in ids}
+    plan = {tier: [] for tier in TIERS}
+    # Creation order: resources only come after the ones they refer to
+    for item in sorted(report["unrendered"], key=lambda item: level.get(item["id"], len(level))):
+        # Sub-resources (e.g. sql-app/appdb) are named after their parent too
+        planned = dict(item, local_name=local_name(item["name"].replace("/", "_"), taken))
+        if dependencies.get("depends_on", {}).get(item["id"]):
+            planned["depends_on"] = dependencies["depends_on"][item["id"]]
+        plan[tier_of(item["type"])].append(planned)
+    return plan
+
+
+def tier_brief(report: dict, tier: str) -> dict:
+    """
+    What one tier task needs: its resources and how to refer to everything else.
+    """
+    plan = report.get("tiers") or plan_tiers(report)
+    return {
+        "tier": tier,
+        "file": f"{TIER_DIR}/{tier}.tf",
+        "generate": plan.get(tier, []),
+        "rendered_references": report["references"],
+        "other_tiers": {
+            item["id"]: f"ref.{item['local_name']}"
+            for other, items in plan.items() if other != tier for item in items
+        },
+    }
+
+
+def merge_tiers(terraform_dir: str = "terraform", existing_variables: set = frozenset()) -> dict:
+    """
+    Merges terraform/tiers/<tier>.tf into llm_resources.tf, llm_variables.tf and llm_outputs.tf.
+    Blocks keep tier order, then file order; duplicates keep their first definition;
+    terraform/provider blocks are dropped (provider.tf is rendered); `ref.<local_name>`
+    references are replaced by the address of the resource with that local name.
+    Returns the merge report (with the tier of every merged resource), which is also
+    written to terraform/merge_report.json.
+    """
+    sections = {name: [] for name in MERGED_FILES}
+    seen = {}
+    addresses = {}
+    report = {"tiers": {}, "resources": {}, "dropped": [], "duplicates": [], "unresolved": [], "errors": []}
+
+    parsed = []
+    for tier in TIERS:
+        path = os.path.join(terraform_dir, TIER_DIR, f"{tier}.tf")
+        if not os.path.exists(path):
+            continue
+        with open(path) as f:
+            text = f.read()
+        try:
+            blocks = split_blocks(text)
+        except ValueError as e:
+            report["errors"].append(f"{tier}: {e}")
+            continue
+        report["tiers"][tier] = len(blocks)
+        parsed.append((tier, blocks))
+        for block in blocks:
+            if block.block_type == "resource" and len(block.labels) == 2:
+                addresses.setdefault(block.labels[1], block.address)
+
+    for tier, blocks in parsed:
+        for block in blocks:
+            if block.block_type in ("terraform", "provider"):
+                report["dropped"].append(f"{tier}: {block.address}")
+                continue
+            if block.block_type == "variable" and block.labels and block.labels[0] in existing_variables:
+                continue
+            if block.address in seen:
+                report["duplicates"].append(f"{block.address} ({tier}, first defined in {seen[block.address]})")
+                continue
+            seen[block.address] = tier
+            if block.block_type == "resource":
+                report["resources"][block.address] = tier
+
+            def resolve(match):
+                address = addresses.get(match.group(1))
+                if address is None:
+                    report["unresolved"].append(f"{tier}: ref.{match.group(1)}")
+                    return match.group(0)
+                return address
+
+            text = REFERENCE_PATTERN.sub(resolve, block.text)
+            target = {"variable": "llm_variables.tf", "output": "llm_outputs.tf"}.get(block.block_type, "llm_resources.tf")
+            sections[target].append((tier, text))
+
+    for filename, entries in sections.items():
+        path = os.path.join(terraform_dir, filename)
+        if not entries:
+            if os.path.exists(path):
+                os.remove(path)
+            continue
+        chunks, current = [], None
+        for tier, text in entries:
+            if tier != current:
+                chunks.append(f"# --- {tier} tier ---")
+                current = tier
+            chunks.append(text)
+        with open(path, "w") as f:
+            f.write("\n\n".join(chunks) + "\n")
+
+    report["files"] = [name for name in MERGED_FILES if sections[name]]
+    with open(os.path.join(terraform_dir, "merge_report.json"), "w") as f:
+        json.dump(report, f, indent=2)
+    return report
+
+
+class TierGenerationTask(DirectTask):
+    """
+    Generation task for one tier. It finishes without calling the LLM when the
+    render report leaves nothing to generate in its tier.
+    """
+    tier: str = ""
+    terraform_dir: str = "terraform"
+
+    def _execute_core(self, agent, context, tools):
+        from replica.renderer import load_render_report
+
+        report = load_render_report(self.terraform_dir)
+        if report is not None and not (report.get("tiers") or {}).get(self.tier):
+            self.start_time = datetime.datetime.now()
+            return self._finish(agent, f"Nothing to generate in the {self.tier} tier")
+        return super()._execute_core(agent, context, tools)
+
+
+class TierMergeTask(DirectTask):
+    """
+    Deterministic merge of the tier files; runs in Python, not through the agent.
+    """
+    terraform_dir: str = "terraform"
+
+    def _execute_core(self, agent, context, tools):
+        from replica.renderer import load_render_report, STANDARD_VARIABLES
+
+        self.start_time = datetime.datetime.now()
+        report = load_render_report(self.terraform_dir)
+        if report is None or report["complete"]:
+            raw = "All resources were rendered from templates; nothing to merge"
+        else:
+            merge = merge_tiers(self.terraform_dir, set(STANDARD_VARIABLES))
+            raw = json.dumps(merge, separators=(",", ":"))
+        return self._finish(agent, raw)
@@ -0,0 +1,118 @@
+"""
+Per-task and per-agent accounting of LLM usage.
+
+ReplicaLLM records every completion in a process-wide ledger keyed on the
+crew task and agent that asked for it: calls, completion-cache hits, time
+spent waiting for the model, and prompt and completion tokens counted offline
+with the model's tokenizer. The token counts providers report (including the
+prompt tokens they served from their own prompt cache) are read from the
+agents after the crew has finished; both end up in deployment_report.md.
+"""
+import json
+import threading
+
+
+def count_tokens(model: str, messages=None, text: str = None) -> int:
+    """
+    Counts tokens offline with litellm's tokenizer for the model; falls back to ~4 characters per token.
+    """
+    try:
+        import litellm
+        if text is not None:
+            return litellm.token_counter(model=model, text=text)
+        return litellm.token_counter(model=model, messages=messages)
+    except Exception:
+        source = text if text is not None else json.dumps(messages, default=str)
+        return len(source) // 4
+
+
+def _task_name(task) -> str:
+    if task is None:
+        return "(no task)"
+    return getattr(task, "name", None) or (task.description or "").strip().splitlines()[0][:60]
+
+
+def _agent_name(agent) -> str:
+    return agent.role.strip() if agent is not None else "(no agent)"
+
+
+class UsageLedger:
+    """
+    Thread-safe counters per (task, agent) pair.
+    """
+
+    def __init__(self):
+        self.entries = {}
+        self._lock = threading.Lock()
+
+    def record(self, task, agent, seconds: float = 0.0, prompt_tokens: int = 0, completion_tokens: int = 0,
+               cache_hit: bool = False):
+        key = (_task_name(task), _agent_name(agent))
+        with self._lock:
+            entry = self.entries.setdefault(key, {
+                "calls": 0, "cache_hits": 0, "seconds": 0.0, "prompt_tokens": 0, "completion_tokens": 0,
+            })
+            entry["calls"] += 1
+            entry["cache_hits"] += int(cache_hit)
+            entry["seconds"] += seconds
+            entry["prompt_tokens"] += prompt_tokens
+            entry["completion_tokens"] += completion_tokens
+
+    def by_task(self) -> list:
+        """
+        Returns [(task, agent, counters)] in first-seen order.
+        """
+        with self._lock:
+            return [(task, agent, dict(entry)) for (task, agent), entry in self.entries.items()]
+
+    def reset(self):
+        with self._lock:
+            self.entries.clear()
+
+
+_ledger = UsageLedger()
+
+
+def get_usage_ledger() -> UsageLedger:
+    return _ledger
+
+
+def reset_usage():
+    """
+    Clears the ledger, e.g. between the jobs a batch worker runs.
+    """
+    _ledger.reset()
+
+
+def provider_usage(agents) -> dict:
+    """
+    Returns {agent role: token counts reported by the provider} for the agents that made requests.
+    Agents with the same role (e.g. the per-tier generators) are summed.
+    """
+    usage = {}
+    for agent in agents:
+        process = getattr(agent, "_token_process", None)
+        if process is None:
+            continue
+        summary = process.get_summary()
+        if not summary.successful_requests:
+            continue
+        totals = usage.setdefault(_agent_name(agent), {
+            "requests": 0, "prompt_tokens": 0, "cached_prompt_tokens": 0, "completion_tokens": 0,
+        })
+        totals["requests"] += summary.successful_requests
+        totals["prompt_tokens"] += summary.prompt_tokens
+        totals["cached_prompt_tokens"] += summary.cached_prompt_tokens
+        totals["completion_tokens"] += summary.completion_tokens
+    return usage
+
+
+def task_durations(tasks) -> dict:
+    """
+    Returns {task name: wall-clock seconds} for the tasks that ran through the agent.
+    """
+    durations = {}
+    for task in tasks:
+        if getattr(task, "execution_duration", None) is not None:
+            durations[_task_name(task)] = task.execution_duration
+    return durations
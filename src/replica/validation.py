@@ -0,0 +1,531 @@
+"""
+Validation of the generated Terraform configuration.
+
+`validate_terraform` runs the deterministic checks behind the Terraform
+Validator tool and returns a structured report with per-category scores and an
+executability percentage. Most runs score well enough that nothing needs
+explaining, so the validation task renders that report to markdown from a
+template and only hands it to the validation agent for remediation advice when
+the score is below REPLICA_VALIDATION_THRESHOLD.
+"""
+import os
+import copy
+import json
+import shlex
+import hashlib
+import datetime
+import functools
+
+from replica.hcl import load_configuration
+from replica.rules import get_rule_engine
+from replica.runner import get_runner
+from replica.tasks import DirectTask
+from replica.terraform import ensure_initialized
+
+REQUIRED_FILES = ("provider.tf", "variables.tf", "main.tf", "outputs.tf", "terraform.tfvars", "README.md")
+# Category -> (title, maximum points), in report order
+SCORE_CATEGORIES = {
+    "syntax": ("Syntax Correctness", 25),
+    "deprecated": ("Modern Resources", 20),
+    "files": ("File Completeness", 15),
+    "version": ("Provider Version", 15),
+    "azure_compliance": ("Azure Compliance", 15),
+    "documentation": ("Documentation", 10),
+}
+
+
+def validation_threshold() -> float:
+    """
+    Score from which the report is rendered from the template; below it the agent explains the issues.
+    """
+    return float(os.getenv("REPLICA_VALIDATION_THRESHOLD", "90"))
+
+
+# Memoized results keyed on content digests: whole reports, per-file fmt results,
+# terraform validate results and parsed files
+_memo = {"reports": {}, "fmt": {}, "validate": {}, "parsed": {}}
+MEMO_LIMIT = 512
+
+
+def _trim(kind: str, limit: int = MEMO_LIMIT):
+    # Oldest entries go first
+    entries = _memo[kind]
+    while len(entries) > limit:
+        entries.pop(next(iter(entries)))
+
+
+def _remember(kind: str, key, value):
+    _trim(kind, MEMO_LIMIT - 1)
+    _memo[kind][key] = value
+
+
+def _digest(*parts) -> str:
+    digest = hashlib.sha256()
+    for part in parts:
+        digest.update(part if isinstance(part, bytes) else repr(part).encode())
+        digest.update(b"\0")
+    return digest.hexdigest()
+
+
+@functools.lru_cache(maxsize=None)
+def _terraform_version() -> str:
+    """
+    Version of the terraform binary on PATH, looked up once per process.
+    """
+    try:
+        result = get_runner().run("terraform version -json", timeout=30)
+        if result.returncode == 0:
+            return json.loads(result.stdout).get("terraform_version", "")
+    except Exception:
+        pass
+    return "unavailable"
+
+
+def _source_digests(terraform_dir: str) -> dict:
+    """
+    Returns {relative path: content digest} of every .tf and .tfvars file `terraform fmt -recursive` checks.
+    """
+    sources = {}
+    for root, dirs, names in os.walk(terraform_dir):
+        dirs[:] = sorted(name for name in dirs if not name.startswith("."))
+        for name in sorted(names):
+            if name.endswith((".tf", ".tfvars")):
+                path = os.path.join(root, name)
+                with open(path, "rb") as f:
+                    sources[os.path.relpath(path, terraform_dir).replace(os.sep, "/")] = _digest(f.read())
+    return sources
+
+
+def _check_formatting(terraform_dir: str, version: str, sources: dict, rerun: list) -> tuple:
+    """
+    Runs `terraform fmt -check` on the files whose fmt result is not memoized: the whole
+    directory when none is, else each changed file. Returns (unformatted files, error output).
+    """
+    stale = [path for path, digest in sources.items() if (version, path, digest) not in _memo["fmt"]]
+    if stale:
+        targets = [""] if len(stale) == len(sources) else stale
+        for target in targets:
+            command = f"terraform fmt -check -list=true {shlex.quote(target)}" if target else "terraform fmt -check -recursive"
+            result = get_runner().run(command, cwd=terraform_dir, timeout=30)
+            listed = {line.strip().replace(os.sep, "/") for line in result.stdout.splitlines() if line.strip()}
+            if result.returncode != 0 and not listed:
+                # fmt could not check (parse error, missing binary): nothing to memoize
+                return [], result.stderr or result.stdout
+            rerun.append(f"fmt {target or '-recursive'}")
+            for path in ([target] if target else stale):
+                _remember("fmt", (version, path, sources[path]), path not in listed)
+    unformatted = [path for path, digest in sources.items() if not _memo["fmt"][(version, path, digest)]]
+    return unformatted, ""
+
+
+def validate_terraform(terraform_dir: str = "terraform") -> dict:
+    """
+    Checks the configuration in `terraform_dir` for missing files, formatting and
+    `terraform validate` errors, deprecated resources, provider versions and basic
+    Azure conventions, and scores it out of 100.
+    """
+    validation_report = {
+        "file_checks": {},
+        "syntax_errors": [],
+        "deprecated_resources": [],
+        "config_issues": [],
+        "version_check": {},
+        "azure_validation": {},
+        "scores": {},
+        "executability_percentage": 0
+    }
+
+    # Check if terraform directory exists
+    if not os.path.exists(terraform_dir):
+        return {
+            "status": "error",
+            "message": f"Terraform directory '{terraform_dir}' does not exist"
+        }
+
+    # terraform validate needs the providers: fast init without backend, from the shared plugin cache
+    init_result = None
+    try:
+        init_result = ensure_initialized(terraform_dir)
+    except Exception as e:
+        validation_report["init"] = {"status": "error", "message": str(e)}
+    if init_result is not None:
+        validation_report["init"] = {
+            "status": "pass" if init_result.returncode == 0 else "fail",
+            "seconds": round(init_result.seconds, 2),
+            "errors": init_result.stderr[-2000:]
+        }
+
+    # 1. FILE EXISTENCE CHECK
+    for file in REQUIRED_FILES:
+        filepath = os.path.join(terraform_dir, file)
+        validation_report["file_checks"][file] = os.path.exists(filepath)
+
+
+    # The whole report is reused while the sources, the terraform binary, the lock file
+    # and the rules are unchanged
+    version = _terraform_version()
+    sources = _source_digests(terraform_dir)
+    lock_path = os.path.join(terraform_dir, ".terraform.lock.hcl")
+    lock = ""
+    if os.path.exists(lock_path):
+        with open(lock_path, "rb") as f:
+            lock = _digest(f.read())
+    initialized = os.path.isdir(os.path.join(terraform_dir, ".terraform"))
+    engine = get_rule_engine()
+    report_key = _digest(
+        version, lock, initialized, engine.fingerprint, *sorted(validation_report["file_checks"].items()),
+        *sorted(sources.items())
+    )
+    if report_key in _memo["reports"]:
+        report = copy.deepcopy(_memo["reports"][report_key])
+        if "init" in validation_report:
+            report["init"] = validation_report["init"]
+        report["memo"] = {"hit": True, "rerun": []}
+        return report
+    rerun = ["init -backend=false"] if init_result is not None else []
+
+    # 2. SYNTAX VALIDATION (terraform fmt check, per file, only for changed files)
+    try:
+        unformatted, fmt_error = _check_formatting(terraform_dir, version, sources, rerun)
+        if unformatted or fmt_error:
+            error = {
+                "type": "formatting",
+                "message": "Formatting issues detected",
+                "files": unformatted
+            }
+            if fmt_error.strip():
+                error["output"] = fmt_error.strip()
+            validation_report["syntax_errors"].append(error)
+    except Exception as e:
+        validation_report["syntax_errors"].append({
+            "type": "fmt_error",
+            "message": str(e)
+        })
+
+    # 3. TERRAFORM VALIDATE (requires init first; re-run only when .tf files, lock file or init state change)
+    validate_key = _digest(version, lock, initialized, *sorted(
+        (path, digest) for path, digest in sources.items() if path.endswith(".tf") and "/" not in path
+    ))
+    try:
+        if validate_key not in _memo["validate"]:
+            # Try to run validate (might fail if not initialized)
+            validate_result = get_runner().run(
+                "terraform validate",
+                cwd=terraform_dir,
+                timeout=30
+            )
+            rerun.append("validate")
+            _remember("validate", validate_key, {
+                "status": "pass" if validate_result.returncode == 0 else "fail",
+                "output": validate_result.stdout,
+                "errors": validate_result.stderr
+            })
+        validation_report["syntax_validation"] = dict(_memo["validate"][validate_key])
+    except Exception as e:
+        validation_report["syntax_validation"] = {
+            "status": "error",
+            "message": "Validation requires 'terraform init' first",
+            "note": str(e)
+        }
+
+    # Every .tf file is parsed once (and only again when it changes); the checks below query the index
+    parsed_before = set(_memo["parsed"])
+    configuration = load_configuration(terraform_dir, cache=_memo["parsed"])
+    rerun += [f"parse {name}" for name, _ in sorted(set(_memo["parsed"]) - parsed_before)]
+    # load_configuration adds to the parse cache directly, so it is bounded here
+    _trim("parsed")
+    for file, message in configuration.errors:
+        validation_report["syntax_errors"].append({
+            "type": "parse",
+            "message": f"{file}: {message}"
+        })
+
+    # 4. RULE PACKS (deprecated resources, configuration and security rules)
+    findings, rule_stats = engine.evaluate(configuration)
+    for finding in findings:
+        if finding["category"] != "deprecated":
+            validation_report["config_issues"].append(finding)
+            continue
+        validation_report["deprecated_resources"].append({
+            "file": finding["file"],
+            "line": finding["line"],
+            "deprecated_resource": finding["address"].split(".")[0],
+            "replacement": finding["replacement"],
+            "reason": finding["message"],
+            "documentation": finding["documentation"],
+            "code_snippet": finding["code_snippet"]
+        })
+    slowest = sorted(rule_stats, key=lambda rule_id: rule_stats[rule_id]["seconds"], reverse=True)[:5]
+    validation_report["rules"] = {
+        "packs": engine.packs,
+        "count": len(engine.rules),
+        "ms": round(sum(stats["seconds"] for stats in rule_stats.values()) * 1000, 3),
+        # Rules that fired, were shadowed or are the slowest; the rest matched nothing in negligible time
+        "per_rule": {
+            rule_id: {"hits": stats["hits"], "shadowed": stats["shadowed"], "ms": round(stats["seconds"] * 1000, 3)}
+            for rule_id, stats in rule_stats.items() if stats["hits"] or stats["shadowed"] or rule_id in slowest
+        },
+    }
+
+    # 5. CHECK PROVIDER VERSIONS
+    for block in configuration.blocks("terraform"):
+        for providers in block.nested("required_providers"):
+            azurerm = providers.attributes.get("azurerm")
+            if azurerm is None:
+                continue
+            # azurerm = { source = "...", version = "..." } or the legacy azurerm = "..."
+            version = azurerm.object().get("version")
+            version = version.literal if version is not None else azurerm.literal
+            if isinstance(version, str):
+                validation_report["version_check"]["azurerm_provider"] = {
+                    "found": version,
+                    "recommended": "~> 4.1",
+                    "status": "ok" if "4." in version or "~> 4" in version else "outdated"
+                }
+
+        required_version = block.attributes.get("required_version")
+        if required_version is not None and isinstance(required_version.literal, str):
+            validation_report["version_check"]["terraform_version"] = {
+                "found": required_version.literal,
+                "recommended": ">= 1.0",
+                "status": "ok"
+            }
+
+    # 6. AZURE-SPECIFIC CHECKS (names and locations at any depth of any resource)
+    validation_report["azure_validation"]["resource_names_found"] = len(configuration.attributes("name", "resource"))
+    validation_report["azure_validation"]["location_references"] = len(configuration.attributes("location", "resource"))
+
+    # 7. CALCULATE EXECUTABILITY SCORE
+    scores = {}
+
+    # Syntax score (25 points)
+    syntax_score = 25
+    if validation_report["syntax_errors"]:
+        syntax_score -= len(validation_report["syntax_errors"]) * 5
+    syntax_score = max(0, syntax_score)
+    scores["syntax"] = syntax_score
+
+    # Deprecated resources score (20 points)
+    deprecated_score = 20
+    if validation_report["deprecated_resources"]:
+        deprecated_score = max(0, 20 - len(validation_report["deprecated_resources"]) * 5)
+    scores["deprecated"] = deprecated_score
+
+    # File completeness score (15 points)
+    file_score = (sum(validation_report["file_checks"].values()) / len(REQUIRED_FILES)) * 15
+    scores["files"] = round(file_score, 2)
+
+    # Provider version score (15 points)
+    version_score = 15
+    if validation_report["version_check"]:
+        azurerm_check = validation_report["version_check"].get("azurerm_provider", {})
+        if azurerm_check.get("status") == "outdated":
+            version_score = 10
+    scores["version"] = version_score
+
+    # Azure compliance score (15 points) - basic check plus critical/high rule findings
+    azure_score = 15
+    if not validation_report["azure_validation"].get("resource_names_found"):
+        azure_score = 10
+    serious = [issue for issue in validation_report["config_issues"] if issue["severity"] in ("critical", "high")]
+    azure_score = max(0, azure_score - len(serious) * 5)
+    scores["azure_compliance"] = azure_score
+
+    # Documentation score (10 points)
+    doc_score = 10 if validation_report["file_checks"].get("README.md") else 5
+    scores["documentation"] = doc_score
+
+    # Calculate total
+    total_score = sum(scores.values())
+    validation_report["scores"] = scores
+    validation_report["executability_percentage"] = round(total_score, 2)
+
+    # Determine status
+    if total_score >= 90:
+        validation_report["status"] = "EXCELLENT - Ready for deployment"
+    elif total_score >= 70:
+        validation_report["status"] = "GOOD - Minor fixes recommended"
+    elif total_score >= 50:
+        validation_report["status"] = "FAIR - Moderate issues to address"
+    else:
+        validation_report["status"] = "POOR - Major rework required"
+
+    if not any(error["type"] == "fmt_error" for error in validation_report["syntax_errors"]):
+        memoized = copy.deepcopy(validation_report)
+        memoized.pop("init", None)
+        _remember("reports", report_key, memoized)
+    validation_report["memo"] = {"hit": False, "rerun": rerun}
+    return validation_report
+
+
+def _recommendation(score: float) -> str:
+    if score >= 90:
+        return "READY FOR DEPLOYMENT"
+    if score >= 70:
+        return "MINOR FIXES REQUIRED"
+    return "MAJOR REWORK NEEDED"
+
+
+def _next_steps(score: float) -> str:
+    if score >= 90:
+        return "✅ Code is ready for deployment. Proceed to terraform deployment task."
+    if score >= 70:
+        return "⚠️ Address high priority issues before deployment. Minor fixes recommended."
+    return "❌ Major issues detected. Rework required before deployment. Do NOT proceed."
+
+
+def _version_line(title: str, check: dict) -> str:
+    if not check:
+        return f"**{title}**: not pinned ⚠️"
+    mark = "✅" if check["status"] == "ok" else "❌"
+    return f"**{title}**: {check['found']} (recommended {check['recommended']}) {mark}"
+
+
+def render_validation_report(report: dict, threshold: float = None) -> str:
+    """
+    Renders a validate_terraform report as the markdown validation report.
+    """
+    score = report["executability_percentage"]
+    syntax = report.get("syntax_validation", {})
+    lines = [
+        "# TERRAFORM VALIDATION REPORT",
+        "",
+        "---",
+        "",
+        f"## EXECUTABILITY SCORE: {score}%",
+        "",
+        f"**Status**: {report['status']}",
+        "",
+        f"**Recommendation**: {_recommendation(score)}",
+        "",
+        "---",
+        "",
+        "## VALIDATION SUMMARY",
+        "",
+        f"- Total Files Checked: {len(report['file_checks'])}",
+        f"- Syntax Errors: {len(report['syntax_errors']) + (syntax.get('status') == 'fail')}",
+        f"- Deprecated Resources: {len(report['deprecated_resources'])}",
+        f"- Configuration Issues: {len(report['config_issues'])}",
+        "",
+        "---",
+        "",
+        "## FILE EXISTENCE CHECK",
+        "",
+    ]
+    for name, found in report["file_checks"].items():
+        lines.append(f"✅ {name} - Found" if found else f"❌ {name} - Missing")
+
+    lines += ["", "---", "", "## SYNTAX VALIDATION", ""]
+    formatting = [error for error in report["syntax_errors"] if error["type"] == "formatting"]
+    lines.append(f"**Formatting (terraform fmt)**: {'FAIL' if formatting else 'PASS'}")
+    for error in formatting:
+        lines += [f"- {name}" for name in error["files"] if name]
+    for error in report["syntax_errors"]:
+        if error["type"] != "formatting":
+            lines.append(f"- {error['type']}: {error['message']}")
+    init = report.get("init") or {}
+    if init.get("status") in ("fail", "error"):
+        lines.append("**terraform init -backend=false**: FAIL")
+        details = (init.get("errors") or init.get("message") or "").strip()
+        if details:
+            lines += ["", "```", details, "```"]
+    lines.append(f"**terraform validate**: {syntax.get('status', 'not run').upper()}")
+    if syntax.get("status") != "pass":
+        details = (syntax.get("errors") or syntax.get("output") or syntax.get("note") or "").strip()
+        if details:
+            lines += ["", "```", details, "```"]
+
+    lines += [
+        "", "---", "", "## PROVIDER VERSION CHECK", "",
+        _version_line("Terraform Version", report["version_check"].get("terraform_version")),
+        _version_line("Azure Provider Version", report["version_check"].get("azurerm_provider")),
+        "", "---", "", "## DEPRECATED RESOURCES DETECTED", "",
+    ]
+    if not report["deprecated_resources"]:
+        lines.append("None found ✅")
+    for index, item in enumerate(report["deprecated_resources"]):
+        lines += [""] if index else []
+        lines += [
+            f"### ⚠️ HIGH PRIORITY: {item['deprecated_resource']}",
+            "",
+            f"**File**: {item['file']}",
+            f"**Line**: {item['line']}",
+            f"**Current Code**: `{item['code_snippet']}`",
+            f"**Issue**: {item['reason']}",
+            f"**Replacement**: {item['replacement']}",
+            f"**Documentation**: {item['documentation']}",
+        ]
+
+    if report["config_issues"]:
+        lines += ["", "---", "", "## RESOURCE CONFIGURATION ISSUES", ""]
+        for issue in report["config_issues"]:
+            fix = f" Use {issue['replacement']}." if issue.get("replacement") else ""
+            where = f"{issue['file']}:{issue['line']}" + (f" {issue['address']}" if issue["address"] else "")
+            lines.append(
+                f"- **{issue['severity'].upper()}** {where}: {issue['message']}.{fix} "
+                f"(`{issue['code_snippet']}`, rule {issue['rule']})"
+            )
+
+    rules = report.get("rules")
+    if rules:
+        lines += [
+            "", "---", "", "## RULE PACKS", "",
+            f"{rules['count']} rules from {', '.join(rules['packs'])} evaluated in {rules['ms']} ms",
+        ]
+        lines += [
+            f"- {rule_id}: {stats['hits']} hits"
+            + (f" ({stats['shadowed']} shadowed by an earlier pattern rule)" if stats.get("shadowed") else "")
+            + f", {stats['ms']} ms"
+            for rule_id, stats in sorted(rules["per_rule"].items(), key=lambda item: -item[1]["ms"])
+        ]
+
+    azure = report["azure_validation"]
+    lines += [
+        "", "---", "", "## AZURE-SPECIFIC VALIDATION", "",
+        f"- Resource names found: {azure.get('resource_names_found', 0)}",
+        f"- Location references: {azure.get('location_references', 0)}",
+        "", "---", "", "## SCORING BREAKDOWN", "",
+    ]
+    for category, (title, maximum) in SCORE_CATEGORIES.items():
+        if category in report["scores"]:
+            lines.append(f"- {title}: {report['scores'][category]}/{maximum} points")
+    lines += [
+        "",
+        f"**TOTAL SCORE: {score}/100**",
+        "", "---", "", "## NEXT STEPS", "",
+        _next_steps(score),
+        "", "---", "",
+        f"**Validation Completed**: {datetime.datetime.now().isoformat(timespec='seconds')}",
+    ]
+    reviewed = f" (agent review only below {threshold:g}%)" if threshold is not None else ""
+    lines.append(f"**Validated By**: Terraform Validator, rendered from template{reviewed}")
+    lines.append("**Documentation Reference**: https://registry.terraform.io/providers/hashicorp/azurerm/latest/docs")
+    return "\n".join(lines) + "\n"
+
+
+class ValidationTask(DirectTask):
+    """
+    Validation task that writes the report from the validator's output without the
+    LLM, and runs the validation agent only when the score is below the threshold.
+    """
+    terraform_dir: str = "terraform"
+
+    def _execute_core(self, agent, context, tools):
+        self.start_time = datetime.datetime.now()
+        if not os.path.isdir(self.terraform_dir) or not any(
+                name.endswith(".tf") for name in os.listdir(self.terraform_dir)):
+            return self._finish(agent, "Validation skipped - no Terraform files found in terraform/ directory")
+
+        threshold = validation_threshold()
+        report = validate_terraform(self.terraform_dir)
+        score = report.get("executability_percentage")
+        if score is not None and score >= threshold:
+            return self._finish(agent, render_validation_report(report, threshold))
+
+        # Remediation advice is needed: give the agent the checks that already ran
+        findings = json.dumps(report, separators=(",", ":"))
+        context = (
+            f"{context or ''}\n\nTerraform Validator output (score {score}% is below the {threshold:g}% "
+            f"threshold; explain each issue and how to fix it):\n{findings}"
+        )
+        return super()._execute_core(agent, context, tools)
@@ -0,0 +1,58 @@
+import pytest
+
+from replica.arm_client import ArmClient, ArmError
+from replica.fake_azure import FakeAzureServer
+from replica.runner import get_runner
+
+VNET = "/subscriptions/sub/resourceGroups/rg-net/providers/Microsoft.Network/virtualNetworks/vnet-app"
+
+INVENTORY = {
+    "resources": [
+        {
+            "id": VNET, "name": "vnet-app", "type": "Microsoft.Network/virtualNetworks", "resourceGroup": "rg-net",
+            "properties": {
+                "subnets": [{"id": f"{VNET}/subnets/snet{index}", "name": f"snet{index}"} for index in range(3)]
+            },
+        },
+    ],
+}
+
+
+@pytest.fixture(autouse=True)
+def fast_retries(monkeypatch):
+    monkeypatch.setenv("REPLICA_ARM_TOKEN", "fake")
+    monkeypatch.setattr(get_runner(), "base_delay", 0.01)
+
+
+def test_reuses_pooled_connections_and_follows_next_link():
+    with FakeAzureServer(INVENTORY, page_size=1) as server:
+        client = ArmClient(endpoint=server.endpoint)
+        subnets = client.list(f"{VNET}/subnets", api_version="2023-01-01")
+        assert client.get(VNET, api_version="2023-01-01")["name"] == "vnet-app"
+        client.close()
+
+    assert [subnet["name"] for subnet in subnets] == ["snet0", "snet1", "snet2"]
+    assert client.connections_opened == 1
+
+
+def test_dropped_connections_are_retried_with_backoff():
+    # Both the pooled connection and the fresh one it is retried on are dropped
+    with FakeAzureServer(INVENTORY, drop_requests=2) as server:
+        client = ArmClient(endpoint=server.endpoint)
+        retries = get_runner().stats["retries"]
+        assert client.get(VNET, api_version="2023-01-01")["name"] == "vnet-app"
+        client.close()
+
+    assert len(server.requests) == 3
+    assert get_runner().stats["retries"] == retries + 1
+
+
+def test_client_errors_are_not_retried():
+    with FakeAzureServer(INVENTORY) as server:
+        client = ArmClient(endpoint=server.endpoint)
+        with pytest.raises(ArmError) as error:
+            client.get(f"{VNET}-missing", api_version="2023-01-01")
+        client.close()
+
+    assert error.value.status == 404
+    assert len(server.requests) == 1
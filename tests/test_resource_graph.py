@@ -0,0 +1,98 @@
+import pytest
+
+from replica.arm_client import ArmClient
+from replica.fake_azure import FakeAzureServer
+from replica.resource_graph import map_dependencies
+
+GROUP = "/subscriptions/sub/resourceGroups/rg-app"
+
+INVENTORY = {
+    "resources": [
+        {
+            "id": f"{GROUP}/providers/Microsoft.Storage/storageAccounts/stapp",
+            "name": "stapp", "type": "Microsoft.Storage/storageAccounts", "resourceGroup": "rg-app",
+            "kind": "StorageV2", "subscriptionId": "sub",
+            "properties": {"networkAcls": {"defaultAction": "Deny"}, "minimumTlsVersion": "TLS1_2"},
+        },
+        {
+            "id": f"{GROUP}/providers/Microsoft.Sql/servers/sql-app",
+            "name": "sql-app", "type": "Microsoft.Sql/servers", "resourceGroup": "rg-app",
+            "properties": {
+                "administratorLogin": "sqladmin",
+                "firewallRules": [
+                    {"id": f"{GROUP}/providers/Microsoft.Sql/servers/sql-app/firewallRules/rule{index}",
+                     "name": f"rule{index}",
+                     "properties": {"startIpAddress": f"10.0.0.{index}", "endIpAddress": f"10.0.0.{index}"}}
+                    for index in range(3)
+                ],
+            },
+        },
+        {
+            "id": f"{GROUP}/providers/Microsoft.Sql/servers/sql-app/databases/appdb",
+            "name": "sql-app/appdb", "type": "Microsoft.Sql/servers/databases", "resourceGroup": "rg-app",
+            "properties": {"maxSizeBytes": 1073741824},
+        },
+        {
+            "id": f"{GROUP}/providers/Microsoft.Web/sites/web-app",
+            "name": "web-app", "type": "Microsoft.Web/sites", "resourceGroup": "rg-app", "kind": "app,linux",
+            "properties": {"defaultHostName": "web-app.azurewebsites.net"},
+        },
+        {
+            "id": f"{GROUP}/providers/Microsoft.Web/sites/func-app",
+            "name": "func-app", "type": "Microsoft.Web/sites", "resourceGroup": "rg-app", "kind": "functionapp",
+            "properties": {"defaultHostName": "func-app.azurewebsites.net"},
+        },
+        {
+            "id": f"{GROUP}/providers/Microsoft.KeyVault/vaults/kv-app",
+            "name": "kv-app", "type": "Microsoft.KeyVault/vaults", "resourceGroup": "rg-app",
+            "properties": {"accessPolicies": [{"objectId": "abc"}], "sku": {"name": "standard"}},
+        },
+    ],
+    "actions": {
+        f"{GROUP}/providers/Microsoft.Web/sites/web-app/config/appsettings/list": {"properties": {"MODE": "web"}},
+        f"{GROUP}/providers/Microsoft.Web/sites/web-app/config/connectionstrings/list": {
+            "properties": {"db": {"value": "Server=sql-app", "type": "SQLAzure"}}
+        },
+        f"{GROUP}/providers/Microsoft.Web/sites/func-app/config/appsettings/list": {"properties": {"MODE": "func"}},
+    },
+}
+
+
+@pytest.fixture
+def client(monkeypatch):
+    monkeypatch.setenv("REPLICA_ARM_TOKEN", "fake")
+    monkeypatch.setenv("AZURE_SUBSCRIPTION_ID", "sub")
+    # One item per page, so both Resource Graph and ARM pagination are followed
+    with FakeAzureServer(INVENTORY, page_size=1) as server:
+        arm = ArmClient(endpoint=server.endpoint)
+        yield arm
+        arm.close()
+
+
+def test_graph_backend_matches_cli_shape(client):
+    dependencies = map_dependencies("rg-app", max_workers=2, client=client)
+
+    assert list(dependencies) == [
+        "storage_accounts", "sql_servers", "webapps", "app_service_plans", "cosmos_accounts", "keyvaults",
+        "virtual_machines", "function_apps",
+    ]
+    storage = dependencies["storage_accounts"][0]
+    assert "properties" not in storage and "subscriptionId" not in storage
+    assert storage["minimumTlsVersion"] == "TLS1_2"
+    assert storage["networkRuleSet"] == storage["network_rules"] == {"defaultAction": "Deny"}
+
+    server = dependencies["sql_servers"][0]
+    assert server["administratorLogin"] == "sqladmin"
+    assert [database["maxSizeBytes"] for database in server["databases"]] == [1073741824]
+    assert [rule["startIpAddress"] for rule in server["firewall_rules"]] == ["10.0.0.0", "10.0.0.1", "10.0.0.2"]
+
+    assert [site["name"] for site in dependencies["webapps"]] == ["web-app"]
+    assert dependencies["webapps"][0]["defaultHostName"] == "web-app.azurewebsites.net"
+    assert dependencies["webapps"][0]["connection_strings"][0]["type"] == "SQLAzure"
+    assert [site["name"] for site in dependencies["function_apps"]] == ["func-app"]
+    assert dependencies["function_apps"][0]["app_settings"] == [{"name": "MODE", "value": "func", "slotSetting": False}]
+
+    vault = dependencies["keyvaults"][0]
+    assert vault["properties"]["sku"] == {"name": "standard"}
+    assert vault["access_policies"] == [{"objectId": "abc"}]
+    assert not any("errors" in item for items in dependencies.values() for item in items)